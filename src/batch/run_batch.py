@@ -0,0 +1,151 @@
+"""
+Batch runner: OCR + field extraction + forgery scoring over many slip images.
+
+Usage:
+    python -m src.batch.run_batch <image_dir | manifest.txt | manifest.jsonl> -o results.jsonl [-j WORKERS] [--policy fallback|first|best_conf|merge] [--engines paddle,tesseract]
+
+- A directory is scanned recursively for images; a manifest lists one path per line
+  (plain text, or JSONL objects with a "path" key).
+- Work is spread over a process pool (one worker per core by default). Each worker loads
+  its own PaddleOCR engine once at start-up and reuses it for every image.
+- Results are appended to the output JSONL as they finish (in chunks), one object per image.
+  Re-running with the same output file skips images that already have a result.
+- Before a chunk is written, its slips are checked against (and bulk-inserted into) the
+  cross-document fraud index (src/forgery/fraud_index.py) in this process.
+- Each record carries "timings": per-stage milliseconds (prepare, ocr.*, extract.*, predict.*).
+- Near-duplicates of earlier submissions only re-OCR their changed tiles and carry the changed
+  regions as evidence (src/forgery/resubmission.py).
+- PDFs and multi-page TIFFs are scored page by page inside the worker (src/ingest/documents.py);
+  their "result" is the document verdict with per-page evidence under "pages".
+"""
+import os, sys, json, time, argparse
+from multiprocessing import Pool
+
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".pdf")
+
+def iter_inputs(src):
+    if os.path.isdir(src):
+        for root, dirs, files in os.walk(src):
+            dirs.sort()
+            for fn in sorted(files):
+                if fn.lower().endswith(IMAGE_EXTS):
+                    yield os.path.join(root, fn)
+        return
+    with open(src, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                line = json.loads(line).get("path") or ""
+            if line:
+                yield line
+
+def load_done(out_path):
+    """Paths that already have a successful result in an earlier run's output."""
+    done = set()
+    if not os.path.exists(out_path):
+        return done
+    with open(out_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue  # torn last line from an interrupted run
+            if rec.get("path") and "error" not in rec:
+                done.add(rec["path"])
+    return done
+
+_run_ocr = _predict = _prepare = _metrics = _analyze_document = _ocr_prepared = _apply_evidence = _image_hash = None
+_policy = "fallback"
+_engines = ("paddle", "tesseract")
+
+def _init_worker(policy, engines):
+    # one engine per worker process: keep each engine's own thread pool from oversubscribing the cores
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+    global _run_ocr, _predict, _prepare, _policy, _engines, _metrics, _analyze_document, _ocr_prepared, _apply_evidence
+    global _image_hash
+    from src.common import metrics as _metrics
+    from src.ingest.documents import analyze_document as _analyze_document
+    from src.ocr.ocr_infer import warm_up
+    from src.ocr.orchestrator import run_ocr
+    from src.ocr.preprocess import prepare
+    from src.forgery.forgery_detector import predict
+    from src.forgery.resubmission import ocr_prepared as _ocr_prepared, apply_evidence as _apply_evidence
+    from src.forgery.fraud_index import image_hash as _image_hash
+    _run_ocr, _predict, _prepare, _policy, _engines = run_ocr, predict, prepare, policy, engines
+    if "paddle" in engines:
+        warm_up()
+
+def process_one(path):
+    t0 = time.perf_counter()
+    try:
+        if path.lower().endswith((".pdf", ".tif", ".tiff")):
+            with _metrics.collect() as c:
+                res = _analyze_document(path, workers=0, policy=_policy, engines=_engines)
+            return {"path": path, "image_hash": _image_hash(path, _policy, _engines), "pages": res["page_count"], "result": res,
+                    "elapsed_ms": round((time.perf_counter()-t0)*1000, 1), "timings": c.timings()}
+        with _metrics.collect() as c:
+            # decode once, downscale oversized photos, report boxes in original pixels
+            with _metrics.timer("prepare"):
+                prepared = _prepare(path)
+            ocr, engine, match = _ocr_prepared(prepared, lambda img: _run_ocr(img, engines=_engines, policy=_policy))
+            res = _apply_evidence(_predict(ocr), match)
+        return {"path": path, "image_hash": _image_hash(path, _policy, _engines), "engine": engine, "tokens": len(ocr), "result": res,
+                "elapsed_ms": round((time.perf_counter()-t0)*1000, 1), "timings": c.timings()}
+    except Exception as e:
+        return {"path": path, "error": repr(e), "elapsed_ms": round((time.perf_counter()-t0)*1000, 1)}
+
+def _write_chunk(out, recs, index):
+    # cross-document checks run here, in one process, one transaction per chunk
+    if index is not None:
+        ok = [r for r in recs if "result" in r]
+        index.correlate([r["result"] for r in ok], [r.get("image_hash") for r in ok])
+    for rec in recs:
+        out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    out.flush()
+
+def run(src, out_path, workers=None, policy="fallback", engines=("paddle", "tesseract"), log_every=2.0, chunk=64):
+    from src.forgery.fraud_index import get_default_index
+    done = load_done(out_path)
+    todo = [p for p in iter_inputs(src) if p not in done]
+    workers = workers or os.cpu_count() or 1
+    print(f"{len(todo)} images to process ({len(done)} already done), {workers} workers", file=sys.stderr)
+    if not todo:
+        return 0
+    n = errors = 0
+    index = get_default_index()
+    buf = []
+    t0 = last = time.perf_counter()
+    with open(out_path, "a", encoding="utf-8") as out, Pool(workers, initializer=_init_worker, initargs=(policy, tuple(engines))) as pool:
+        for rec in pool.imap_unordered(process_one, todo):
+            buf.append(rec)
+            n += 1
+            errors += "error" in rec
+            now = time.perf_counter()
+            # results are written a chunk at a time (and at every progress line) so a crash loses little
+            if len(buf) >= chunk or now - last >= log_every or n == len(todo):
+                _write_chunk(out, buf, index)
+                buf = []
+            if now - last >= log_every or n == len(todo):
+                last = now
+                rate = n / max(now - t0, 1e-9)
+                eta = (len(todo) - n) / rate if rate else 0
+                print(f"[{n}/{len(todo)}] {rate:.2f} img/s, {errors} errors, eta {eta:.0f}s", file=sys.stderr)
+    return errors
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Run OCR + forgery detection over a directory or manifest of images.")
+    ap.add_argument("src", help="image directory, or manifest file (one path per line / JSONL with 'path')")
+    ap.add_argument("-o", "--out", default="results.jsonl", help="output JSONL (appended; existing results are skipped)")
+    ap.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    ap.add_argument("--policy", default="fallback", choices=("first", "best_conf", "merge", "fallback"),
+                    help="OCR engine policy (see src/ocr/orchestrator.py); default runs Tesseract only when Paddle finds nothing")
+    ap.add_argument("--engines", default="paddle,tesseract",
+                    help="comma-separated OCR engines in fallback order: paddle, tesseract, tesseract_roi")
+    args = ap.parse_args(argv)
+    errors = run(args.src, args.out, args.workers, args.policy, args.engines.split(","))
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
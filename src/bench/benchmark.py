@@ -0,0 +1,143 @@
+"""
+Pipeline benchmark over synthetic slips (or a JSONL of pre-baked OCR).
+
+Usage:
+    python -m src.bench.benchmark -n 500 --seed 0 --engines none -o bench.json
+    python -m src.bench.benchmark --ocr-jsonl bench_data/ocr.jsonl --engines tesseract,paddle
+
+Stages timed per document: decode (PNG bytes -> array), ocr:<engine> for every requested
+engine, extract (extract_fields_from_ocr), predict and draw_boxes (in-memory PNG).
+`--engines none` (the default) needs no OCR engine: the detector runs on the pre-baked
+word boxes, so the benchmark works fully offline.
+
+The JSON report has, per stage, count / total seconds / throughput (docs per second) and
+p50 / p95 / p99 latency in milliseconds, plus peak RSS, detector accuracy against the
+injected forgeries and the run parameters, so two runs can be diffed.
+"""
+import os, sys, json, time, platform, argparse
+import numpy as np
+
+def peak_rss_mb():
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return round(rss / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+    except Exception:
+        return None
+
+class StageTimer:
+    def __init__(self):
+        self.samples = {}
+
+    def time(self, stage, fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        out = fn(*args, **kwargs)
+        self.samples.setdefault(stage, []).append(time.perf_counter() - t0)
+        return out
+
+    def report(self):
+        out = {}
+        for stage, xs in self.samples.items():
+            a = np.asarray(xs) * 1000.0
+            total = float(a.sum()) / 1000.0
+            out[stage] = {
+                "count": len(xs),
+                "total_s": round(total, 4),
+                "throughput_per_s": round(len(xs) / total, 2) if total > 0 else None,
+                "p50_ms": round(float(np.percentile(a, 50)), 3),
+                "p95_ms": round(float(np.percentile(a, 95)), 3),
+                "p99_ms": round(float(np.percentile(a, 99)), 3),
+            }
+        return out
+
+def _load_jsonl(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            rec = json.loads(line)
+            png = None
+            if rec.get("image") and os.path.exists(rec["image"]):
+                with open(rec["image"], "rb") as img_f:
+                    png = img_f.read()
+            yield {"id": rec.get("id"), "ocr": rec.get("ocr") or [], "png": png,
+                   "forged": rec.get("forged"), "forgery": rec.get("forgery")}
+
+def run(samples, engines=(), draw=True):
+    from src.ocr.preprocess import decode_image
+    from src.forgery.forgery_detector import extract_fields_from_ocr, predict
+    from src.ocr.ocr_infer import draw_boxes
+    runners = {}
+    if "paddle" in engines:
+        from src.ocr.ocr_infer import ocr_image, warm_up
+        warm_up()
+        runners["paddle"] = lambda img: ocr_image(img, cache=False)
+    if "tesseract" in engines:
+        from src.ocr.tesseract_ocr import tesseract_ocr
+        runners["tesseract"] = lambda img: tesseract_ocr(img, cache=False)
+    if "tesseract_roi" in engines:
+        from src.ocr.roi_ocr import roi_ocr
+        runners["tesseract_roi"] = roi_ocr
+
+    timer = StageTimer()
+    confusion = {"tp": 0, "fp": 0, "tn": 0, "fn": 0}
+    n = 0
+    t0 = time.perf_counter()
+    for s in samples:
+        n += 1
+        img = timer.time("decode", decode_image, s["png"]) if s.get("png") else s.get("image")
+        ocr = s["ocr"]
+        for name, fn in runners.items():
+            if img is None:
+                continue
+            got = timer.time("ocr:" + name, fn, img)
+            if got:
+                ocr = got  # score on real OCR output when an engine is benchmarked
+        timer.time("extract", extract_fields_from_ocr, ocr)
+        res = timer.time("predict", predict, ocr)
+        if draw and img is not None:
+            timer.time("draw_boxes", draw_boxes, img, ocr, out_path=None)
+        if s.get("forged") is not None:
+            flagged = res["label"] == "FORGED"
+            key = ("tp" if flagged else "fn") if s["forged"] else ("fp" if flagged else "tn")
+            confusion[key] += 1
+    wall = time.perf_counter() - t0
+    return {
+        "documents": n,
+        "wall_s": round(wall, 3),
+        "docs_per_s": round(n / wall, 2) if wall > 0 else None,
+        "stages": timer.report(),
+        "peak_rss_mb": peak_rss_mb(),
+        "detector": confusion,
+    }
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark OCR + detection stages on synthetic slips.")
+    ap.add_argument("-n", type=int, default=200, help="synthetic slips to generate (ignored with --ocr-jsonl)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--ocr-jsonl", default=None, help="benchmark pre-baked OCR records instead of generating slips")
+    ap.add_argument("--engines", default="none", help="comma-separated: none, paddle, tesseract, tesseract_roi")
+    ap.add_argument("--no-draw", action="store_true", help="skip the draw_boxes stage")
+    ap.add_argument("-o", "--out", default=None, help="write the JSON report here (default: stdout)")
+    args = ap.parse_args(argv)
+    engines = [e for e in args.engines.split(",") if e and e != "none"]
+
+    if args.ocr_jsonl:
+        samples = _load_jsonl(args.ocr_jsonl)
+    else:
+        from src.bench.synth_slips import generate
+        # generate up front so slip rendering isn't counted in any stage
+        samples = list(generate(args.n, args.seed))
+    report = run(samples, engines, draw=not args.no_draw)
+    report["params"] = {"n": args.n, "seed": args.seed, "ocr_jsonl": args.ocr_jsonl, "engines": engines,
+                        "draw": not args.no_draw, "python": platform.python_version(),
+                        "cpu_count": os.cpu_count(), "platform": platform.platform()}
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Cold-start benchmark: how long the entry points take to import, each in a fresh interpreter.
+
+Usage:
+    python -m src.bench.startup                      # JSON report on stdout
+    python -m src.bench.startup --repeat 5 -o startup.json
+    python -m src.bench.startup --check              # exit 1 when a target breaks its budget
+
+Every target is imported `--repeat` times in a new `python -X importtime` process, and the
+fastest run is kept. The report has, per target, the process wall time (interpreter start
+included) and the import time summed from -X importtime. It also lists the slowest modules
+(self time) and the heavy dependencies the import pulled in (numpy, joblib, sklearn, cv2,
+paddleocr, ...). Those should all load on first use (src/common/lazy.py), never at start-up.
+
+--check fails if a target's wall time exceeds --budget-ms or it imports any --forbid module.
+Baselines (a bare interpreter, streamlit itself) are reported but never checked.
+"""
+import os, sys, json, time, platform, argparse, subprocess
+
+TARGETS = {
+    "detector": "import src.forgery.forgery_detector",
+    # the pipeline modules src/webapp/app.py imports before drawing the page
+    "webapp": "import src.ocr.ocr_infer, src.ocr.tesseract_ocr, src.ocr.annotate, src.ocr.ocr_cache, "
+              "src.ocr.preprocess, src.ocr.orchestrator, src.forgery.forgery_detector, "
+              "src.forgery.model_registry, src.forgery.resubmission, src.forgery.fraud_index, "
+              "src.ingest.documents",
+    "service": "import src.service.server",
+    "batch": "import src.batch.run_batch",
+    "jsonl_stream": "import src.ingest.jsonl_stream",
+}
+BASELINES = {"python": "pass", "streamlit": "import streamlit"}
+HEAVY = ("numpy", "joblib", "sklearn", "scipy", "cv2", "PIL", "pytesseract", "paddleocr", "paddle",
+         "pymupdf", "fitz", "streamlit")
+FORBID = ("numpy", "joblib", "sklearn", "scipy", "cv2", "paddleocr", "paddle")
+
+def parse_importtime(stderr):
+    """[(self_us, cumulative_us, depth, module)] from `python -X importtime` output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # the header line
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(parts[0]), int(parts[1]), depth, name.strip()))
+    return rows
+
+def measure(stmt, cwd=None):
+    env = dict(os.environ)
+    env.pop("PYTHONIMPORTTIME", None)
+    t0 = time.perf_counter()
+    p = subprocess.run([sys.executable, "-X", "importtime", "-c", stmt], cwd=cwd or os.getcwd(),
+                       env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - t0
+    if p.returncode != 0:
+        return {"error": p.stderr.strip().splitlines()[-1] if p.stderr.strip() else f"exit {p.returncode}"}
+    rows = parse_importtime(p.stderr)
+    loaded = {name.split(".")[0] for _, _, _, name in rows}
+    return {
+        "wall_ms": round(wall * 1000, 1),
+        "import_ms": round(sum(cum for _, cum, depth, _ in rows if depth == 0) / 1000, 1),
+        "modules": len(rows),
+        "heavy": sorted(loaded.intersection(HEAVY)),
+        "slowest": [[name, round(us / 1000, 1)] for us, _, _, name in sorted(rows, reverse=True)[:8]],
+    }
+
+def run(targets, repeat=3, cwd=None):
+    out = {}
+    for name, stmt in targets.items():
+        runs = [measure(stmt, cwd) for _ in range(max(1, repeat))]
+        ok = [r for r in runs if "error" not in r]
+        out[name] = min(ok, key=lambda r: r["wall_ms"]) if ok else runs[0]
+    return out
+
+def check(report, budget_ms, forbid):
+    """Failure messages for the checked targets (empty when all pass)."""
+    failures = []
+    for name, r in report.items():
+        if "error" in r:
+            failures.append(f"{name}: import failed: {r['error']}")
+            continue
+        if r["wall_ms"] > budget_ms:
+            failures.append(f"{name}: {r['wall_ms']} ms > budget {budget_ms} ms")
+        bad = sorted(set(r["heavy"]).intersection(forbid))
+        if bad:
+            failures.append(f"{name}: imports {bad} at start-up")
+    return failures
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Measure cold-start import time of the entry points.")
+    ap.add_argument("--repeat", type=int, default=3, help="fresh interpreters per target (best run kept)")
+    ap.add_argument("--targets", default=",".join(TARGETS), help="comma-separated: " + ", ".join(TARGETS))
+    ap.add_argument("--no-baselines", action="store_true", help="skip the bare-python / streamlit rows")
+    ap.add_argument("--check", action="store_true", help="exit 1 if a target is over budget or imports --forbid")
+    ap.add_argument("--budget-ms", type=float, default=500.0, help="wall-time budget per target")
+    ap.add_argument("--forbid", default=",".join(FORBID), help="modules that must not load at start-up")
+    ap.add_argument("-o", "--out", default=None, help="write the JSON report here (default: stdout)")
+    args = ap.parse_args(argv)
+    targets = {k: TARGETS[k] for k in args.targets.split(",") if k in TARGETS}
+
+    report = {"targets": run(targets, args.repeat)}
+    if not args.no_baselines:
+        report["baselines"] = run(BASELINES, args.repeat)
+    report["params"] = {"repeat": args.repeat, "budget_ms": args.budget_ms, "python": platform.python_version(),
+                        "cpu_count": os.cpu_count(), "platform": platform.platform()}
+    failures = check(report["targets"], args.budget_ms, [m for m in args.forbid.split(",") if m])
+    report["failures"] = failures
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+    if args.check and failures:
+        print("\n".join(failures), file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""
+Synthetic payment-slip generator for benchmarks.
+
+Provides:
+- generate(n, seed=0, ...) -> iterator of samples {"id", "image" (RGB array), "png" (bytes),
+  "ocr" (word boxes in the usual {"box","text","conf"} format), "forged", "forgery", "layout"}
+
+Usage (writes PNGs plus a JSONL of pre-baked OCR next to them):
+    python -m src.bench.synth_slips -n 1000 -o bench_data/ [--seed 0]
+
+Slips vary in layout (label column vs inline "Label: value"), font size, row spacing,
+rotation and noise. About a third carry an injected forgery: a second Amount line with a
+different value ("amount_shift", like data/demo/forged_amount_shift) or a conflicting value
+printed next to the real amount ("amount_overwrite"). The OCR boxes are the exact word
+boxes that were drawn (rotated with the page), so the detector can be benchmarked without
+any OCR engine installed.
+"""
+import os, io, sys, json, math, random, argparse
+from functools import lru_cache
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+W, H = 1200, 1600
+NAMES = ["SRIKRISHNA", "A KUMAR", "PRIYA NAIR", "RAHUL SHARMA", "MEERA IYER", "JOHN MATHEW", "FATIMA KHAN"]
+LAYOUTS = ("columns", "inline")
+FORGERIES = ("amount_shift", "amount_overwrite")
+
+@lru_cache(maxsize=None)
+def get_font(size):
+    for name in ("DejaVuSans.ttf", "arial.ttf"):
+        try:
+            return ImageFont.truetype(name, size)
+        except Exception:
+            pass
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        return ImageFont.load_default()
+
+def _fmt_amount(v, rnd):
+    if rnd.random() < 0.5:
+        return f"{v:,}"
+    # Indian grouping: 2,00,000
+    s = str(v)
+    if len(s) <= 3:
+        return s
+    head, tail = s[:-3], s[-3:]
+    groups = []
+    while len(head) > 2:
+        groups.insert(0, head[-2:]); head = head[:-2]
+    if head:
+        groups.insert(0, head)
+    return ",".join(groups) + "," + tail
+
+def _draw_words(draw, x, y, text, font, out, conf):
+    """Draw text word by word, recording one box per word. Returns x after the last word."""
+    space = draw.textlength(" ", font=font)
+    for word in text.split():
+        l, t, r, b = draw.textbbox((x, y), word, font=font)
+        draw.text((x, y), word, font=font, fill="black")
+        out.append({"box": [[l, t], [r, t], [r, b], [l, b]], "text": word, "conf": conf})
+        x = r + space
+    return x
+
+def _rotate_boxes(ocr, angle, cx, cy):
+    a = math.radians(angle)
+    ca, sa = math.cos(a), math.sin(a)
+    for it in ocr:
+        # PIL rotates counter-clockwise on screen; with y pointing down that is this map
+        it["box"] = [[int(round(cx + (x - cx) * ca + (y - cy) * sa)), int(round(cy - (x - cx) * sa + (y - cy) * ca))]
+                     for x, y in it["box"]]
+
+def make_slip(rnd, idx, forged=None, rotate=True, noise=True):
+    layout = rnd.choice(LAYOUTS)
+    size = rnd.randint(26, 48)
+    font_h, font_v = get_font(size), get_font(size + rnd.randint(0, 8))
+    left = rnd.randint(80, 200)
+    value_x = left + rnd.randint(200, 320)
+    step = rnd.randint(int(size * 2.2), int(size * 4))
+    y = rnd.randint(180, 280)
+    name = rnd.choice(NAMES)
+    account = str(rnd.randint(10**9, 10**12 - 1))
+    amount = rnd.choice([rnd.randint(100, 99999), rnd.randint(1, 99) * 1000])
+    date = f"20{rnd.randint(20, 26)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}"
+    img = Image.new("RGB", (W, H), "white")
+    d = ImageDraw.Draw(img)
+    ocr = []
+    _draw_words(d, left, 80, "Bank Payment Slip", get_font(size + 16), ocr, 95.0)
+    fields = [("Name:", name), ("Account:", account), ("Amount:", "Rs " + _fmt_amount(amount, rnd)),
+              ("Date:", date), ("Signature:", "")]
+    amount_row = None
+    for label, val in fields:
+        conf = float(rnd.randint(80, 97))
+        if layout == "columns":
+            _draw_words(d, left, y, label, font_h, ocr, conf)
+            end = _draw_words(d, value_x, y, val, font_v, ocr, conf) if val else value_x
+        else:
+            end = _draw_words(d, left, y, f"{label} {val}".strip(), font_h, ocr, conf)
+        if label == "Amount:":
+            amount_row = (y, end)
+        y += step
+    if forged is None:
+        forged = rnd.random() < 0.33
+    forgery = rnd.choice(FORGERIES) if forged else None
+    if forgery:
+        fake = amount * rnd.choice([10, 2, 5]) + rnd.choice([0, 500])
+        if forgery == "amount_shift":
+            fx, fy = rnd.randint(500, 760), min(H - 120, y + rnd.randint(60, 300))
+            end = _draw_words(d, fx, fy, "Amount:", font_h, ocr, 92.0)
+            _draw_words(d, end + 20, fy, "Rs " + _fmt_amount(fake, rnd), font_v, ocr, 90.0)
+        else:
+            ay, end = amount_row
+            _draw_words(d, end + 30, ay, _fmt_amount(fake, rnd), font_v, ocr, 88.0)
+    arr = np.asarray(img)
+    if rotate and rnd.random() < 0.5:
+        angle = rnd.uniform(-3, 3)
+        img = img.rotate(angle, resample=Image.BILINEAR, fillcolor="white")
+        _rotate_boxes(ocr, angle, W / 2.0, H / 2.0)
+        arr = np.asarray(img)
+    if noise and rnd.random() < 0.6:
+        nrng = np.random.default_rng(rnd.randint(0, 2**31))
+        arr = np.clip(arr.astype(np.int16) + nrng.normal(0, rnd.uniform(3, 18), arr.shape), 0, 255).astype(np.uint8)
+    return {"id": f"slip_{idx:06d}", "image": arr, "ocr": ocr, "forged": bool(forgery),
+            "forgery": forgery, "layout": layout}
+
+def encode_png(arr):
+    buf = io.BytesIO()
+    Image.fromarray(arr).save(buf, format="PNG", compress_level=1)
+    return buf.getvalue()
+
+def generate(n, seed=0, forged_ratio=None, rotate=True, noise=True, png=True):
+    rnd = random.Random(seed)
+    for i in range(n):
+        forged = None if forged_ratio is None else rnd.random() < forged_ratio
+        s = make_slip(rnd, i, forged=forged, rotate=rotate, noise=noise)
+        s["png"] = encode_png(s["image"]) if png else None
+        yield s
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Generate synthetic payment slips with pre-baked OCR.")
+    ap.add_argument("-n", type=int, default=100)
+    ap.add_argument("-o", "--out", default="bench_data")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+    os.makedirs(args.out, exist_ok=True)
+    with open(os.path.join(args.out, "ocr.jsonl"), "w", encoding="utf-8") as f:
+        for s in generate(args.n, args.seed):
+            path = os.path.join(args.out, s["id"] + ".png")
+            with open(path, "wb") as img_f:
+                img_f.write(s["png"])
+            rec = {k: s[k] for k in ("id", "ocr", "forged", "forgery", "layout")}
+            rec["image"] = path
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    print(f"wrote {args.n} slips to {args.out}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
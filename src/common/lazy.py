@@ -0,0 +1,73 @@
+"""
+Deferred imports for the heavy dependencies (numpy, joblib / scikit-learn, OpenCV, paddleocr).
+
+Provides:
+- lazy_import(name) -> stand-in module; the real import happens on first attribute access
+- optional(name) -> the imported module, or None if it cannot be imported (tried once)
+- available(*names) -> True if every module is installed, checked without importing it
+- loaded(name) -> True once `name` has actually been imported in this process
+
+`np = lazy_import("numpy")` at the top of a module costs nothing when the module is imported.
+The first `np.<attr>` imports numpy. Every attribute is then cached on the stand-in, so later
+lookups are plain attribute reads. Import errors surface at that first use, where the
+callers' existing try/except blocks already handle missing optional engines. Importing
+src.forgery.forgery_detector or src.ocr.orchestrator therefore loads no numpy, joblib,
+sklearn or paddleocr until a page is actually scored (see src/bench/startup.py).
+"""
+import sys, types, importlib, importlib.util, threading
+
+_lock = threading.Lock()
+_optional = {}
+
+class LazyModule(types.ModuleType):
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__["_lazy_target"] = None
+
+    def _load(self):
+        mod = self.__dict__["_lazy_target"]
+        if mod is None:
+            mod = importlib.import_module(self.__name__)
+            self.__dict__["_lazy_target"] = mod
+        return mod
+
+    def __getattr__(self, attr):
+        value = getattr(self._load(), attr)
+        self.__dict__[attr] = value
+        return value
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_lazy_target"] is not None else "not loaded"
+        return f"<lazy module {self.__name__!r} ({state})>"
+
+def lazy_import(name):
+    mod = sys.modules.get(name)
+    return mod if mod is not None else LazyModule(name)
+
+def optional(name):
+    if name not in _optional:
+        with _lock:
+            if name not in _optional:
+                try:
+                    _optional[name] = importlib.import_module(name)
+                except Exception as e:
+                    print(f"{name} not available:", repr(e))
+                    _optional[name] = None
+    return _optional[name]
+
+def available(*names):
+    for name in names:
+        if name in sys.modules:
+            continue
+        try:
+            if importlib.util.find_spec(name) is None:
+                return False
+        except (ImportError, ValueError):
+            return False
+    return True
+
+def loaded(name):
+    return name in sys.modules
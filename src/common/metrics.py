@@ -0,0 +1,198 @@
+"""
+Lightweight stage timers and counters for the OCR / detection pipeline.
+
+Provides:
+- timer(stage) -> context manager recording the wall time of the block under `stage`
+- incr(name, n=1, **labels) -> bump a counter (e.g. incr("ocr_fallback", engine="tesseract"))
+- collect() -> context manager yielding a Collector with this thread's observations only
+  (Collector.timings() -> {stage: total ms}); used for per-request timings
+- propagate(fn) -> fn wrapped so a worker thread reports into the caller's collect() blocks
+- record(collector) -> fold a Collector from another process into this process's registry
+- snapshot() -> JSON-friendly dict, prometheus_text() -> Prometheus text exposition format
+- reset()
+
+Stage names are dotted ("ocr.paddle", "extract.amount", "predict.model"). Everything is kept
+in process memory; worker processes send their Collector back with the result and the parent
+calls record() (see src/service/server.py).
+
+LEGALDOC_METRICS=off disables the process-wide registry: timer() returns a shared no-op
+context manager and incr() returns immediately, unless a collect() block is active on the
+calling thread.
+"""
+import os, time, threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+ENABLED = os.environ.get("LEGALDOC_METRICS", "on").strip().lower() not in ("0", "off", "false", "no")
+PREFIX = "legaldoc_"
+# histogram upper bounds (seconds) for stage latencies
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_stages = {}    # stage -> [count, sum_s, max_s, per-bucket counts (last slot is +Inf)]
+_counters = {}  # (name, ((label, value), ...)) -> int
+_local = threading.local()
+
+class Collector:
+    """Observations made on one thread inside a collect() block."""
+    __slots__ = ("observations", "counts")
+
+    def __init__(self):
+        self.observations = []
+        self.counts = {}
+
+    def timings(self):
+        out = {}
+        for stage, seconds in self.observations:
+            out[stage] = out.get(stage, 0.0) + seconds * 1000.0
+        return {k: round(v, 3) for k, v in out.items()}
+
+def _sinks():
+    return getattr(_local, "sinks", None)
+
+def observe(stage, seconds):
+    sinks = _sinks()
+    if sinks:
+        for c in sinks:
+            c.observations.append((stage, seconds))
+    if not ENABLED:
+        return
+    with _lock:
+        st = _stages.get(stage)
+        if st is None:
+            st = _stages[stage] = [0, 0.0, 0.0, [0] * (len(BUCKETS) + 1)]
+        st[0] += 1
+        st[1] += seconds
+        if seconds > st[2]:
+            st[2] = seconds
+        st[3][bisect_left(BUCKETS, seconds)] += 1
+
+def _count(key, n):
+    sinks = _sinks()
+    if sinks:
+        for c in sinks:
+            c.counts[key] = c.counts.get(key, 0) + n
+    if ENABLED:
+        with _lock:
+            _counters[key] = _counters.get(key, 0) + n
+
+def incr(name, n=1, **labels):
+    if ENABLED or _sinks():
+        _count((name, tuple(sorted((k, str(v)) for k, v in labels.items()))), n)
+
+class _Timer:
+    __slots__ = ("stage", "t0")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.stage, time.perf_counter() - self.t0)
+        return False
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL = _NullTimer()
+
+def timer(stage):
+    if ENABLED or _sinks():
+        return _Timer(stage)
+    return _NULL
+
+@contextmanager
+def collect():
+    c = Collector()
+    sinks = _sinks()
+    if sinks is None:
+        sinks = _local.sinks = []
+    sinks.append(c)
+    try:
+        yield c
+    finally:
+        sinks.remove(c)
+
+def propagate(fn):
+    """Wrap fn (for an executor) so its observations also reach the submitting thread's collectors."""
+    sinks = _sinks()
+    if not sinks:
+        return fn
+    sinks = list(sinks)
+    def run(*args, **kwargs):
+        prev = _sinks()
+        _local.sinks = sinks
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.sinks = prev
+    return run
+
+def record(collector):
+    """Add a Collector gathered elsewhere (e.g. in a worker process) to this registry."""
+    if not ENABLED or collector is None:
+        return
+    for stage, seconds in collector.observations:
+        observe(stage, seconds)
+    for key, n in collector.counts.items():
+        _count(key, n)
+
+def reset():
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+
+def _label_str(labels):
+    return ",".join(f"{k}={v}" for k, v in labels)
+
+def snapshot():
+    with _lock:
+        stages = {s: (st[0], st[1], st[2]) for s, st in _stages.items()}
+        counters = dict(_counters)
+    out = {"enabled": ENABLED, "stages": {}, "counters": {}}
+    for stage, (n, total, mx) in sorted(stages.items()):
+        out["stages"][stage] = {"count": n, "total_ms": round(total * 1000, 3),
+                                "mean_ms": round(total * 1000 / n, 3) if n else 0.0,
+                                "max_ms": round(mx * 1000, 3)}
+    for (name, labels), n in sorted(counters.items()):
+        out["counters"][name + ("{" + _label_str(labels) + "}" if labels else "")] = n
+    return out
+
+def _esc(v):
+    return str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def prometheus_text():
+    with _lock:
+        stages = {s: (st[0], st[1], list(st[3])) for s, st in _stages.items()}
+        counters = dict(_counters)
+    lines = []
+    if stages:
+        name = PREFIX + "stage_seconds"
+        lines += [f"# HELP {name} Wall time per pipeline stage.", f"# TYPE {name} histogram"]
+        for stage, (n, total, buckets) in sorted(stages.items()):
+            acc = 0
+            for le, b in zip(BUCKETS, buckets):
+                acc += b
+                lines.append(f'{name}_bucket{{stage="{_esc(stage)}",le="{le}"}} {acc}')
+            lines.append(f'{name}_bucket{{stage="{_esc(stage)}",le="+Inf"}} {n}')
+            lines.append(f'{name}_sum{{stage="{_esc(stage)}"}} {total:.6f}')
+            lines.append(f'{name}_count{{stage="{_esc(stage)}"}} {n}')
+    by_name = {}
+    for (name, labels), n in counters.items():
+        by_name.setdefault(name, []).append((labels, n))
+    for name in sorted(by_name):
+        full = PREFIX + name + "_total"
+        lines.append(f"# TYPE {full} counter")
+        for labels, n in sorted(by_name[name]):
+            lab = ",".join(f'{k}="{_esc(v)}"' for k, v in labels)
+            lines.append(f"{full}{{{lab}}} {n}" if lab else f"{full} {n}")
+    return "\n".join(lines) + "\n"
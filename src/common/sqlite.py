@@ -0,0 +1,52 @@
+"""
+Shared SQLite plumbing for the on-disk stores (OCR cache, submission store, fraud index).
+
+Provides:
+- SqliteStore(path): base class; creates the parent directory, self._conn() -> this (process,
+  thread)'s connection in WAL mode with autocommit (writers use explicit BEGIN IMMEDIATE)
+- default_instance(env, default_path, factory, what) -> the shared store for the path in $env
+  (default_path if unset), or None when it is "off" or could not be opened
+
+Several processes (webapp, batch workers, service workers) can read and write one file at the
+same time. A store that fails to open is reported once and disabled for that path, so a
+read-only or corrupt file degrades to "no cache" instead of failing every request.
+"""
+import os, sqlite3, threading
+
+OFF = ("", "0", "off", "none", "false")
+
+class SqliteStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def _conn(self):
+        # sqlite connections must not cross threads or fork(): one per (process, thread)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+_instances = {}
+_broken = set()
+_lock = threading.Lock()
+
+def default_instance(env, default_path, factory, what):
+    """factory(path) builds the store; `what` names it in the message when it is disabled."""
+    path = os.environ.get(env, default_path)
+    if path.lower() in OFF or (env, path) in _broken:
+        return None
+    with _lock:
+        inst = _instances.get(env)
+        if inst is None or inst.path != path:
+            try:
+                inst = _instances[env] = factory(path)
+            except Exception as e:
+                print(what, "disabled:", repr(e))
+                _broken.add((env, path))
+                return None
+    return inst
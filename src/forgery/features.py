@@ -0,0 +1,223 @@
+"""
+Vectorised document features for the ML stage.
+
+Provides:
+- FEATURE_NAMES -> column names of the feature matrix
+- pack(ocrs) -> TokenArrays (flat per-token columns for a batch of documents; OcrResults
+  from src/ocr/ocr_result.py are concatenated column-wise instead of walked item by item)
+- features_matrix(ocrs) -> float32 array of shape (len(ocrs), len(FEATURE_NAMES))
+
+Every OCR list in the batch is flattened once into per-token columns (document id, box
+bounds, confidence, text length, digit count). All features are then computed for the whole
+batch with NumPy (bincount / cumsum over the document ids), so the cost per document is a
+short Python pass over its tokens plus a share of a few array operations.
+
+Features (per document):
+- char_count, digits, has_amount: the original three (joined text length, digit count,
+  whether "amount" appears)
+- n_tokens
+- conf_mean, conf_std, conf_min, conf_outliers: confidences rescaled to 0..1 (Tesseract
+  reports 0..100); conf_outliers is the share of tokens more than 2 std below the mean
+- height_mean, height_cv: box height and its coefficient of variation (font size spread)
+- amount_tokens, amount_height_ratio, amount_conf_delta: tokens shaped like amounts
+  (2 to 7 digits), their height relative to the page and their confidence relative to it
+- overlap: share of tokens whose box overlaps one of the next tokens in reading order
+- baseline_drift, slope_std: for neighbouring words on the same line, the mean baseline
+  offset (in box heights) and the spread of the baseline slope. A rotated scan has a
+  constant slope; text pasted onto a line does not sit on its baseline.
+"""
+from src.ocr.ocr_result import OcrResult
+from src.common.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+FEATURE_NAMES = (
+    "char_count", "digits", "has_amount", "n_tokens",
+    "conf_mean", "conf_std", "conf_min", "conf_outliers",
+    "height_mean", "height_cv",
+    "amount_tokens", "amount_height_ratio", "amount_conf_delta",
+    "overlap", "baseline_drift", "slope_std",
+)
+# neighbours (in reading order) each box is compared with for overlap / line features
+NEIGHBOURS = 3
+
+class TokenArrays:
+    """Per-token columns for a batch: doc, x0, y0, x1, y1, conf, length, digits, has_amount."""
+    __slots__ = ("n_docs", "doc", "x0", "y0", "x1", "y1", "conf", "length", "digits", "has_amount", "has_box")
+
+def _bounds(box):
+    try:
+        xs = [float(p[0]) for p in box]
+        ys = [float(p[1]) for p in box]
+        return min(xs), min(ys), max(xs), max(ys)
+    except Exception:
+        return None
+
+def _text_columns(t, texts):
+    t.length = np.fromiter((len(s) for s in texts), dtype=np.int64, count=len(texts))
+    # digit count per token from one pass over the concatenated text
+    if texts:
+        chars = np.frombuffer("".join(texts).encode("utf-32-le"), dtype=np.uint32)
+        cs = np.concatenate([[0], np.cumsum((chars >= 48) & (chars <= 57))])
+        ends = np.cumsum(t.length)
+        t.digits = cs[ends] - cs[ends - t.length]
+    else:
+        t.digits = np.zeros(0, dtype=np.int64)
+    t.has_amount = np.fromiter(("amount" in s.lower() for s in texts), dtype=bool, count=len(texts))
+
+def _pack_results(ocrs):
+    """pack() for a batch made only of OcrResults: columns are concatenated, not rebuilt."""
+    t = TokenArrays()
+    t.n_docs = len(ocrs)
+    lens = [len(r) for r in ocrs]
+    t.doc = np.repeat(np.arange(len(ocrs), dtype=np.int64), lens)
+    t.conf = np.concatenate([r.conf for r in ocrs]).astype(np.float64)
+    texts = [s for r in ocrs for s in r.texts]
+    _text_columns(t, texts)
+    boxes = np.concatenate([r.boxes for r in ocrs]).astype(np.float64)
+    t.has_box = np.concatenate([r.has_box for r in ocrs])
+    bounds = np.concatenate([boxes.min(axis=1), boxes.max(axis=1)], axis=1)
+    bounds[~t.has_box] = np.nan
+    t.x0, t.y0, t.x1, t.y1 = bounds.T
+    return t
+
+def pack(ocrs):
+    if ocrs and all(isinstance(o, OcrResult) for o in ocrs):
+        return _pack_results(ocrs)
+    docs, texts, confs, boxes = [], [], [], []
+    for d, ocr in enumerate(ocrs):
+        for it in ocr:
+            docs.append(d)
+            texts.append(it.get("text") or "")
+            try:
+                confs.append(float(it.get("conf") or 0.0))
+            except (TypeError, ValueError):
+                confs.append(0.0)
+            boxes.append(it.get("box"))
+    t = TokenArrays()
+    t.n_docs = len(ocrs)
+    t.doc = np.asarray(docs, dtype=np.int64)
+    t.conf = np.asarray(confs, dtype=np.float64)
+    _text_columns(t, texts)
+    # boxes: one array conversion when every box is a 4-point quad, per-box fallback otherwise
+    n = len(boxes)
+    bounds = np.full((n, 4), np.nan)
+    try:
+        arr = np.asarray(boxes, dtype=np.float64)
+        if arr.shape != (n, 4, 2):
+            raise ValueError
+        bounds[:, :2] = arr.min(axis=1)
+        bounds[:, 2:] = arr.max(axis=1)
+    except (ValueError, TypeError):
+        for i, box in enumerate(boxes):
+            if box is not None and len(box):
+                b = _bounds(box)
+                if b is not None:
+                    bounds[i] = b
+    t.x0, t.y0, t.x1, t.y1 = bounds.T
+    t.has_box = ~np.isnan(bounds).any(axis=1)
+    return t
+
+def _doc_mean(values, doc, n_docs, weights=None):
+    w = np.ones(len(values)) if weights is None else weights.astype(np.float64)
+    cnt = np.bincount(doc, weights=w, minlength=n_docs)
+    tot = np.bincount(doc, weights=values * w, minlength=n_docs)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(cnt > 0, tot / np.maximum(cnt, 1e-12), 0.0), cnt
+
+def _doc_std(values, doc, n_docs, mean, weights=None):
+    w = np.ones(len(values)) if weights is None else weights.astype(np.float64)
+    cnt = np.bincount(doc, weights=w, minlength=n_docs)
+    sq = np.bincount(doc, weights=w * (values - mean[doc]) ** 2, minlength=n_docs)
+    return np.sqrt(np.where(cnt > 0, sq / np.maximum(cnt, 1e-12), 0.0))
+
+def _neighbour_pairs(t, order):
+    """(a, b) token index pairs: each boxed token and its next NEIGHBOURS tokens in reading order, same doc."""
+    a_parts, b_parts = [], []
+    for k in range(1, NEIGHBOURS + 1):
+        a, b = order[:-k], order[k:]
+        same = t.doc[a] == t.doc[b]
+        a_parts.append(a[same]); b_parts.append(b[same])
+    if not a_parts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(a_parts), np.concatenate(b_parts)
+
+def features_matrix(ocrs):
+    """Feature matrix (float32, one row per OCR list, columns as FEATURE_NAMES)."""
+    n_docs = len(ocrs)
+    out = np.zeros((n_docs, len(FEATURE_NAMES)), dtype=np.float32)
+    if not n_docs:
+        return out
+    t = pack(ocrs)
+    doc = t.doc
+    n_tok = np.bincount(doc, minlength=n_docs)
+    out[:, 0] = np.bincount(doc, weights=t.length, minlength=n_docs) + np.maximum(n_tok - 1, 0)
+    out[:, 1] = np.bincount(doc, weights=t.digits, minlength=n_docs)
+    out[:, 2] = np.bincount(doc, weights=t.has_amount, minlength=n_docs) > 0
+    out[:, 3] = n_tok
+    if not len(doc):
+        return out
+
+    # confidence, rescaled per document to 0..1
+    dmax = np.zeros(n_docs)
+    np.maximum.at(dmax, doc, t.conf)
+    conf = np.clip(t.conf / np.where(dmax > 1.0, 100.0, 1.0)[doc], 0.0, 1.0)
+    cmean, _ = _doc_mean(conf, doc, n_docs)
+    cstd = _doc_std(conf, doc, n_docs, cmean)
+    cmin = np.ones(n_docs)
+    np.minimum.at(cmin, doc, conf)
+    low = conf < cmean[doc] - 2.0 * cstd[doc]
+    out[:, 4], out[:, 5] = cmean, cstd
+    out[:, 6] = np.where(n_tok > 0, cmin, 0.0)
+    out[:, 7] = np.bincount(doc, weights=low, minlength=n_docs) / np.maximum(n_tok, 1)
+
+    # box heights (font size) over tokens that have a box
+    boxed = t.has_box
+    h = np.where(boxed, t.y1 - t.y0, 0.0)
+    hmean, n_boxed = _doc_mean(h, doc, n_docs, boxed)
+    hstd = _doc_std(h, doc, n_docs, hmean, boxed)
+    out[:, 8] = hmean
+    out[:, 9] = np.where(hmean > 0, hstd / np.maximum(hmean, 1e-9), 0.0)
+
+    # amount-shaped tokens: 2..7 digits (dates carry 8 digits and drop out)
+    amt = (t.digits >= 2) & (t.digits < 8)
+    n_amt = np.bincount(doc, weights=amt, minlength=n_docs)
+    amt_h, n_amt_boxed = _doc_mean(h, doc, n_docs, amt & boxed)
+    amt_c, _ = _doc_mean(conf, doc, n_docs, amt)
+    out[:, 10] = n_amt
+    out[:, 11] = np.where((n_amt_boxed > 0) & (hmean > 0), amt_h / np.maximum(hmean, 1e-9), 1.0)
+    out[:, 12] = np.where(n_amt > 0, amt_c - cmean, 0.0)
+
+    # layout: pairs of nearby boxes in reading order (doc, top, left)
+    idx = np.flatnonzero(boxed)
+    if len(idx) < 2:
+        return out
+    order = idx[np.lexsort((t.x0[idx], t.y0[idx], doc[idx]))]
+    a, b = _neighbour_pairs(t, order)
+    if not len(a):
+        return out
+    ix = np.minimum(t.x1[a], t.x1[b]) - np.maximum(t.x0[a], t.x0[b])
+    iy = np.minimum(t.y1[a], t.y1[b]) - np.maximum(t.y0[a], t.y0[b])
+    area = lambda i: np.maximum(t.x1[i] - t.x0[i], 1.0) * np.maximum(t.y1[i] - t.y0[i], 1.0)
+    inter = np.clip(ix, 0, None) * np.clip(iy, 0, None)
+    overlapping = inter / np.minimum(area(a), area(b)) > 0.2
+    hit = np.zeros(len(doc), dtype=bool)
+    hit[a[overlapping]] = True
+    hit[b[overlapping]] = True
+    out[:, 13] = np.bincount(doc, weights=hit, minlength=n_docs) / np.maximum(n_boxed, 1)
+
+    # same line: vertical centres within half a box height, b to the right of a
+    ha, hb = t.y1[a] - t.y0[a], t.y1[b] - t.y0[b]
+    hh = np.maximum((ha + hb) / 2.0, 1.0)
+    dx = (t.x0[b] + t.x1[b] - t.x0[a] - t.x1[a]) / 2.0
+    dcy = (t.y0[b] + t.y1[b] - t.y0[a] - t.y1[a]) / 2.0
+    line = (np.abs(dcy) < 0.5 * hh) & (dx > 0) & ~overlapping
+    if line.any():
+        pd = doc[a[line]]
+        drift = np.abs(t.y1[b[line]] - t.y1[a[line]]) / hh[line]
+        slope = (t.y1[b[line]] - t.y1[a[line]]) / np.maximum(dx[line], 1.0)
+        dmean, _ = _doc_mean(drift, pd, n_docs)
+        smean, _ = _doc_mean(slope, pd, n_docs)
+        out[:, 14] = dmean
+        out[:, 15] = _doc_std(slope, pd, n_docs, smean)
+    return out
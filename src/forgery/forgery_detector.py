@@ -1,18 +1,33 @@
 # src/forgery/forgery_detector.py
-import re, os, json, numpy as np, joblib
-from sklearn.ensemble import RandomForestClassifier
+import re
+from bisect import bisect_left, bisect_right
+from contextlib import nullcontext
+from src.forgery.model_registry import get_registry
+from src.ocr.ocr_result import OcrResult
+from src.common import metrics
+from src.common.lazy import lazy_import
+
+# numpy and the feature code are only needed once a document reaches the classifier
+np = lazy_import("numpy")
+features = lazy_import("src.forgery.features")
 
 MODEL_PATH = "models/forgery_clf.pkl"
 
 _re_account = re.compile(r"Account[:\s]*([0-9\-\s]{4,})", flags=re.IGNORECASE)
 _re_date = re.compile(r"^\d{4}[-/]\d{2}[-/]\d{2}$")
+_re_nondigit = re.compile(r"[^\d]")
+_re_non_account = re.compile(r"[^\d\-]")
+_re_amount_chars = re.compile(r"[^\d,]")
+_re_number_only = re.compile(r"[\d,]+")
+
+CURRENCY_MARKERS = frozenset(("rs", "rs.", "inr", "₹"))
+# label kinds, decided once per token from its lowercase text
+ACCOUNT, NAME, AMOUNT, CURRENCY = 1, 2, 3, 4
 
 def normalize_amount_str(s):
     if not s:
         return None
-    s = str(s)
-    s = re.sub(r"[^\d,]", "", s)
-    s = s.replace(",", "")
+    s = _re_amount_chars.sub("", str(s)).replace(",", "")
     if not s:
         return None
     try:
@@ -20,149 +35,186 @@ def normalize_amount_str(s):
     except:
         return None
 
-def _is_potential_amount_token(tok_text):
-    if not tok_text:
-        return False
-    tok = tok_text.strip()
-    if _re_date.match(tok):
-        return False
-    if not re.search(r"\d", tok):
-        return False
-    digits_only = re.sub(r"[^\d]", "", tok)
-    if len(digits_only) < 2:
-        return False
-    if len(digits_only) >= 8:
-        return False
-    return True
-
-def _as_number(tok_text):
-    return normalize_amount_str(tok_text)
+def _label_kind(lower):
+    if lower.startswith("account"):
+        return ACCOUNT
+    if lower.startswith("name"):
+        return NAME
+    if lower.startswith("amount"):
+        return AMOUNT
+    if lower in CURRENCY_MARKERS:
+        return CURRENCY
+    return 0
 
-def extract_fields_from_ocr(ocr_list):
+class Token:
+    """
+    One OCR item analysed once: stripped text, lowercase form, digits-only string, parsed
+    amount (int or None), date flag, label kind and centroid (cx/cy None without a box).
+    raw is the source dict, or the row number when the OCR came as an OcrResult.
+    """
+    __slots__ = ("text", "lower", "digits", "amount", "is_date", "kind", "cx", "cy", "raw")
+
+    def __init__(self, text, cx, cy, raw):
+        self.text, self.cx, self.cy, self.raw = text, cx, cy, raw
+        self.lower = lower = text.lower()
+        self.digits = digits = _re_nondigit.sub("", text)
+        self.is_date = _re_date.match(text) is not None
+        self.kind = _label_kind(lower)
+        amount = None
+        if digits:
+            try:
+                amount = int(digits)
+            except ValueError:
+                pass
+        self.amount = amount
+
+    @property
+    def potential_amount(self):
+        """Could be an amount: not a date, 2 to 7 digits."""
+        return not self.is_date and 2 <= len(self.digits) < 8
+
+def tokenize(ocr_list):
+    """Token table for an OCR list (or OcrResult), in input order."""
+    if isinstance(ocr_list, OcrResult):
+        # centroids for every box in one array op; texts sliced from the shared buffer
+        cxy = ocr_list.centroids.tolist()
+        placed = ocr_list.has_box.tolist()
+        return [Token(t.strip(), c[0] if p else None, c[1] if p else None, i)
+                for i, (t, c, p) in enumerate(zip(ocr_list.texts, cxy, placed))]
     tokens = []
-    raw_lines = []
     for it in ocr_list:
         t = (it.get("text") or "").strip()
         box = it.get("box") or []
+        cx = cy = None
         if box and isinstance(box, (list,tuple)) and len(box)>=1:
             xs = [p[0] for p in box if isinstance(p,(list,tuple))]
             ys = [p[1] for p in box if isinstance(p,(list,tuple))]
             if xs and ys:
                 cx = sum(xs)/len(xs)
                 cy = sum(ys)/len(ys)
-            else:
-                cx = cy = None
-        else:
-            cx = cy = None
-        tokens.append({"text": t, "cx": cx, "cy": cy, "raw": it})
-        raw_lines.append(t)
-    raw_text = "\n".join([t for t in raw_lines if t])
-
-    account = None
-    for tok in tokens:
-        txt = tok["text"].lower().rstrip(":")
-        if txt == "account" or txt.startswith("account"):
-            candidate=None; lx,ly = tok.get("cx"), tok.get("cy")
-            best_dx=1e9
-            for c in tokens:
-                if c is tok or not c["text"].strip():
-                    continue
-                digits_only = re.sub(r"[^\d]","", c["text"])
-                if len(digits_only) < 6:
-                    continue
-                if lx is None or c["cx"] is None:
-                    continue
-                dx = (c["cx"] or 0) - (lx or 0)
-                dy = abs((c["cy"] or 0) - (ly or 0))
-                if dx >= -10 and dx < best_dx and dy < 120:
-                    best_dx=dx; candidate=c
-            if candidate:
-                account = re.sub(r"[^\d\-]","", candidate["text"]).replace(" ","")
+        tokens.append(Token(t, cx, cy, it))
+    return tokens
+
+class TokenIndex:
+    """
+    Tokens that have text and a centroid, sorted by cy. Neighbour queries only visit the
+    horizontal band around the label instead of every token on the page. Matches are
+    returned in original token order so tie-breaking is the same as a full scan.
+    """
+    def __init__(self, tokens):
+        placed = sorted((t.cy, i) for i, t in enumerate(tokens) if t.cx is not None and t.text)
+        self.tokens = tokens
+        self._cys = [cy for cy, _ in placed]
+        self._ids = [i for _, i in placed]
+
+    def band(self, tok, max_dy):
+        """Tokens other than `tok` with |cy - tok.cy| < max_dy, in token order."""
+        ly = tok.cy
+        if ly is None:
+            return []
+        # widened by a pixel so float rounding can't drop a token the exact test would keep
+        lo = bisect_left(self._cys, ly - max_dy - 1)
+        hi = bisect_right(self._cys, ly + max_dy + 1)
+        out = []
+        for i in sorted(self._ids[lo:hi]):
+            c = self.tokens[i]
+            if c is not tok and abs(c.cy - ly) < max_dy:
+                out.append(c)
+        return out
+
+    def _hits(self, tok, max_dy, min_dx, max_dx, strict, where):
+        lx, ly = tok.cx, tok.cy
+        for c in self.band(tok, max_dy):
+            dx = c.cx - lx
+            if dx < min_dx or (strict and dx == min_dx):
+                continue
+            if max_dx is not None and dx >= max_dx:
+                continue
+            if where is not None and not where(c):
+                continue
+            yield dx, abs(c.cy - ly), c
+
+    def right_of(self, tok, max_dy, min_dx=-10, max_dx=None, strict=False, where=None):
+        """
+        (dx, dy, token) for neighbours in the band with dx >= min_dx (dx > min_dx if strict)
+        and dx < max_dx, sorted by (dx, dy).
+        """
+        hits = list(self._hits(tok, max_dy, min_dx, max_dx, strict, where))
+        hits.sort(key=lambda x: (x[0], x[1]))
+        return hits
+
+    def nearest_right(self, tok, max_dy, min_dx=-10, strict=False, where=None):
+        """Closest neighbour to the right (smallest dx), or None. First in token order wins ties."""
+        best = None; best_dx = 1e9
+        for dx, _, c in self._hits(tok, max_dy, min_dx, None, strict, where):
+            if dx < best_dx:
+                best_dx = dx; best = c
+        return best
+
+def _has_digit(c):
+    return bool(c.digits)
+
+def _account_like(c):
+    return len(c.digits) >= 6
+
+def extract_fields_from_ocr(ocr_list):
+    with metrics.timer("extract.tokens"):
+        tokens = tokenize(ocr_list)
+        raw_text = "\n".join([t.text for t in tokens if t.text])
+        index = TokenIndex(tokens)
+        labels = [t for t in tokens if t.kind]
+
+    with metrics.timer("extract.account"):
+        account = None
+        for tok in labels:
+            if tok.kind == ACCOUNT:
+                candidate = index.nearest_right(tok, 120, where=_account_like)
+                if candidate:
+                    account = _re_non_account.sub("", candidate.text).replace(" ","")
+                    break
+        if not account:
+            m = _re_account.search(raw_text)
+            if m:
+                account = _re_non_account.sub("", m.group(1)).replace(" ","")
+
+    with metrics.timer("extract.name"):
+        name = None
+        for tok in labels:
+            if tok.kind == NAME:
+                parts = tok.text.split(":",1)
+                if len(parts)>1 and parts[1].strip():
+                    name = parts[1].strip()
+                else:
+                    best = index.nearest_right(tok, 60, min_dx=0, strict=True)
+                    if best:
+                        name = best.text
                 break
-    if not account:
-        m = _re_account.search(raw_text)
-        if m:
-            account = re.sub(r"[^\d\-]","", m.group(1)).replace(" ","")
-
-    name = None
-    for i,tok in enumerate(tokens):
-        txt = tok["text"].lower()
-        if txt.startswith("name"):
-            parts = tok["text"].split(":",1)
-            if len(parts)>1 and parts[1].strip():
-                name = parts[1].strip()
-            else:
-                cy = tok.get("cy")
-                best=None; best_dx=1e9
-                for c in tokens:
-                    if c is tok or not c["text"].strip():
-                        continue
-                    if c["cx"] is None or cy is None:
-                        continue
-                    dy = abs((c["cy"] or 0)-cy)
-                    dx = (c["cx"] or 0) - (tok["cx"] or 0)
-                    if dy<60 and dx>0 and dx<best_dx:
-                        best_dx=dx; best=c
-                if best:
-                    name = best["text"]
-            break
-    if not name:
-        nonnum = [t["text"] for t in tokens if t["text"] and not re.fullmatch(r"[\d,]+", t["text"])]
-        if nonnum:
-            name = max(nonnum, key=len)
-
-    amounts = []
-    # labeled Amount tokens
-    for tok in tokens:
-        if tok["text"].lower().startswith("amount"):
-            lx,ly = tok.get("cx"), tok.get("cy")
-            candidates=[]
-            for c in tokens:
-                if c is tok or not c["text"].strip():
-                    continue
-                if not re.search(r"\d", c["text"]):
-                    continue
-                if lx is None or c["cx"] is None:
-                    continue
-                dx = (c["cx"] or 0) - (lx or 0)
-                dy = abs((c["cy"] or 0) - (ly or 0))
-                if dx >= -10 and dx < 1500 and dy < 120:
-                    candidates.append((dx,dy,c))
-            candidates.sort(key=lambda x:(x[0],x[1]))
-            for _,_,chosen in candidates[:3]:
-                val = _as_number(chosen["text"])
-                if val is not None:
-                    amounts.append(val)
-    # currency markers
-    for i,tok in enumerate(tokens):
-        txt = tok["text"].lower()
-        if txt in ("rs","rs.","inr","₹"):
-            lx,ly = tok.get("cx"), tok.get("cy")
-            best=None; best_dx=1e9
-            for c in tokens:
-                if c is tok or not c["text"].strip():
-                    continue
-                if not re.search(r"\d", c["text"]):
-                    continue
-                if lx is None or c["cx"] is None:
-                    continue
-                dx = (c["cx"] or 0) - (lx or 0)
-                dy = abs((c["cy"] or 0) - (ly or 0))
-                if dx >= -10 and dy < 120 and dx < best_dx:
-                    best_dx=dx; best=c
-            if best:
-                val = _as_number(best["text"])
-                if val is not None:
-                    amounts.append(val)
-    # generic numeric tokens with filters
-    for tok in tokens:
-        if not _is_potential_amount_token(tok["text"]):
-            continue
-        if account and re.sub(r"[^\d]","", tok["text"]) in account:
-            continue
-        num = _as_number(tok["text"])
-        if num is not None:
-            amounts.append(num)
+        if not name:
+            nonnum = [t.text for t in tokens if t.text and not _re_number_only.fullmatch(t.text)]
+            if nonnum:
+                name = max(nonnum, key=len)
+
+    with metrics.timer("extract.amount"):
+        amounts = []
+        # labeled Amount tokens
+        for tok in labels:
+            if tok.kind == AMOUNT:
+                for _,_,chosen in index.right_of(tok, 120, max_dx=1500, where=_has_digit)[:3]:
+                    if chosen.amount is not None:
+                        amounts.append(chosen.amount)
+        # currency markers
+        for tok in labels:
+            if tok.kind == CURRENCY:
+                best = index.nearest_right(tok, 120, where=_has_digit)
+                if best and best.amount is not None:
+                    amounts.append(best.amount)
+        # generic numeric tokens with filters
+        for tok in tokens:
+            if tok.amount is None or not tok.potential_amount:
+                continue
+            if account and tok.digits in account:
+                continue
+            amounts.append(tok.amount)
 
     cleaned_amounts = sorted(set([a for a in amounts if isinstance(a,int) and a>0]))
     final_amounts=[]
@@ -181,17 +233,34 @@ def simple_features_from_ocr(ocr):
     has_amount = int(bool(re.search(r"amount", text, flags=re.I)))
     return np.array([char_count, digits, has_amount]).reshape(1, -1)
 
-def train_dummy():
-    X = np.array([[100,10,1],[500,50,1],[120,1,0],[80,2,1],[200,20,0]])
-    y = np.array([0,1,1,0,0])
-    clf = RandomForestClassifier(n_estimators=10, random_state=0)
-    os.makedirs("models", exist_ok=True)
-    joblib.dump(clf, MODEL_PATH)
+def load_model():
+    """Cached classifier (reloaded when the file changes), or None if no model is available."""
+    return get_registry(MODEL_PATH).get()
+
+def train_dummy(n=300):
+    """Fit a small model on synthetic slips and save it to MODEL_PATH (see src/forgery/train.py)."""
+    from src.forgery.train import synthetic, train
+    ocrs, labels = synthetic(n)
+    clf, _ = train(ocrs, labels, MODEL_PATH, trees=50, test_size=0)
     return clf
 
-def predict(ocr):
+def features_matrix(ocrs):
+    """Feature matrix for many documents, one row each (columns: features.FEATURE_NAMES)."""
+    return features.features_matrix(ocrs)
+
+def _model_features(clf, ocrs):
+    # models saved before features.py was added were fitted on the three simple features
+    if getattr(clf, "n_features_in_", None) == 3:
+        return np.vstack([simple_features_from_ocr(ocr) for ocr in ocrs])
+    return features_matrix(ocrs)
+
+def _rule_stage(ocr):
+    """
+    Rule-based evidence for one document. Returns (result, None) when the rules already decide
+    the verdict, otherwise (None, (fields, evidence, score)) still waiting for the ML score.
+    """
     if not ocr:
-        return {"label":"POSSIBLE","score":0.5,"fields":{},"evidence":["no_text_detected"]}
+        return {"label":"POSSIBLE","score":0.5,"fields":{},"evidence":["no_text_detected"]}, None
     fields = extract_fields_from_ocr(ocr)
     evidence = []
     score = 0.1
@@ -201,18 +270,73 @@ def predict(ocr):
         if len(unique_amounts) >= 2:
             evidence.append(f"multiple_amounts_detected:{unique_amounts}")
             score = 0.9
-            return {"label":"FORGED","score":score,"fields":fields,"evidence":evidence}
+            return {"label":"FORGED","score":score,"fields":fields,"evidence":evidence}, None
     if not fields.get("account"):
         evidence.append("account_missing")
         score = max(score, 0.45)
-    if os.path.exists(MODEL_PATH):
-        clf = joblib.load(MODEL_PATH)
-    else:
-        clf = train_dummy()
-    f = simple_features_from_ocr(ocr)
-    ml_prob = float(clf.predict_proba(f)[0][1])
-    score = max(score, 0.3*ml_prob + 0.2*score)
-    label = "FORGED" if score>0.6 else "POSSIBLE" if score>0.35 else "CLEAN"
+    return None, (fields, evidence, score)
+
+def label_for_score(score):
+    return "FORGED" if score>0.6 else "POSSIBLE" if score>0.35 else "CLEAN"
+
+def _finish(fields, evidence, score, ml_prob=None):
+    if ml_prob is not None:
+        score = max(score, 0.3*ml_prob + 0.2*score)
+    label = label_for_score(score)
     if score > 0.6:
         evidence.append("ml_high_score")
     return {"label": label, "score": round(float(score),3), "fields": fields, "evidence": evidence}
+
+def predict_batch(ocrs, timings=False, history=None, image_hashes=None, record=True):
+    """
+    Score many OCR results. Rules run per document; every document that still needs the
+    classifier goes into a single feature matrix and one predict_proba call.
+    Returns one result dict per input, in order (same shape as predict()).
+    timings=True adds a "timings" key ({stage: ms}) to every result; the features and model
+    stages are shared by the whole batch, so each document reports the batch's time for them.
+    history: a FraudIndex (src/forgery/fraud_index.py) to check the slips against earlier ones
+    and record them in, with image_hashes (one per OCR result, or None) for image matches;
+    record=False checks without recording.
+    """
+    results = [None] * len(ocrs)
+    per_doc = [None] * len(ocrs)
+    pending = []
+    for i, ocr in enumerate(ocrs):
+        if timings:
+            with metrics.collect() as c, metrics.timer("predict.rules"):
+                done, state = _rule_stage(ocr)
+            per_doc[i] = c
+        else:
+            with metrics.timer("predict.rules"):
+                done, state = _rule_stage(ocr)
+        if done is not None:
+            results[i] = done
+        else:
+            pending.append((i, state))
+    with metrics.collect() if timings else nullcontext() as shared:
+        if pending:
+            probs = [None] * len(pending)
+            clf = load_model()
+            if clf is not None:
+                try:
+                    with metrics.timer("predict.features"):
+                        X = _model_features(clf, [ocrs[i] for i, _ in pending])
+                    with metrics.timer("predict.model"):
+                        probs = [float(p) for p in clf.predict_proba(X)[:, 1]]
+                except Exception as e:
+                    print("predict: classifier failed, using rule score only:", repr(e))
+                    metrics.incr("classifier_errors", reason=type(e).__name__)
+            for (i, (fields, evidence, score)), ml_prob in zip(pending, probs):
+                results[i] = _finish(fields, evidence, score, ml_prob)
+        if history is not None:
+            history.correlate(results, image_hashes, record)
+    for i, res in enumerate(results):
+        metrics.incr("predictions", label=res["label"])
+        if timings:
+            t = per_doc[i].timings()
+            t.update(shared.timings())
+            res["timings"] = t
+    return results
+
+def predict(ocr, timings=False, history=None, image_hash=None, record=True):
+    return predict_batch([ocr], timings=timings, history=history, image_hashes=[image_hash], record=record)[0]
@@ -0,0 +1,171 @@
+"""
+Persistent cross-document index of scored slips, for correlating a slip with earlier ones.
+
+Provides:
+- image_hash(data, policy, engines, preprocess) -> hex digest identifying a slip image (path,
+  encoded bytes or array) as read with those OCR settings
+- FraudIndex(path).lookup(fields, image_hash=None) -> (evidence list, score floor)
+- FraudIndex.add_many([(fields, image_hash), ...]) -> bulk insert in one transaction
+- FraudIndex.correlate(results, image_hashes=None, record=True) -> look up then record a batch of predict() results
+- get_default_index() -> shared FraudIndex, or None when disabled
+
+Every scored slip adds its normalised account (digits only), name (upper case, single spaces),
+amounts and image hash. Rows are aggregated per key rather than stored once per slip:
+(account, name) pairs and (image, account, amounts) triples, each with a count and first/last
+seen time. A lookup is then two primary-key range reads in SQLite, which stays well under a
+millisecond however many slips have been recorded.
+
+The image hash covers the OCR settings as well as the bytes: the same file read with another
+policy, engine set or preprocessing may legitimately give other amounts, so it gets its own key
+and never conflicts with itself.
+
+Evidence added by correlate():
+- account_name_conflict:<account>:<other names>   the account was seen under another name
+- image_amount_conflict:<earlier amounts>-><now>   the same image was scored with other amounts
+- image_account_conflict:<earlier accounts>-><now> the same image was scored with another account
+
+Configuration:
+- LEGALDOC_FRAUD_INDEX: index file path (default .cache/fraud_index.sqlite); "off" disables it
+"""
+import os, time, json, hashlib
+
+from src.common import metrics
+from src.common.sqlite import SqliteStore, default_instance
+
+MAX_LISTED = 5  # other names / amounts quoted in one evidence string
+
+def image_hash(data, policy="first", engines=("paddle", "tesseract"), preprocess=None):
+    from src.ocr.ocr_cache import key_bytes
+    config = json.dumps([policy, list(engines or ()), dict(preprocess or {})], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(key_bytes(data) + b"\0" + config.encode("utf-8")).hexdigest()
+
+def _account(v):
+    return "".join(ch for ch in str(v or "") if ch.isdigit())
+
+def _name(v):
+    return " ".join(str(v or "").upper().split())
+
+def _amounts(v):
+    return ",".join(str(a) for a in sorted(set(int(a) for a in v or [])))
+
+def _image_key(h):
+    if not h:
+        return None
+    if isinstance(h, (bytes, bytearray)):
+        return bytes(h[:16])
+    try:
+        return bytes.fromhex(h)[:16]
+    except ValueError:
+        return hashlib.sha256(str(h).encode("utf-8")).digest()[:16]
+
+class FraudIndex(SqliteStore):
+    def __init__(self, path):
+        super().__init__(path)
+        with self._conn() as c:
+            c.execute("CREATE TABLE IF NOT EXISTS account_names (account TEXT, name TEXT, n INTEGER, "
+                      "first_seen REAL, last_seen REAL, PRIMARY KEY (account, name)) WITHOUT ROWID")
+            c.execute("CREATE TABLE IF NOT EXISTS images (image BLOB, account TEXT, amounts TEXT, n INTEGER, "
+                      "first_seen REAL, last_seen REAL, PRIMARY KEY (image, account, amounts)) WITHOUT ROWID")
+
+    def _lookup(self, c, account, name, amounts, image):
+        evidence, score = [], 0.0
+        if account and name:
+            others = [r[0] for r in c.execute("SELECT name FROM account_names WHERE account=? AND name<>? LIMIT ?",
+                                              (account, name, MAX_LISTED))]
+            if others:
+                evidence.append(f"account_name_conflict:{account}:{others}")
+                score = max(score, 0.7)
+        if image is not None:
+            seen = c.execute("SELECT account, amounts FROM images WHERE image=? LIMIT ?", (image, 64)).fetchall()
+            accounts = sorted({a for a, _ in seen if a and a != account})
+            if accounts and account:
+                evidence.append(f"image_account_conflict:{accounts[:MAX_LISTED]}->{account}")
+                score = max(score, 0.85)
+            prior = sorted({m for _, m in seen if m and m != amounts})
+            if prior and amounts:
+                evidence.append(f"image_amount_conflict:{prior[:MAX_LISTED]}->{amounts}")
+                score = max(score, 0.85)
+        return evidence, score
+
+    def _insert(self, c, rows):
+        now = time.time()
+        c.executemany("INSERT INTO account_names(account, name, n, first_seen, last_seen) VALUES (?,?,1,?,?) "
+                      "ON CONFLICT(account, name) DO UPDATE SET n=n+1, last_seen=excluded.last_seen",
+                      [(a, n, now, now) for a, n, _, _ in rows if a and n])
+        c.executemany("INSERT INTO images(image, account, amounts, n, first_seen, last_seen) VALUES (?,?,?,1,?,?) "
+                      "ON CONFLICT(image, account, amounts) DO UPDATE SET n=n+1, last_seen=excluded.last_seen",
+                      [(i, a, m, now, now) for a, _, m, i in rows if i is not None])
+
+    @staticmethod
+    def _row(fields, image):
+        fields = fields or {}
+        return _account(fields.get("account")), _name(fields.get("name")), _amounts(fields.get("amounts")), _image_key(image)
+
+    def lookup(self, fields, image_hash=None):
+        try:
+            return self._lookup(self._conn(), *self._row(fields, image_hash))
+        except Exception as e:
+            print("FraudIndex.lookup failed:", repr(e))
+            return [], 0.0
+
+    def add_many(self, items):
+        """items: iterable of (fields, image_hash). One transaction for the lot."""
+        rows = [self._row(f, h) for f, h in items]
+        self._write(lambda c: self._insert(c, rows))
+
+    def add(self, fields, image_hash=None):
+        self.add_many([(fields, image_hash)])
+
+    def _write(self, fn):
+        try:
+            c = self._conn()
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                out = fn(c)
+                c.execute("COMMIT")
+                return out
+            except Exception:
+                c.execute("ROLLBACK")
+                raise
+        except Exception as e:
+            print("FraudIndex write failed:", repr(e))
+            return None
+
+    def correlate(self, results, image_hashes=None, record=True):
+        """
+        Add evidence from earlier slips to predict() results (in place), then record them.
+        Slips in the same batch see each other in order, all in one transaction.
+        record=False only looks up (for OCR supplied by a caller rather than read here).
+        """
+        from src.forgery.forgery_detector import label_for_score
+        hashes = list(image_hashes) if image_hashes is not None else [None] * len(results)
+        def run(c):
+            for res, h in zip(results, hashes):
+                row = self._row(res.get("fields"), h)
+                if not (row[0] or row[3]):
+                    continue
+                evidence, floor = self._lookup(c, *row)
+                if evidence:
+                    metrics.incr("fraud_index_hits", len(evidence))
+                    res.setdefault("evidence", []).extend(evidence)
+                    if floor > res.get("score", 0.0):
+                        res["score"] = round(float(floor), 3)
+                        res["label"] = label_for_score(floor)
+                if record:
+                    self._insert(c, [row])
+        with metrics.timer("predict.history"):
+            self._write(run)
+        return results
+
+    def stats(self):
+        c = self._conn()
+        return {"accounts": c.execute("SELECT COUNT(DISTINCT account) FROM account_names").fetchone()[0],
+                "images": c.execute("SELECT COUNT(DISTINCT image) FROM images").fetchone()[0]}
+
+    def clear(self):
+        c = self._conn()
+        c.execute("DELETE FROM account_names")
+        c.execute("DELETE FROM images")
+
+def get_default_index():
+    return default_instance("LEGALDOC_FRAUD_INDEX", os.path.join(".cache", "fraud_index.sqlite"), FraudIndex, "Fraud index")
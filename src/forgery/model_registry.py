@@ -0,0 +1,89 @@
+"""
+In-process cache for the forgery classifier.
+
+Provides:
+- ModelRegistry(path, mmap_mode="r", check_interval=2.0).get() -> loaded model or None
+- get_registry(path) -> shared ModelRegistry for a model file (one per absolute path)
+
+The pickle is loaded once and reused. At most every `check_interval` seconds the file is
+stat()ed; when mtime/size change the content hash is compared and the model is swapped only
+if the bytes really differ. Nothing is ever written to disk here - a missing model file
+simply means get() returns None (or keeps serving the last good model).
+"""
+import os, time, hashlib, threading
+
+from src.common.lazy import lazy_import
+
+# joblib (and sklearn, when the pickle is read) load with the first model, not on import
+joblib = lazy_import("joblib")
+
+def _file_digest(path, chunk=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+class ModelRegistry:
+    def __init__(self, path, mmap_mode="r", check_interval=2.0):
+        self.path = path
+        self.mmap_mode = mmap_mode
+        self.check_interval = check_interval
+        self._model = None
+        self._sig = None
+        self._digest = None
+        self._checked = None
+        self._lock = threading.Lock()
+
+    @property
+    def digest(self):
+        return self._digest
+
+    def _stale(self, now):
+        return self._checked is None or now - self._checked >= self.check_interval
+
+    def get(self):
+        now = time.monotonic()
+        if not self._stale(now):
+            return self._model
+        with self._lock:
+            if not self._stale(now):
+                return self._model
+            self._checked = now
+            try:
+                st = os.stat(self.path)
+            except OSError:
+                return self._model
+            sig = (st.st_mtime_ns, st.st_size)
+            if sig == self._sig:
+                return self._model
+            try:
+                digest = _file_digest(self.path)
+                if digest != self._digest:
+                    # mmap_mode keeps large numpy arrays (tree nodes etc.) on disk pages
+                    self._model = joblib.load(self.path, mmap_mode=self.mmap_mode)
+                    self._digest = digest
+                self._sig = sig
+            except Exception as e:
+                # half-written file or bad pickle: keep the previous model, retry on next check
+                print("ModelRegistry: failed to load", self.path, repr(e))
+        return self._model
+
+    def reload(self):
+        """Force a re-check on the next get()."""
+        with self._lock:
+            self._checked = None
+            self._sig = None
+        return self.get()
+
+_REGISTRIES = {}
+_REGISTRIES_LOCK = threading.Lock()
+
+def get_registry(path, **kwargs):
+    key = os.path.abspath(path)
+    with _REGISTRIES_LOCK:
+        reg = _REGISTRIES.get(key)
+        if reg is None:
+            reg = ModelRegistry(path, **kwargs)
+            _REGISTRIES[key] = reg
+    return reg
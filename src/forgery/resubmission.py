@@ -0,0 +1,394 @@
+"""
+Near-duplicate detection against earlier submissions, with incremental re-OCR.
+
+Provides:
+- tile_hashes(img, grid=GRID) -> TileHashes (whole-page dHash, one dHash and one exact digest per tile)
+- SubmissionStore(path, max_rows).find(hashes) / .add(hashes, ocr, engine)
+- incremental_ocr(img, ocr_fn, store=None) -> (ocr_list, engine, Match or None)
+- ocr_prepared(prepared, ocr_fn, store=None) -> same, with boxes and regions in original pixels
+- apply_evidence(result, match) -> the predict() result with resubmission evidence added
+- get_default_store() -> shared SubmissionStore, or None when disabled
+
+Every OCRed page is split into a GRID of tiles and each tile gets a difference hash (bit set
+where a pixel of the downsampled tile is brighter than its left neighbour by more than
+DHASH_MARGIN grey levels; the margin keeps JPEG noise on blank paper from flipping bits).
+Pages whose whole-page hash is within GLOBAL_BITS of an earlier submission (looked up through
+8-bit bands of the hash, so candidates come from an index rather than a scan) are compared
+tile by tile. When at most MAX_CHANGED of the tiles differ, the page is a near-duplicate.
+
+Earlier OCR is only ever reused for pixels that are exactly the same: each tile also has a
+digest of its raw pixels. A small edit (one digit of the amount) can leave a tile's dHash
+unchanged, so a near-duplicate never inherits text it was not OCRed for:
+- every tile digest matches: the earlier OCR is reused as is ("identical")
+- at most MAX_CHANGED of the digests differ: only those tiles (grown to cover any word they
+  cut through) are cropped and OCRed, the rest keeps the earlier words
+- otherwise (a re-encoded or rescanned copy) the whole page is OCRed again; the dHash
+  comparison still reports where it changed and what the text was before
+
+apply_evidence() reports the changed regions and the text that changed in them. A
+resubmission that keeps the account (or name) of the earlier one but changes its amount or
+payee is scored as FORGED; one that only changes text elsewhere is POSSIBLE. A page that
+matches an earlier one with a different account is just the same slip template and adds no
+evidence.
+
+Configuration:
+- LEGALDOC_SUBMISSIONS: store path (default .cache/submissions.sqlite); "off" disables it
+"""
+import os, json, time, hashlib
+
+from src.ocr.tesseract_ocr import _safe_imports
+from src.ocr.orchestrator import CONF_SCALE
+from src.common import metrics
+from src.common.sqlite import SqliteStore, default_instance
+from src.common.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+GRID = (16, 12)         # tile rows, cols
+HASH_SIZE = 8           # dHash bits per tile row / column (64-bit tile hashes)
+DHASH_MARGIN = 2
+GLOBAL_BITS = 12        # whole-page hash distance for a candidate
+TILE_BITS = 3           # a tile with more differing bits than this has visibly changed
+MAX_CHANGED = 0.35      # more changed tiles than this share: a different page, OCR it all
+DIGEST_SIZE = 8         # bytes of the exact per-tile pixel digest
+MAX_CANDIDATES = 32
+PAD = 6                 # pixels around a changed region when cropping it for OCR
+_MASK64 = (1 << 64) - 1
+
+class TileHashes:
+    __slots__ = ("width", "height", "page", "tiles", "digests")
+
+    def __init__(self, width, height, page, tiles, digests):
+        # page: 64-bit int; tiles: uint8 array (rows, cols, HASH_SIZE**2 / 8) of packed bits;
+        # digests: uint8 array (rows, cols, DIGEST_SIZE), blake2b of each tile's raw pixels
+        self.width, self.height, self.page, self.tiles, self.digests = width, height, page, tiles, digests
+
+class Match:
+    """An earlier submission this page nearly duplicates, and where the two differ."""
+    __slots__ = ("id", "changed_tiles", "regions", "prior_ocr", "changed_text")
+
+    def __init__(self, id, changed_tiles, regions, prior_ocr, changed_text):
+        self.id, self.changed_tiles, self.regions = id, changed_tiles, regions
+        self.prior_ocr, self.changed_text = prior_ocr, changed_text
+
+def _gray(img):
+    img = np.asarray(img)
+    if img.ndim == 2:
+        return img
+    _, cv2, _ = _safe_imports()
+    if cv2 is not None:
+        return cv2.cvtColor(img[:, :, :3], cv2.COLOR_RGB2GRAY)
+    return (img[:, :, :3] @ np.array([0.299, 0.587, 0.114])).astype(np.uint8)
+
+def _resize(gray, w, h):
+    _, cv2, Image = _safe_imports()
+    if cv2 is not None:
+        return cv2.resize(gray, (w, h), interpolation=cv2.INTER_AREA)
+    return np.asarray(Image.fromarray(gray).resize((w, h), Image.BOX))
+
+def _dhash_bits(small, rows, cols, hs):
+    t = small.astype(np.int16).reshape(rows, hs, cols, hs + 1).transpose(0, 2, 1, 3)
+    return (t[..., 1:] - t[..., :-1]) > DHASH_MARGIN
+
+def _tile_edges(width, height, grid):
+    rows, cols = grid
+    return (np.linspace(0, height, rows + 1).round().astype(int).tolist(),
+            np.linspace(0, width, cols + 1).round().astype(int).tolist())
+
+def _digests(img, grid):
+    img = np.asarray(img)
+    ys, xs = _tile_edges(img.shape[1], img.shape[0], grid)
+    shape = repr(img.shape).encode("ascii")
+    out = np.zeros(tuple(grid) + (DIGEST_SIZE,), dtype=np.uint8)
+    for r in range(grid[0]):
+        band = img[ys[r]:ys[r + 1]]
+        for c in range(grid[1]):
+            h = hashlib.blake2b(shape, digest_size=DIGEST_SIZE)
+            h.update(np.ascontiguousarray(band[:, xs[c]:xs[c + 1]]))
+            out[r, c] = np.frombuffer(h.digest(), dtype=np.uint8)
+    return out
+
+def tile_hashes(img, grid=GRID):
+    gray = _gray(img)
+    rows, cols = grid
+    hs = HASH_SIZE
+    small = _resize(gray, cols * (hs + 1), rows * hs)
+    tiles = np.packbits(_dhash_bits(small, rows, cols, hs).reshape(rows, cols, -1), axis=-1)
+    page = np.packbits(_dhash_bits(_resize(small, 9, 8), 1, 1, 8).ravel())
+    return TileHashes(gray.shape[1], gray.shape[0], int.from_bytes(page.tobytes(), "big"), tiles,
+                      _digests(img, grid))
+
+def _popcount(x):
+    return bin(x).count("1")
+
+def changed_mask(a, b):
+    """Bool (rows, cols): tiles whose hashes differ by more than TILE_BITS bits."""
+    return np.unpackbits(a ^ b, axis=-1).sum(axis=-1) > TILE_BITS
+
+def stale_mask(a, b):
+    """Bool (rows, cols): tiles whose pixels are not exactly the same (every tile without digests b)."""
+    if b is None:
+        return np.ones(a.shape[:2], dtype=bool)
+    return (a != b).any(axis=-1)
+
+def _signed(v):
+    return v - (1 << 64) if v >= 1 << 63 else v
+
+def _bands(page):
+    return [(i, (page >> (8 * i)) & 0xFF) for i in range(8)]
+
+class SubmissionStore(SqliteStore):
+    def __init__(self, path, max_rows=200000):
+        super().__init__(path)
+        self.max_rows = int(max_rows)
+        with self._conn() as c:
+            c.execute("CREATE TABLE IF NOT EXISTS submissions (id INTEGER PRIMARY KEY, width INTEGER, height INTEGER, "
+                      "page INTEGER, grid TEXT, tiles BLOB, ocr TEXT, engine TEXT, created REAL)")
+            c.execute("CREATE TABLE IF NOT EXISTS bands (band INTEGER, value INTEGER, id INTEGER, "
+                      "PRIMARY KEY (band, value, id)) WITHOUT ROWID")
+            if "digests" not in [r[1] for r in c.execute("PRAGMA table_info(submissions)")]:
+                # stores written before the exact digests: their rows are never reused, only compared
+                c.execute("ALTER TABLE submissions ADD COLUMN digests BLOB")
+
+    def find(self, hashes):
+        """
+        (id, changed mask, stale mask, prior OCR scaled to this page, engine) for the closest
+        near-duplicate, or None. changed: dHash differs by more than TILE_BITS; stale: the tile's
+        pixels differ at all (its earlier OCR must not be reused).
+        """
+        rows, cols = hashes.tiles.shape[:2]
+        grid = f"{rows}x{cols}"
+        try:
+            c = self._conn()
+            q = " UNION ".join(["SELECT id FROM bands WHERE band=? AND value=?"] * 8)
+            ids = [r[0] for r in c.execute(q, [v for bv in _bands(hashes.page) for v in bv])]
+            if not ids:
+                return None
+            cands = []
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                cands += c.execute(f"SELECT id, width, height, page FROM submissions WHERE grid=? AND id IN "
+                                   f"({','.join('?' * len(chunk))})", [grid] + chunk).fetchall()
+            aspect = hashes.width / float(hashes.height)
+            cands = [(_popcount((p & _MASK64) ^ hashes.page), -i) for i, w, h, p in cands
+                     if abs(w / float(h) - aspect) <= 0.01 * aspect and _popcount((p & _MASK64) ^ hashes.page) <= GLOBAL_BITS]
+            best = None
+            for _, neg_id in sorted(cands)[:MAX_CANDIDATES]:
+                sid = -neg_id
+                w, h, blob, digests, ocr, engine = c.execute(
+                    "SELECT width, height, tiles, digests, ocr, engine FROM submissions WHERE id=?", (sid,)).fetchone()
+                mask = changed_mask(hashes.tiles, np.frombuffer(blob, dtype=np.uint8).reshape(hashes.tiles.shape))
+                prior = None if digests is None else np.frombuffer(digests, dtype=np.uint8).reshape(hashes.digests.shape)
+                stale = stale_mask(hashes.digests, prior)
+                rank = (int(stale.sum()), int(mask.sum()))
+                if best is None or rank < best[0]:
+                    best = (rank, sid, mask, stale, w, h, ocr, engine)
+                    if not stale.any():
+                        break
+        except Exception as e:
+            print("SubmissionStore.find failed:", repr(e))
+            return None
+        if best is None:
+            return None
+        _, sid, mask, stale, w, h, ocr, engine = best
+        return sid, mask, stale, _scale_ocr(json.loads(ocr), hashes.width / float(w), hashes.height / float(h)), engine
+
+    def add(self, hashes, ocr, engine):
+        from src.ocr.ocr_cache import _normalize
+        rows, cols = hashes.tiles.shape[:2]
+        value = json.dumps(_normalize(ocr), ensure_ascii=False, separators=(",", ":"))
+        try:
+            c = self._conn()
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                cur = c.execute("INSERT INTO submissions(width, height, page, grid, tiles, digests, ocr, engine, created) "
+                                "VALUES (?,?,?,?,?,?,?,?,?)",
+                                (hashes.width, hashes.height, _signed(hashes.page), f"{rows}x{cols}",
+                                 hashes.tiles.tobytes(), hashes.digests.tobytes(), value, engine, time.time()))
+                sid = cur.lastrowid
+                c.executemany("INSERT INTO bands(band, value, id) VALUES (?,?,?)",
+                              [(b, v, sid) for b, v in _bands(hashes.page)])
+                self._evict(c, sid)
+                c.execute("COMMIT")
+            except Exception:
+                c.execute("ROLLBACK")
+                raise
+            return sid
+        except Exception as e:
+            print("SubmissionStore.add failed:", repr(e))
+            return None
+
+    def _evict(self, c, last_id):
+        # ids only grow, so the oldest rows are the lowest ids; trim to 90% of the bound
+        if last_id % 1000 or c.execute("SELECT COUNT(*) FROM submissions").fetchone()[0] <= self.max_rows:
+            return
+        cutoff = c.execute("SELECT id FROM submissions ORDER BY id DESC LIMIT 1 OFFSET ?",
+                           (int(self.max_rows * 0.9),)).fetchone()[0]
+        c.execute("DELETE FROM bands WHERE id<=?", (cutoff,))
+        c.execute("DELETE FROM submissions WHERE id<=?", (cutoff,))
+
+    def clear(self):
+        c = self._conn()
+        c.execute("DELETE FROM bands")
+        c.execute("DELETE FROM submissions")
+
+def _scale_ocr(ocr, sx, sy):
+    if abs(sx - 1.0) < 1e-6 and abs(sy - 1.0) < 1e-6:
+        return ocr
+    return [dict(it, box=[[p[0] * sx, p[1] * sy] for p in it["box"]]) for it in ocr]
+
+def _bounds(box):
+    xs = [p[0] for p in box]; ys = [p[1] for p in box]
+    return min(xs), min(ys), max(xs), max(ys)
+
+def _hits(b, r):
+    return b[0] < r[2] and r[0] < b[2] and b[1] < r[3] and r[1] < b[3]
+
+def _regions(mask, width, height, prior_bounds):
+    """Pixel rectangles [x0, y0, x1, y1] covering the changed tiles and every word they touch."""
+    ys, xs = _tile_edges(width, height, mask.shape)
+    rects = [[int(xs[c]), int(ys[r]), int(xs[c + 1]), int(ys[r + 1])] for r, c in zip(*np.nonzero(mask))]
+    changed = True
+    while changed:
+        changed = False
+        for b in prior_bounds:
+            for r in rects:
+                if _hits(b, r) and not (r[0] <= b[0] and r[1] <= b[1] and b[2] <= r[2] and b[3] <= r[3]):
+                    r[0], r[1] = min(r[0], int(b[0])), min(r[1], int(b[1]))
+                    r[2], r[3] = max(r[2], int(np.ceil(b[2]))), max(r[3], int(np.ceil(b[3])))
+                    changed = True
+        # merge rectangles that now overlap (or touch)
+        merged = []
+        for r in sorted(rects):
+            for m in merged:
+                if r[0] <= m[2] and m[0] <= r[2] and r[1] <= m[3] and m[1] <= r[3]:
+                    m[0], m[1], m[2], m[3] = min(m[0], r[0]), min(m[1], r[1]), max(m[2], r[2]), max(m[3], r[3])
+                    changed = True
+                    break
+            else:
+                merged.append(list(r))
+        rects = merged
+    return [[max(0, r[0] - PAD), max(0, r[1] - PAD), min(width, r[2] + PAD), min(height, r[3] + PAD)] for r in rects]
+
+def _reading_order(ocr):
+    """Top-to-bottom lines (centres within half a box height of the line's first word), left to right."""
+    items = sorted(((_bounds(it["box"]), it) for it in ocr), key=lambda e: e[0][1] + e[0][3])
+    lines, out = [], []
+    for b, it in items:
+        cy, hh = (b[1] + b[3]) / 2.0, (b[3] - b[1]) / 2.0
+        if lines and abs(cy - lines[-1][0]) <= max(hh, lines[-1][1]):
+            lines[-1][2].append((b, it))
+        else:
+            lines.append((cy, hh, [(b, it)]))
+    for _, _, words in lines:
+        out += [it for _, it in sorted(words, key=lambda e: e[0][0])]
+    return out
+
+def _words(items):
+    return " ".join((it.get("text") or "").strip() for it in _reading_order(items) if (it.get("text") or "").strip())
+
+def _placed(ocr):
+    return [it for it in ocr or [] if it.get("box")]
+
+def incremental_ocr(img, ocr_fn, store=None):
+    """
+    img: the buffer to recognise; ocr_fn(array) -> (ocr_list, engine). Near-duplicates of an
+    earlier submission in `store` only have the tiles whose pixels changed OCRed. Every page
+    is added to the store (exact repeats are not stored twice).
+    Returns (ocr_list, engine, Match or None).
+    """
+    store = get_default_store() if store is None else store
+    if not store:
+        ocr, engine = ocr_fn(img)
+        return ocr, engine, None
+    with metrics.timer("ocr.incremental.hash"):
+        hashes = tile_hashes(img)
+        found = store.find(hashes)
+    if found is not None:
+        sid, mask, stale, prior, prior_engine = found
+        if prior and not stale.any():
+            metrics.incr("resubmissions", kind="identical")
+            return prior, prior_engine, Match(sid, 0, [], prior, [])
+        if prior and mask.mean() <= MAX_CHANGED:
+            h, w = hashes.height, hashes.width
+            bounds = [_bounds(it["box"]) for it in prior]
+            ocr = None
+            if stale.mean() <= MAX_CHANGED:
+                regions = _regions(stale, w, h, bounds)
+                if sum((r[2] - r[0]) * (r[3] - r[1]) for r in regions) <= 0.6 * w * h:
+                    metrics.incr("resubmissions", kind="changed")
+                    metrics.incr("ocr_tiles_reocr", int(stale.sum()))
+                    keep = [it for it, b in zip(prior, bounds) if not any(_hits(b, r) for r in regions)]
+                    scale = CONF_SCALE.get(prior_engine, 1.0)
+                    fresh = []
+                    for x0, y0, x1, y1 in regions:
+                        part, engine = ocr_fn(np.ascontiguousarray(img[y0:y1, x0:x1]))
+                        f = CONF_SCALE.get(engine, 1.0)
+                        fresh += [dict(it, box=[[p[0] + x0, p[1] + y0] for p in it["box"]],
+                                       conf=float(it.get("conf") or 0.0) / f * scale) for it in _placed(part)]
+                    ocr, engine, changed = _reading_order(keep + fresh), "incremental", stale
+            if ocr is None:
+                # same slip, but not pixel-identical enough to reuse anything: OCR it all again
+                metrics.incr("resubmissions", kind="reocr")
+                ocr, engine = ocr_fn(img)
+                changed = mask if mask.any() else stale
+                regions = _regions(changed, w, h, bounds)
+            placed = _placed(ocr)
+            changed_text = []
+            for r in regions:
+                old = _words([it for it, b in zip(prior, bounds) if _hits(b, r)])
+                new = _words([it for it in placed if _hits(_bounds(it["box"]), r)])
+                if old != new:
+                    changed_text.append((old, new))
+            if ocr:
+                store.add(hashes, ocr, prior_engine if engine == "incremental" else engine)
+            return ocr, engine, Match(sid, int(changed.sum()), regions, prior, changed_text)
+    metrics.incr("resubmissions", kind="none")
+    ocr, engine = ocr_fn(img)
+    if ocr:
+        store.add(hashes, ocr, engine)
+    return ocr, engine, None
+
+def ocr_prepared(prepared, ocr_fn, store=None):
+    """incremental_ocr() on a PreparedImage's buffer, with OCR boxes and changed regions in original pixels."""
+    ocr, engine, match = incremental_ocr(prepared.ocr, ocr_fn, store)
+    if match is not None:
+        quads = [{"box": [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]} for x0, y0, x1, y1 in match.regions]
+        match.regions = [[int(v) for v in _bounds(q["box"])] for q in prepared.to_original(quads)]
+        match.prior_ocr = prepared.to_original(match.prior_ocr)
+    return prepared.to_original(ocr), engine, match
+
+def apply_evidence(result, match):
+    """Add resubmission evidence from `match` to a predict() result (in place) and return it."""
+    if match is None or not match.changed_tiles:
+        return result
+    from src.forgery.forgery_detector import extract_fields_from_ocr, label_for_score
+    prior = extract_fields_from_ocr(match.prior_ocr)
+    fields = result.get("fields") or {}
+    acc, prior_acc = fields.get("account"), prior.get("account")
+    if acc and prior_acc and acc != prior_acc:
+        return result  # same template, different slip
+    if not (acc and prior_acc) and fields.get("name") and prior.get("name") and fields["name"] != prior["name"]:
+        return result
+    evidence = result.setdefault("evidence", [])
+    evidence.append(f"resubmission_of:{match.id}")
+    evidence.append(f"changed_regions:{match.regions}")
+    if match.changed_text:
+        evidence.append("changed_text:" + str([f"{old}->{new}" for old, new in match.changed_text]))
+    score = result.get("score", 0.0)
+    amounts, prior_amounts = sorted(set(fields.get("amounts") or [])), sorted(set(prior.get("amounts") or []))
+    if amounts != prior_amounts:
+        evidence.append(f"resubmission_amount_changed:{prior_amounts}->{amounts}")
+        score = max(score, 0.85)
+    elif acc and prior_acc and fields.get("name") != prior.get("name"):
+        evidence.append(f"resubmission_name_changed:{prior.get('name')}->{fields.get('name')}")
+        score = max(score, 0.75)
+    elif match.changed_text:
+        score = max(score, 0.45)
+    result["score"] = round(float(score), 3)
+    result["label"] = label_for_score(score)
+    return result
+
+def get_default_store():
+    return default_instance("LEGALDOC_SUBMISSIONS", os.path.join(".cache", "submissions.sqlite"), SubmissionStore,
+                            "Submission store")
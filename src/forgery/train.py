@@ -0,0 +1,123 @@
+"""
+Fit the forgery classifier on labelled OCR and persist it for the detector.
+
+Usage:
+    python -m src.forgery.train                                  # 2000 synthetic slips
+    python -m src.forgery.train --synthetic 0 --jsonl labelled.jsonl [--jsonl more.jsonl]
+    python -m src.forgery.train --synthetic 5000 --trees 300 -o models/forgery_clf.pkl
+
+JSONL records need "ocr" (the usual list of {"box","text","conf"}) and a label: "forged"
+(true/false, as written by src/bench/synth_slips.py) or "label" ("FORGED"/"CLEAN", 1/0).
+Synthetic slips come from src/bench/synth_slips.py.
+
+The model is a RandomForestClassifier over src/forgery/features.py. A stratified hold-out
+split is scored (accuracy, precision, recall, ROC AUC) before the final model is fitted on
+all data. The file is replaced atomically, so a running detector hot-reloads the new
+model (see model_registry.py) and never sees a half-written file.
+"""
+import os, sys, json, argparse
+import numpy as np
+import joblib
+
+from src.forgery.features import features_matrix, FEATURE_NAMES
+from src.forgery.forgery_detector import MODEL_PATH
+
+def _label(rec):
+    if "forged" in rec:
+        return bool(rec["forged"])
+    lab = rec.get("label")
+    if isinstance(lab, str):
+        return lab.strip().upper() == "FORGED"
+    return bool(lab)
+
+def load_jsonl(path):
+    ocrs, labels = [], []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            rec = json.loads(line)
+            if "ocr" not in rec or ("forged" not in rec and "label" not in rec):
+                continue
+            ocrs.append(rec["ocr"])
+            labels.append(_label(rec))
+    return ocrs, labels
+
+def synthetic(n, seed=0):
+    from src.bench.synth_slips import generate
+    ocrs, labels = [], []
+    # pixel noise doesn't change the word boxes, so skip it (and the PNG encode) for speed
+    for s in generate(n, seed, noise=False, png=False):
+        ocrs.append(s["ocr"])
+        labels.append(s["forged"])
+    return ocrs, labels
+
+def make_model(trees=100, seed=0):
+    from sklearn.ensemble import RandomForestClassifier
+    return RandomForestClassifier(n_estimators=trees, min_samples_leaf=2, class_weight="balanced",
+                                  n_jobs=-1, random_state=seed)
+
+def evaluate(X, y, trees=100, seed=0, test_size=0.2):
+    from sklearn.model_selection import train_test_split
+    from sklearn.metrics import accuracy_score, precision_score, recall_score, roc_auc_score
+    if len(set(y.tolist())) < 2 or len(y) < 10:
+        return None
+    Xtr, Xte, ytr, yte = train_test_split(X, y, test_size=test_size, random_state=seed, stratify=y)
+    clf = make_model(trees, seed).fit(Xtr, ytr)
+    prob = clf.predict_proba(Xte)[:, 1]
+    pred = prob >= 0.5
+    return {"test_docs": int(len(yte)), "accuracy": round(float(accuracy_score(yte, pred)), 4),
+            "precision": round(float(precision_score(yte, pred, zero_division=0)), 4),
+            "recall": round(float(recall_score(yte, pred, zero_division=0)), 4),
+            "roc_auc": round(float(roc_auc_score(yte, prob)), 4)}
+
+def save_model(clf, path=MODEL_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp{os.getpid()}"
+    joblib.dump(clf, tmp)
+    os.replace(tmp, path)
+    return path
+
+def train(ocrs, labels, out_path=MODEL_PATH, trees=100, seed=0, test_size=0.2):
+    """Fit on (ocrs, labels), save to out_path and return (clf, report)."""
+    X = features_matrix(ocrs)
+    y = np.asarray(labels, dtype=int)
+    if len(set(y.tolist())) < 2:
+        raise ValueError("training data needs both forged and clean documents")
+    report = {"docs": int(len(y)), "forged": int(y.sum()), "features": list(FEATURE_NAMES),
+              "holdout": evaluate(X, y, trees, seed, test_size) if test_size else None}
+    clf = make_model(trees, seed).fit(X, y)
+    clf.legaldoc_features = FEATURE_NAMES
+    # fitted on all cores; scoring is a few documents per call, where worker threads only add latency
+    clf.n_jobs = 1
+    if out_path:
+        report["model_path"] = save_model(clf, out_path)
+    imp = sorted(zip(FEATURE_NAMES, clf.feature_importances_), key=lambda x: -x[1])
+    report["top_features"] = {k: round(float(v), 4) for k, v in imp[:8]}
+    return clf, report
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Train and persist the forgery classifier.")
+    ap.add_argument("--synthetic", type=int, default=2000, help="synthetic slips to generate (0 = none)")
+    ap.add_argument("--jsonl", action="append", default=[], help="labelled OCR JSONL (repeatable)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--trees", type=int, default=100)
+    ap.add_argument("--test-size", type=float, default=0.2, help="hold-out share for the report (0 = skip)")
+    ap.add_argument("-o", "--out", default=MODEL_PATH)
+    args = ap.parse_args(argv)
+    ocrs, labels = [], []
+    for path in args.jsonl:
+        o, l = load_jsonl(path)
+        ocrs += o; labels += l
+    if args.synthetic:
+        o, l = synthetic(args.synthetic, args.seed)
+        ocrs += o; labels += l
+    if not ocrs:
+        print("train: no training data (use --synthetic N and/or --jsonl FILE)", file=sys.stderr)
+        return 1
+    _, report = train(ocrs, labels, args.out, args.trees, args.seed, args.test_size)
+    print(json.dumps(report, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
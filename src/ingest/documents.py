@@ -0,0 +1,260 @@
+"""
+Multi-page document ingestion (PDF, multi-frame TIFF, plain images).
+
+Provides:
+- iter_pages(src, dpi=200, text_layer=True) -> lazy iterator of Page(index, image, ocr) (src: path or file bytes)
+- iter_page_results(src, workers=None, ...) -> per-page results, in page order, as they finish
+- analyze_document(src, workers=None, ...) -> per-document verdict with per-page evidence
+- aggregate(page_results) -> the document verdict from page results
+
+Usage:
+    python -m src.ingest.documents statement.pdf [-j WORKERS] [--dpi 200] [--policy first]
+
+Pages are decoded (PDF pages rendered at `dpi`) one at a time and handed to a pool of OCR
+worker processes. At most `2 * workers` pages are rendered or in flight at any moment, so
+memory stays bounded whatever the page count. Each page goes through prepare, run_ocr and
+predict, and only the small per-page result is kept. workers=0 runs everything in the
+calling process (the Streamlit app does this).
+
+Born-digital PDF pages skip rendering and OCR: their words and boxes come straight from the
+text layer (src/ingest/pdf_text.py) and are scored in the calling process. Only pages without
+a usable text layer are rasterised and OCRed. Pass text_layer=False to OCR every page.
+
+PDF support needs PyMuPDF (pip install pymupdf); TIFF and images need Pillow.
+"""
+import os, io, json, time, argparse
+from collections import deque
+
+from src.ocr.tesseract_ocr import _safe_imports
+from src.common.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+PDF_EXTS = (".pdf",)
+TIFF_EXTS = (".tif", ".tiff")
+DOCUMENT_EXTS = PDF_EXTS + TIFF_EXTS
+
+_PDF = None
+
+def _pdf_module():
+    """PyMuPDF module (imported as pymupdf, or fitz on older releases), or None."""
+    global _PDF
+    if _PDF is None:
+        try:
+            import pymupdf as _m
+        except Exception:
+            try:
+                import fitz as _m
+            except Exception:
+                _m = False
+        _PDF = _m
+    return _PDF or None
+
+class Page:
+    """A page to score: `ocr` is set (and `image` None) when words came from the PDF text layer."""
+    __slots__ = ("index", "image", "ocr")
+
+    def __init__(self, index, image, ocr=None):
+        self.index, self.image, self.ocr = index, image, ocr
+
+def _head(src):
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        return bytes(src[:8])
+    with open(src, "rb") as f:
+        return f.read(8)
+
+def sniff(src):
+    """'pdf', 'tiff' or 'image' from the file's magic bytes."""
+    head = _head(src)
+    if head.startswith(b"%PDF"):
+        return "pdf"
+    if head[:4] in (b"II*\x00", b"MM\x00*", b"II+\x00", b"MM\x00+"):
+        return "tiff"
+    return "image"
+
+def _open_pdf(src):
+    pdf = _pdf_module()
+    if pdf is None:
+        raise RuntimeError("PDF support needs PyMuPDF (pip install pymupdf)")
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        return pdf.open(stream=bytes(src), filetype="pdf")
+    return pdf.open(os.fspath(src))
+
+def _render(page, dpi):
+    pix = page.get_pixmap(dpi=dpi, alpha=False)
+    arr = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    if pix.n == 1:
+        return arr[:, :, 0]
+    return arr[:, :, :3]
+
+def _pdf_pages(src, dpi, text_layer=True):
+    from src.ingest.pdf_text import page_words, has_text_layer
+    doc = _open_pdf(src)
+    tools = getattr(_pdf_module(), "TOOLS", None)
+    try:
+        for i in range(doc.page_count):
+            page = doc.load_page(i)
+            if text_layer:
+                words = page_words(page, dpi)
+                if has_text_layer(words):
+                    yield Page(i, None, words)
+                    continue
+            image = _render(page, dpi)
+            if tools is not None:
+                # MuPDF keeps decoded page resources in a global store (up to 256 MB); drop them per page
+                tools.store_shrink(100)
+            yield Page(i, image)
+    finally:
+        doc.close()
+
+def _tiff_pages(src):
+    _, _, Image = _safe_imports()
+    if Image is None:
+        raise RuntimeError("Pillow not available; cannot read TIFF")
+    from PIL import ImageSequence
+    fp = io.BytesIO(bytes(src)) if isinstance(src, (bytes, bytearray, memoryview)) else os.fspath(src)
+    with Image.open(fp) as im:
+        for i, frame in enumerate(ImageSequence.Iterator(im)):
+            yield Page(i, np.asarray(frame.convert("RGB")))
+
+def iter_pages(src, dpi=200, text_layer=True):
+    kind = sniff(src)
+    if kind == "pdf":
+        return _pdf_pages(src, dpi, text_layer)
+    if kind == "tiff":
+        return _tiff_pages(src)
+    from src.ocr.preprocess import decode_image
+    return iter([Page(0, decode_image(src))])
+
+def count_pages(src):
+    kind = sniff(src)
+    if kind == "pdf":
+        doc = _open_pdf(src)
+        try:
+            return doc.page_count
+        finally:
+            doc.close()
+    if kind == "tiff":
+        _, _, Image = _safe_imports()
+        fp = io.BytesIO(bytes(src)) if isinstance(src, (bytes, bytearray, memoryview)) else os.fspath(src)
+        with Image.open(fp) as im:
+            return getattr(im, "n_frames", 1)
+    return 1
+
+def _init_worker(engines):
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+    if "paddle" in engines:
+        from src.ocr.ocr_infer import warm_up
+        warm_up()
+
+def process_page(index, image, policy="first", engines=("paddle", "tesseract"), keep_ocr=False, ocr=None):
+    """
+    OCR + scoring for one page image (or scoring only, when `ocr` already holds the page's
+    words). Returns the page result; errors are reported, not raised.
+    """
+    from src.forgery.forgery_detector import predict
+    from src.forgery.resubmission import ocr_prepared, apply_evidence
+    t0 = time.perf_counter()
+    match = None
+    try:
+        if ocr is not None:
+            from src.ingest.pdf_text import ENGINE as engine
+        else:
+            from src.ocr.preprocess import prepare
+            from src.ocr.orchestrator import run_ocr
+            prepared = prepare(image)
+            ocr, engine, match = ocr_prepared(prepared, lambda img: run_ocr(img, engines=engines, policy=policy))
+        res = apply_evidence(predict(ocr), match)
+        out = {"page": index + 1, "label": res["label"], "score": res["score"], "evidence": res["evidence"],
+               "fields": res["fields"], "engine": engine, "tokens": len(ocr)}
+        if keep_ocr:
+            from src.ocr.ocr_result import as_dicts
+            out["ocr"] = as_dicts(ocr)
+    except Exception as e:
+        out = {"page": index + 1, "error": repr(e)}
+    out["elapsed_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    return out
+
+def _done(result):
+    from concurrent.futures import Future
+    fut = Future()
+    fut.set_result(result)
+    return fut
+
+def iter_page_results(src, workers=None, policy="first", engines=("paddle", "tesseract"), dpi=200,
+                      max_pages=None, keep_ocr=False, text_layer=True):
+    pages = iter_pages(src, dpi, text_layer)
+    if max_pages:
+        from itertools import islice
+        pages = islice(pages, max_pages)
+    engines = tuple(engines)
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    if workers <= 0:
+        for page in pages:
+            yield process_page(page.index, page.image, policy, engines, keep_ocr, page.ocr)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    window = deque()
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(engines,)) as pool:
+        for page in pages:
+            if len(window) >= 2 * workers:
+                yield window.popleft().result()
+            if page.ocr is not None:
+                # text-layer pages only need scoring: cheaper here than a round trip to a worker
+                window.append(_done(process_page(page.index, None, policy, engines, keep_ocr, page.ocr)))
+            else:
+                window.append(pool.submit(process_page, page.index, page.image, policy, engines, keep_ocr))
+        while window:
+            yield window.popleft().result()
+
+def aggregate(page_results):
+    from src.forgery.forgery_detector import label_for_score
+    pages = list(page_results)
+    ok = [p for p in pages if "error" not in p]
+    failed = [p["page"] for p in pages if "error" in p]
+    evidence = [f"page_{p['page']}:{e}" for p in ok for e in p.get("evidence", [])]
+    score = max((p["score"] for p in ok), default=0.5)
+    if not pages:
+        evidence.append("no_pages")
+    fields = {"name": None, "account": None, "amounts": []}
+    for p in ok:
+        f = p.get("fields") or {}
+        fields["name"] = fields["name"] or f.get("name")
+        fields["account"] = fields["account"] or f.get("account")
+        fields["amounts"] += f.get("amounts") or []
+    fields["amounts"] = sorted(set(fields["amounts"]))
+    accounts = sorted({(p.get("fields") or {}).get("account") for p in ok} - {None, ""})
+    if len(accounts) > 1:
+        evidence.append(f"account_mismatch_across_pages:{accounts}")
+        score = max(score, 0.7)
+    if failed:
+        evidence.append(f"pages_failed:{failed}")
+        score = max(score, 0.45)
+    flagged = [p["page"] for p in ok if p["label"] != "CLEAN"]
+    return {"label": label_for_score(score), "score": round(float(score), 3), "fields": fields,
+            "evidence": evidence, "page_count": len(pages), "flagged_pages": flagged, "pages": pages}
+
+def analyze_document(src, workers=None, policy="first", engines=("paddle", "tesseract"), dpi=200,
+                     max_pages=None, keep_ocr=False, text_layer=True):
+    """
+    src: path or file bytes (PDF, TIFF or a single image). Returns {"label", "score", "fields",
+    "evidence", "page_count", "flagged_pages", "pages": [per-page results]}.
+    """
+    return aggregate(iter_page_results(src, workers, policy, engines, dpi, max_pages, keep_ocr, text_layer))
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Score a multi-page PDF / TIFF (or a single image) page by page.")
+    ap.add_argument("src")
+    ap.add_argument("-j", "--workers", type=int, default=None, help="OCR worker processes (0 = in-process)")
+    ap.add_argument("--dpi", type=int, default=200, help="PDF render resolution")
+    ap.add_argument("--max-pages", type=int, default=None)
+    ap.add_argument("--policy", default="first", choices=("first", "best_conf", "merge", "fallback"))
+    ap.add_argument("--engines", default="paddle,tesseract")
+    ap.add_argument("--no-text-layer", action="store_true", help="OCR every PDF page, even born-digital ones")
+    args = ap.parse_args(argv)
+    res = analyze_document(args.src, args.workers, args.policy, args.engines.split(","), args.dpi, args.max_pages,
+                           text_layer=not args.no_text_layer)
+    print(json.dumps(res, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
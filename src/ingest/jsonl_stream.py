@@ -0,0 +1,190 @@
+"""
+Streaming scorer for JSONL files of precomputed OCR, in bounded memory.
+
+Provides:
+- iter_chunks(src, chunk=256, max_bytes=8 MB) -> lists of (line_no, raw line), read lazily
+- record_ocr(rec) -> OCR list from one record (None if the record carries no OCR)
+- score_lines(lines, as_dicts=False) -> (output records, errors) for one chunk (parsed and scored)
+- iter_scored(src, workers=None, chunk=256, history=None) -> (JSON lines, errors) per chunk, in input order
+- score_stream(src, dst, workers=None, chunk=256, history=None) -> (records written, errors)
+
+Usage:
+    python -m src.ingest.jsonl_stream ocr.jsonl[.gz] -o verdicts.jsonl [-j WORKERS] [--chunk 256]
+    zcat ocr.jsonl.gz | python -m src.ingest.jsonl_stream - -o - > verdicts.jsonl
+
+Each input line is one record: a bare OCR list, {"ocr": [...]} (the format written by
+src/bench/synth_slips.py and read by src/forgery/train.py) or {"text_lines": [...]} like
+data/demo/*_ocr.json (lines get synthetic word boxes). "id", "path", "request_id" and
+"doc_id" are copied to the output record next to "line" and "result" (the predict() verdict)
+or "error".
+
+The parent process only splits the input into chunks of raw lines. JSON parsing, field
+extraction, predict_batch() and output serialisation run in worker processes, one chunk per
+task. At most 2 * workers chunks are read ahead or in flight, and results are written as soon
+as the oldest chunk is done, so memory stays flat whatever the file size. workers=0 scores
+in the calling process. With a fraud index (history), the checks and inserts run in this
+process, chunk by chunk in input order.
+"""
+import os, sys, io, gzip, json, argparse
+from collections import deque
+
+PASSTHROUGH = ("id", "path", "request_id", "doc_id")
+# synthetic layout for text_lines records: one row per line, words placed by character offset,
+# at the scale of a 200 DPI slip (the extractor's search windows are in those pixels)
+LINE_HEIGHT, TEXT_HEIGHT, CHAR_WIDTH = 170, 46, 28
+
+def _open_in(src):
+    if src == "-":
+        return sys.stdin.buffer
+    if isinstance(src, (str, os.PathLike)):
+        path = os.fspath(src)
+        return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+    return src
+
+def _open_out(dst):
+    if dst == "-":
+        return sys.stdout
+    path = os.fspath(dst)
+    if path.endswith(".gz"):
+        return io.TextIOWrapper(gzip.open(path, "wb"), encoding="utf-8")
+    return open(path, "w", encoding="utf-8")
+
+def iter_chunks(src, chunk=256, max_bytes=8 << 20):
+    """Lists of (line_no, raw bytes); a chunk ends at `chunk` lines or `max_bytes` of text."""
+    f = _open_in(src)
+    try:
+        buf, size = [], 0
+        for no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            buf.append((no, line))
+            size += len(line)
+            if len(buf) >= chunk or size >= max_bytes:
+                yield buf
+                buf, size = [], 0
+        if buf:
+            yield buf
+    finally:
+        if f is not sys.stdin.buffer and f is not src:
+            f.close()
+
+def _lines_to_ocr(lines):
+    out = []
+    for i, line in enumerate(lines):
+        y0, y1 = i * LINE_HEIGHT, i * LINE_HEIGHT + TEXT_HEIGHT
+        col = 0
+        for word in str(line).split(" "):
+            if word:
+                x0, x1 = col * CHAR_WIDTH, (col + len(word)) * CHAR_WIDTH
+                out.append({"box": [[x0, y0], [x1, y0], [x1, y1], [x0, y1]], "text": word, "conf": 1.0})
+            col += len(word) + 1
+    return out
+
+def record_ocr(rec):
+    if isinstance(rec, list):
+        return rec
+    if isinstance(rec, dict):
+        if isinstance(rec.get("ocr"), list):
+            return rec["ocr"]
+        if isinstance(rec.get("text_lines"), list):
+            return _lines_to_ocr(rec["text_lines"])
+    return None
+
+def score_lines(lines, as_dicts=False):
+    """
+    lines: [(line_no, raw bytes)]. Returns (output records as JSON strings, or dicts with
+    as_dicts=True, and the number of error records). Malformed lines become {"line", "error"}.
+    """
+    from src.forgery.forgery_detector import predict_batch
+    outs, ocrs, slots = [], [], []
+    for no, raw in lines:
+        out = {"line": no}
+        try:
+            rec = json.loads(raw)
+            if isinstance(rec, dict):
+                out.update((k, rec[k]) for k in PASSTHROUGH if k in rec)
+            ocr = record_ocr(rec)
+            if ocr is None:
+                raise ValueError("record has no \"ocr\" list or \"text_lines\"")
+            ocrs.append(ocr)
+            slots.append(len(outs))
+        except ValueError as e:
+            out["error"] = str(e)
+        outs.append(out)
+    try:
+        for i, res in zip(slots, predict_batch(ocrs)):
+            outs[i]["result"] = res
+    except Exception:
+        # one bad record must not sink the chunk: score the rest one at a time
+        from src.forgery.forgery_detector import predict
+        for i, ocr in zip(slots, ocrs):
+            try:
+                outs[i]["result"] = predict(ocr)
+            except Exception as e:
+                outs[i]["error"] = repr(e)
+    errors = sum("error" in o for o in outs)
+    if as_dicts:
+        return outs, errors
+    return [json.dumps(o, ensure_ascii=False) for o in outs], errors
+
+def _init_worker():
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+
+def _finish(scored, history):
+    outs, errors = scored
+    if history is not None:
+        history.correlate([o["result"] for o in outs if "result" in o])
+        outs = [json.dumps(o, ensure_ascii=False) for o in outs]
+    return outs, errors
+
+def iter_scored(src, workers=None, chunk=256, history=None):
+    """(output JSON lines, error count) per chunk, in input order."""
+    as_dicts = history is not None
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    if workers <= 0:
+        for lines in iter_chunks(src, chunk):
+            yield _finish(score_lines(lines, as_dicts), history)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    window = deque()
+    with ProcessPoolExecutor(workers, initializer=_init_worker) as pool:
+        for lines in iter_chunks(src, chunk):
+            if len(window) >= 2 * workers:
+                yield _finish(window.popleft().result(), history)
+            window.append(pool.submit(score_lines, lines, as_dicts))
+        while window:
+            yield _finish(window.popleft().result(), history)
+
+def score_stream(src, dst, workers=None, chunk=256, history=None):
+    out = _open_out(dst)
+    n = errors = 0
+    try:
+        for lines, bad in iter_scored(src, workers, chunk, history):
+            out.write("\n".join(lines) + "\n")
+            n += len(lines)
+            errors += bad
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        else:
+            out.flush()
+    return n, errors
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Score a JSONL stream of precomputed OCR records.")
+    ap.add_argument("src", help="input JSONL (.gz ok), or - for stdin")
+    ap.add_argument("-o", "--out", default="-", help="output JSONL (.gz ok), or - for stdout")
+    ap.add_argument("-j", "--workers", type=int, default=None, help="worker processes (0 = in-process)")
+    ap.add_argument("--chunk", type=int, default=256, help="records per worker task")
+    ap.add_argument("--history", action="store_true", help="check and record slips in the fraud index")
+    args = ap.parse_args(argv)
+    history = None
+    if args.history:
+        from src.forgery.fraud_index import get_default_index
+        history = get_default_index()
+    n, errors = score_stream(args.src, args.out, args.workers, args.chunk, history)
+    print(f"{n} records scored, {errors} errors", file=sys.stderr)
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
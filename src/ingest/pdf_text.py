@@ -0,0 +1,30 @@
+"""
+Words straight from the text layer of born-digital PDFs (no rendering, no OCR).
+
+Provides:
+- page_words(page, dpi=200) -> list of {"box": [[x,y] x4], "text": str, "conf": 1.0}
+- has_text_layer(words, min_words=3) -> whether a page's text layer is worth using
+
+Boxes are reported in the pixel space of the page rendered at `dpi` (the same space the
+raster OCR path produces, and the one the extractor's distance thresholds are tuned for),
+with page rotation applied. Confidence is 1.0: the text is what the PDF says it is.
+"""
+from src.ingest.documents import _pdf_module
+
+ENGINE = "pdf_text"
+
+def page_words(page, dpi=200):
+    pdf = _pdf_module()
+    m = page.rotation_matrix * pdf.Matrix(dpi / 72.0, dpi / 72.0)
+    out = []
+    for x0, y0, x1, y1, text, *_ in page.get_text("words", sort=True):
+        text = text.strip()
+        if not text:
+            continue
+        r = pdf.Rect(x0, y0, x1, y1) * m
+        l, t, rr, b = int(round(r.x0)), int(round(r.y0)), int(round(r.x1)), int(round(r.y1))
+        out.append({"box": [[l, t], [rr, t], [rr, b], [l, b]], "text": text, "conf": 1.0})
+    return out
+
+def has_text_layer(words, min_words=3):
+    return words is not None and len(words) >= min_words
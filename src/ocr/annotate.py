@@ -0,0 +1,249 @@
+"""
+Annotated page images: OCR boxes drawn on an already-decoded buffer, coloured by the verdict.
+
+Provides:
+- suspicious_mask(ocr, result=None) -> bool array, True for the words the evidence points at
+- changed_regions(result) -> [[x0,y0,x1,y1]] from a "changed_regions:" evidence string
+- render(image, ocr, result=None, max_side=None, labels="suspicious") -> RGB array with boxes drawn
+- encode(img, fmt="png", out_path=None) -> out_path, or an in-memory image (BytesIO)
+- to_svg(ocr, size, result=None, background=None, labels="suspicious") -> SVG overlay (str)
+- annotate(image, ocr, result=None, fmt=None, max_side=None, out_path=None, labels="suspicious")
+
+Colours: suspicious words red, changed regions of a resubmitted slip amber, everything else
+green. A word is suspicious when the verdict (predict() result) has evidence about it:
+- multiple_amounts_detected / resubmission_amount_changed / image_amount_conflict: words
+  carrying one of the amounts in result["fields"]["amounts"]
+- account_name_conflict / resubmission_name_changed: words of the extracted name
+- image_account_conflict: the account number
+- changed_regions: words inside one of the regions
+
+All boxes of one colour go to OpenCV in a single polylines() call, and the image is scaled
+down to `max_side` before drawing rather than after. Text labels (the slow part on dense
+pages) are drawn for suspicious words only unless labels="all". PNGs are written with fast
+zlib settings. fmt="svg" returns a vector overlay in original pixel coordinates on top of an
+embedded JPEG thumbnail, usually much smaller than a full-resolution PNG.
+Without OpenCV the same drawing falls back to Pillow, with fonts loaded once per process.
+"""
+import io, re, json, base64
+from functools import lru_cache
+from xml.sax.saxutils import escape
+
+from src.ocr.ocr_result import as_result
+from src.ocr.tesseract_ocr import _safe_imports
+from src.common import metrics
+from src.common.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+GREEN, RED, AMBER = (0, 200, 0), (230, 0, 0), (255, 160, 0)
+LABEL_CHARS = 30
+AMOUNT_EVIDENCE = ("multiple_amounts_detected", "resubmission_amount_changed", "image_amount_conflict")
+NAME_EVIDENCE = ("account_name_conflict", "resubmission_name_changed")
+ACCOUNT_EVIDENCE = ("image_account_conflict",)
+SVG_BACKGROUND_SIDE = 1024
+
+_re_nondigit = re.compile(r"[^\d]")
+_re_date = re.compile(r"^\d{4}[-/]\d{2}[-/]\d{2}$")
+
+def _kinds(result):
+    return {str(e).split(":", 1)[0] for e in (result or {}).get("evidence") or []}
+
+def changed_regions(result):
+    for e in (result or {}).get("evidence") or []:
+        if str(e).startswith("changed_regions:"):
+            try:
+                return [[int(v) for v in r[:4]] for r in json.loads(e.split(":", 1)[1])]
+            except (ValueError, TypeError):
+                return []
+    return []
+
+def suspicious_mask(ocr, result=None):
+    res = as_result(ocr)
+    bad = np.zeros(len(res), dtype=bool)
+    if not result or not len(res):
+        return bad
+    kinds = _kinds(result)
+    fields = result.get("fields") or {}
+    amounts = {int(a) for a in fields.get("amounts") or []} if kinds.intersection(AMOUNT_EVIDENCE) else set()
+    name = set(str(fields.get("name") or "").upper().split()) if kinds.intersection(NAME_EVIDENCE) else set()
+    account = _re_nondigit.sub("", str(fields.get("account") or "")) if kinds.intersection(ACCOUNT_EVIDENCE) else ""
+    if amounts or name or account:
+        for i, t in enumerate(res.texts):
+            t = t.strip()
+            digits = _re_nondigit.sub("", t)
+            if amounts and 2 <= len(digits) < 8 and not _re_date.match(t) and int(digits) in amounts:
+                bad[i] = True
+            elif name and t.upper().strip(":") in name:
+                bad[i] = True
+            elif account and len(digits) >= 6 and digits in account:
+                bad[i] = True
+    regions = changed_regions(result)
+    if regions:
+        c = res.centroids
+        for x0, y0, x1, y1 in regions:
+            bad |= (c[:, 0] >= x0) & (c[:, 0] <= x1) & (c[:, 1] >= y0) & (c[:, 1] <= y1)
+    return bad & res.has_box
+
+def _rect_quads(regions):
+    return np.array([[[x0, y0], [x1, y0], [x1, y1], [x0, y1]] for x0, y0, x1, y1 in regions],
+                    dtype=np.float64).reshape(-1, 4, 2)
+
+def _label_rows(res, bad, labels):
+    if labels == "all":
+        return np.flatnonzero(res.has_box)
+    if labels == "suspicious":
+        return np.flatnonzero(bad)
+    return np.zeros(0, dtype=np.int64)
+
+@lru_cache(maxsize=8)
+def _pil_font(size):
+    from PIL import ImageFont
+    for name in ("arial.ttf", "DejaVuSans.ttf"):
+        try:
+            return ImageFont.truetype(name, size)
+        except Exception:
+            pass
+    return ImageFont.load_default()
+
+def _to_rgb(img):
+    if img.ndim == 3 and img.shape[2] == 3:
+        return img
+    if img.ndim == 2:
+        return np.repeat(img[:, :, None], 3, axis=2)
+    return np.ascontiguousarray(img[:, :, :3])
+
+def render(image, ocr, result=None, max_side=None, labels="suspicious"):
+    """
+    RGB uint8 array: `image` (path, bytes or an already-decoded array, never modified) with the
+    OCR boxes drawn, scaled down so the long side is at most `max_side` pixels.
+    """
+    from src.ocr.preprocess import decode_image
+    _, cv2, Image = _safe_imports()
+    if cv2 is None and Image is None:
+        raise RuntimeError("Neither OpenCV nor Pillow available; cannot draw boxes.")
+    with metrics.timer("annotate.render"):
+        img = _to_rgb(decode_image(image))
+        res = as_result(ocr)
+        bad = suspicious_mask(res, result)
+        h, w = img.shape[:2]
+        scale = 1.0
+        if max_side and max(h, w) > max_side:
+            scale = max_side / float(max(h, w))
+            size = (max(1, round(w * scale)), max(1, round(h * scale)))
+            if cv2 is not None:
+                img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+            else:
+                img = np.asarray(Image.fromarray(img).resize(size, Image.BILINEAR))
+        else:
+            img = img.copy()
+        pts = np.rint(res.boxes * scale).astype(np.int32)
+        regions = np.rint(_rect_quads(changed_regions(result)) * scale).astype(np.int32)
+        groups = ((regions, AMBER), (pts[res.has_box & ~bad], GREEN), (pts[bad], RED))
+        rows = _label_rows(res, bad, labels)
+        texts = res.texts if len(rows) else []
+        thickness = max(1, round(2 * scale)) if scale < 1 else 2
+        if cv2 is not None:
+            for quads, color in groups:
+                if len(quads):
+                    cv2.polylines(img, list(quads), True, color, thickness)
+            font_scale = max(0.35, 0.6 * scale)
+            for i in rows.tolist():
+                x, y = pts[i, 0].tolist()
+                cv2.putText(img, texts[i][:LABEL_CHARS], (x, max(10, y - 4)), cv2.FONT_HERSHEY_SIMPLEX,
+                            font_scale, RED if bad[i] else GREEN, 1, cv2.LINE_AA)
+            return img
+        from PIL import ImageDraw
+        pil = Image.fromarray(img)
+        draw = ImageDraw.Draw(pil)
+        for quads, color in groups:
+            for q in quads.tolist():
+                pts_ = [tuple(p) for p in q]
+                draw.line(pts_ + [pts_[0]], width=thickness, fill=color)
+        font = _pil_font(max(10, round(16 * scale)))
+        for i in rows.tolist():
+            x, y = pts[i, 0].tolist()
+            draw.text((x, max(0, y - 18)), texts[i][:LABEL_CHARS], fill=RED if bad[i] else GREEN, font=font)
+        return np.asarray(pil)
+
+def encode(img, fmt="png", out_path=None):
+    """PNG or JPEG bytes of an RGB array, written to out_path (returned) or returned as a BytesIO."""
+    _, cv2, Image = _safe_imports()
+    fmt = "jpeg" if fmt in ("jpg", "jpeg") else "png"
+    with metrics.timer("annotate.encode"):
+        if cv2 is not None:
+            params = [cv2.IMWRITE_JPEG_QUALITY, 85] if fmt == "jpeg" else [cv2.IMWRITE_PNG_COMPRESSION, 1]
+            ok, data = cv2.imencode(".jpg" if fmt == "jpeg" else ".png", cv2.cvtColor(img, cv2.COLOR_RGB2BGR), params)
+            if not ok:
+                raise RuntimeError("could not encode annotated image")
+            data = data.tobytes()
+        else:
+            buf = io.BytesIO()
+            if fmt == "jpeg":
+                Image.fromarray(img).save(buf, format="JPEG", quality=85)
+            else:
+                Image.fromarray(img).save(buf, format="PNG", compress_level=1)
+            data = buf.getvalue()
+    if out_path is not None:
+        with open(out_path, "wb") as f:
+            f.write(data)
+        return out_path
+    return io.BytesIO(data)
+
+def _svg_path(quads):
+    return "".join("M{} {}L{} {}L{} {}L{} {}Z".format(*q.ravel().tolist()) for q in quads)
+
+def to_svg(ocr, size, result=None, background=None, labels="suspicious"):
+    """
+    SVG overlay in original pixel coordinates. size: (width, height) of the original image;
+    background: encoded image bytes (e.g. a JPEG thumbnail) stretched underneath, or None.
+    """
+    res = as_result(ocr)
+    bad = suspicious_mask(res, result)
+    w, h = int(size[0]), int(size[1])
+    stroke = max(2, round(max(w, h) / 600))
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {w} {h}" width="{w}" height="{h}">']
+    if background is not None:
+        kind = "jpeg" if bytes(background[:2]) == b"\xff\xd8" else "png"
+        data = base64.b64encode(bytes(background)).decode("ascii")
+        parts.append(f'<image href="data:image/{kind};base64,{data}" x="0" y="0" width="{w}" height="{h}" '
+                     f'preserveAspectRatio="none"/>')
+    regions = np.rint(_rect_quads(changed_regions(result))).astype(np.int64)
+    for quads, color in ((regions, AMBER), (res.boxes[res.has_box & ~bad], GREEN), (res.boxes[bad], RED)):
+        if len(quads):
+            parts.append(f'<path d="{_svg_path(quads)}" fill="none" stroke="rgb{color}" stroke-width="{stroke}"/>')
+    rows = _label_rows(res, bad, labels)
+    if len(rows):
+        texts = res.texts
+        for i in rows.tolist():
+            x, y = res.boxes[i, 0].tolist()
+            parts.append(f'<text x="{x}" y="{max(12, y - 6)}" font-size="{6 * stroke + 4}" '
+                         f'fill="rgb{RED if bad[i] else GREEN}">{escape(texts[i][:LABEL_CHARS])}</text>')
+    parts.append("</svg>")
+    return "".join(parts)
+
+def _format(fmt, out_path):
+    if fmt:
+        return fmt.lower()
+    ext = str(out_path or "").rsplit(".", 1)[-1].lower()
+    return ext if ext in ("jpg", "jpeg", "svg") else "png"
+
+def annotate(image, ocr, result=None, fmt=None, max_side=None, out_path=None, labels="suspicious"):
+    """
+    Annotated image as PNG / JPEG (fmt "png", "jpeg") or SVG ("svg"; max_side then sizes the
+    embedded background). Written to out_path and the path returned, or returned as a BytesIO.
+    fmt defaults to the out_path extension, else PNG.
+    """
+    fmt = _format(fmt, out_path)
+    if fmt != "svg":
+        return encode(render(image, ocr, result, max_side, labels), fmt, out_path)
+    from src.ocr.preprocess import decode_image
+    img = decode_image(image)
+    h, w = img.shape[:2]
+    background = encode(render(img, [], None, max_side or SVG_BACKGROUND_SIDE, None), "jpeg").getvalue()
+    with metrics.timer("annotate.encode"):
+        data = to_svg(ocr, (w, h), result, background, labels).encode("utf-8")
+    if out_path is not None:
+        with open(out_path, "wb") as f:
+            f.write(data)
+        return out_path
+    return io.BytesIO(data)
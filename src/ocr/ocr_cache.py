@@ -0,0 +1,129 @@
+"""
+Disk-backed OCR result cache, content-addressed by image bytes.
+
+Provides:
+- make_key(image_bytes, engine, version, options) -> str
+- key_bytes(image) -> bytes identifying a path / encoded bytes / decoded array for make_key
+- OcrCache(path, max_bytes).get(key) -> list of {"box","text","conf"} or None
+- OcrCache.put(key, ocr_list)
+- get_default_cache() -> shared OcrCache, or None when disabled
+
+Entries live in one SQLite file (WAL mode), so several processes (webapp, batch workers)
+can read and write it at the same time. The total stored size is kept under `max_bytes`
+by evicting the least recently used entries. The running total lives in a one-row `meta`
+table kept up to date by triggers in the writer's own transaction, so a put never scans
+the table to size it.
+
+Configuration:
+- LEGALDOC_OCR_CACHE: cache file path (default .cache/ocr_cache.sqlite); "off" disables it
+- LEGALDOC_OCR_CACHE_MB: size bound in megabytes (default 512)
+"""
+import os, json, time, hashlib
+
+from src.common.sqlite import SqliteStore, default_instance
+
+def make_key(image_bytes, engine, version="", options=None):
+    h = hashlib.sha256(image_bytes).hexdigest()
+    opts = json.dumps(options or {}, sort_keys=True, separators=(",", ":"))
+    return f"{h}|{engine}|{version}|{opts}"
+
+def read_bytes(image_path):
+    with open(image_path, "rb") as f:
+        return f.read()
+
+def key_bytes(image):
+    """Files and encoded bytes hash as-is; decoded arrays / PIL images hash their pixels plus shape."""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return bytes(image)
+    if isinstance(image, (str, os.PathLike)):
+        return read_bytes(image)
+    import numpy as np
+    arr = np.asarray(image)
+    return f"{arr.shape}|{arr.dtype}|".encode() + np.ascontiguousarray(arr).tobytes()
+
+class OcrCache(SqliteStore):
+    def __init__(self, path, max_bytes=512 << 20):
+        super().__init__(path)
+        self.max_bytes = int(max_bytes)
+        with self._conn() as c:
+            c.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                      "size INTEGER NOT NULL, atime REAL NOT NULL)")
+            c.execute("CREATE INDEX IF NOT EXISTS entries_atime ON entries(atime)")
+            c.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v INTEGER NOT NULL)")
+            c.execute("CREATE TRIGGER IF NOT EXISTS entries_ins AFTER INSERT ON entries "
+                      "BEGIN UPDATE meta SET v=v+NEW.size WHERE k='total'; END")
+            c.execute("CREATE TRIGGER IF NOT EXISTS entries_upd AFTER UPDATE OF size ON entries "
+                      "BEGIN UPDATE meta SET v=v+NEW.size-OLD.size WHERE k='total'; END")
+            c.execute("CREATE TRIGGER IF NOT EXISTS entries_del AFTER DELETE ON entries "
+                      "BEGIN UPDATE meta SET v=v-OLD.size WHERE k='total'; END")
+            # caches written before the running total existed are summed once, here
+            c.execute("INSERT OR IGNORE INTO meta(k, v) SELECT 'total', COALESCE(SUM(size), 0) FROM entries")
+
+    def get(self, key):
+        try:
+            c = self._conn()
+            row = c.execute("SELECT value FROM entries WHERE key=?", (key,)).fetchone()
+            if row is None:
+                return None
+            c.execute("UPDATE entries SET atime=? WHERE key=?", (time.time(), key))
+            return json.loads(row[0])
+        except Exception as e:
+            print("OcrCache.get failed:", repr(e))
+            return None
+
+    def put(self, key, ocr_list):
+        value = json.dumps(_normalize(ocr_list), ensure_ascii=False, separators=(",", ":"))
+        try:
+            c = self._conn()
+            c.execute("BEGIN IMMEDIATE")
+            try:
+                # an upsert rather than INSERT OR REPLACE: REPLACE deletes without firing entries_del
+                c.execute("INSERT INTO entries(key, value, size, atime) VALUES (?,?,?,?) ON CONFLICT(key) "
+                          "DO UPDATE SET value=excluded.value, size=excluded.size, atime=excluded.atime",
+                          (key, value, len(value), time.time()))
+                self._evict(c)
+                c.execute("COMMIT")
+            except Exception:
+                c.execute("ROLLBACK")
+                raise
+        except Exception as e:
+            print("OcrCache.put failed:", repr(e))
+
+    def _evict(self, c):
+        total = c.execute("SELECT v FROM meta WHERE k='total'").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # drop oldest entries until 90% of the bound so we don't evict on every put
+        excess = total - int(self.max_bytes * 0.9)
+        victims = []
+        for key, size in c.execute("SELECT key, size FROM entries ORDER BY atime"):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        c.executemany("DELETE FROM entries WHERE key=?", victims)
+
+    def clear(self):
+        self._conn().execute("DELETE FROM entries")
+
+def _num(v):
+    if isinstance(v, (int, float)):
+        return v
+    return v.item() if hasattr(v, "item") else float(v)  # numpy scalars from the engines
+
+def _normalize(ocr_list):
+    if hasattr(ocr_list, "to_dicts"):
+        return ocr_list.to_dicts()  # OcrResult: already plain ints / floats / str
+    out = []
+    for it in ocr_list or []:
+        box = it.get("box")
+        box = [[_num(v) for v in p] for p in (box if box is not None else [])]
+        out.append({"box": box, "text": str(it.get("text", "")), "conf": _num(it.get("conf", 0.0) or 0.0)})
+    return out
+
+def _open_default(path):
+    mb = float(os.environ.get("LEGALDOC_OCR_CACHE_MB", "512"))
+    return OcrCache(path, max_bytes=int(mb * (1 << 20)))
+
+def get_default_cache():
+    return default_instance("LEGALDOC_OCR_CACHE", os.path.join(".cache", "ocr_cache.sqlite"), _open_default, "OCR cache")
@@ -1,68 +1,199 @@
 # src/ocr/ocr_infer.py
 """
-Wrapper for PaddleOCR. Defensive: if paddleocr is not installed, functions return empty list.
+Wrapper for PaddleOCR. Defensive: if paddleocr is not installed, functions return an empty result.
 Provides:
-- ocr_image(image_path) -> list of {"box": [[x,y],...], "text": str, "conf": float}
-- draw_boxes(image_path, ocr_list, out_path="ocr_boxes.png")
+- ocr_image(image, lang="en", use_textline_orientation=True, cache=None) -> OcrResult (src/ocr/ocr_result.py;
+  iterates as {"box": [[x,y],...], "text": str, "conf": float} dicts)
+  (image: file path, encoded bytes, PIL image or decoded RGB array, e.g. PreparedImage.ocr)
+- cache_key(image_bytes, lang="en", use_textline_orientation=True) -> OCR cache key for this engine/options
+- get_pool(lang="en", use_textline_orientation=True) -> EnginePool of warm PaddleOCR instances
+- warm_up(lang="en", use_textline_orientation=True, n=None) -> pre-load engines before the first request
+- draw_boxes(image, ocr_list, out_path="ocr_boxes.png", result=None, max_side=None)  (image: path, bytes,
+  PIL image or RGB array; out_path=None returns the annotated PNG as an in-memory BytesIO; drawn
+  by src/ocr/annotate.py, words flagged by the predict() `result` in red)
+
+PaddleOCR instances are expensive to build (detector + recognizer load), so they are created
+once per process and kept in a pool per (lang, orientation) key. Each instance is handed to one
+caller at a time. Pool size comes from LEGALDOC_PADDLE_POOL_SIZE (default 1).
+
+Results are looked up in the shared OCR cache (src/ocr/ocr_cache.py) by image hash before
+running the engine; pass cache=False to bypass it.
+
+Engine calls are timed under the "ocr.paddle" stage; failures and cache hits are counted
+(src/common/metrics.py).
 """
-import os, json
+import os, json, queue, threading
+from contextlib import contextmanager
+from src.ocr.ocr_cache import make_key, key_bytes, get_default_cache
+from src.ocr.ocr_result import OcrResult
+from src.common import metrics
+from src.common.lazy import optional
 
 def _safe_imports():
-    try:
-        from paddleocr import PaddleOCR
-        return PaddleOCR
-    except Exception as e:
-        print("paddleocr not available:", repr(e))
-        return None
+    """PaddleOCR class, or None. Imported on first use: paddleocr pulls in paddle (seconds)."""
+    return getattr(optional("paddleocr"), "PaddleOCR", None)
+
+DEFAULT_POOL_SIZE = int(os.environ.get("LEGALDOC_PADDLE_POOL_SIZE", "1") or 1)
+
+class EnginePool:
+    """
+    Up to `size` warm PaddleOCR instances built with the same options.
+    Engines are created lazily (or up front via warm()) and reused for the life of the process.
+    """
+    def __init__(self, size=DEFAULT_POOL_SIZE, **opts):
+        self.size = max(1, int(size))
+        self.opts = opts
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        with self._lock:
+            if self._created >= self.size:
+                return False
+            self._created += 1
+            return True
+
+    def _build(self):
+        try:
+            return _safe_imports()(**self.opts)
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def warm(self, n=None):
+        """Build engines until `n` (default: pool size) exist. Returns the number of engines."""
+        n = self.size if n is None else min(int(n), self.size)
+        while self._created < n and self._reserve():
+            self._idle.put(self._build())
+        return self._created
+
+    @contextmanager
+    def engine(self, timeout=None):
+        """Borrow an engine; blocks (up to `timeout` seconds) while all of them are busy."""
+        try:
+            eng = self._idle.get_nowait()
+        except queue.Empty:
+            eng = self._build() if self._reserve() else self._idle.get(timeout=timeout)
+        try:
+            yield eng
+        finally:
+            self._idle.put(eng)
 
-PaddleOCR = _safe_imports()
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
 
-def ocr_image(image_path):
+def get_pool(lang="en", use_textline_orientation=True, size=None):
+    key = (lang, bool(use_textline_orientation))
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None:
+            pool = EnginePool(size or DEFAULT_POOL_SIZE, lang=lang,
+                              use_textline_orientation=bool(use_textline_orientation))
+            _POOLS[key] = pool
+    return pool
+
+def warm_up(lang="en", use_textline_orientation=True, n=None):
     """
-    If PaddleOCR available, run it. Otherwise return [].
+    Load PaddleOCR models ahead of the first request. Returns number of warm engines (0 if unavailable).
     """
-    if PaddleOCR is None:
-        return []
+    if _safe_imports() is None:
+        return 0
     try:
-        ocr = PaddleOCR(use_textline_orientation=True, lang='en')
-        # predict returns list of lines; convert to uniform format
-        result = ocr.ocr(image_path, cls=True) if hasattr(ocr, "ocr") else ocr.predict(image_path)
-        # normalize to list of dicts with box/text/conf
-        out = []
-        for line in result:
-            # expected line formats differ; handle generically
-            try:
-                box = line[0]
-                text = line[1][0] if isinstance(line[1], (list,tuple)) else (line[1].get("text") if isinstance(line[1], dict) else str(line[1]))
-                conf = float(line[1][1]) if isinstance(line[1], (list,tuple)) and len(line[1])>1 else 0.0
-            except Exception:
-                # fallback: if line is dict already
-                box = line.get("box", [])
-                text = line.get("text", "")
-                conf = line.get("conf", 0.0)
-            out.append({"box": box, "text": text, "conf": conf})
-        return out
+        return get_pool(lang, use_textline_orientation).warm(n)
     except Exception as e:
-        print("PaddleOCR run failed:", repr(e))
-        return []
+        print("PaddleOCR warm-up failed:", repr(e))
+        return 0
 
-def draw_boxes(image_path, ocr_list, out_path="ocr_boxes.png"):
+def _paddle_version():
+    # from the package metadata: a cache lookup must not import paddle
     try:
-        from PIL import Image, ImageDraw, ImageFont
+        from importlib.metadata import version
+        return version("paddleocr")
     except Exception:
-        raise RuntimeError("Pillow not installed; cannot draw boxes")
-    img = Image.open(image_path).convert("RGB")
-    draw = ImageDraw.Draw(img)
-    for it in ocr_list:
-        box = it.get("box") or []
-        txt = it.get("text","")
-        if not box:
-            continue
+        return ""
+
+def cache_key(image_bytes, lang="en", use_textline_orientation=True):
+    return make_key(image_bytes, "paddleocr", _paddle_version(),
+                    {"lang": lang, "use_textline_orientation": bool(use_textline_orientation)})
+
+def _paddle_input(image):
+    """Paths go through untouched; bytes / PIL / RGB or gray arrays become the BGR arrays Paddle expects."""
+    if isinstance(image, (str, os.PathLike)):
+        return os.fspath(image)
+    import numpy as np
+    from src.ocr.preprocess import decode_image
+    arr = decode_image(image)
+    if arr.ndim == 2:
+        return np.ascontiguousarray(np.repeat(arr[:, :, None], 3, axis=2))
+    return np.ascontiguousarray(arr[:, :, 2::-1])
+
+def _run_paddle(image_path, lang, use_textline_orientation):
+    image_path = _paddle_input(image_path)
+    with get_pool(lang, use_textline_orientation).engine() as ocr:
+        # predict returns list of lines; convert to uniform format
+        result = ocr.ocr(image_path, cls=True) if hasattr(ocr, "ocr") else ocr.predict(image_path)
+    import numpy as np
+    # PaddleOCR 3.x predict(): one dict-like page result holding the columns already
+    pages = [r for r in result or [] if hasattr(r, "get") and r.get("rec_texts") is not None]
+    if pages:
+        page = pages[0]
+        polys = page.get("rec_polys")
+        if polys is None:
+            polys = page.get("dt_polys")
+        texts = list(page["rec_texts"])
+        if polys is not None and len(polys) == len(texts):
+            return OcrResult.from_columns(np.asarray(polys).reshape(-1, 4, 2), page.get("rec_scores", [0.0] * len(texts)), texts)
+    # normalize to list of dicts with box/text/conf
+    out = []
+    for line in result:
+        # expected line formats differ; handle generically
         try:
-            pts = [tuple(map(int,p)) for p in box]
+            box = line[0]
+            text = line[1][0] if isinstance(line[1], (list,tuple)) else (line[1].get("text") if isinstance(line[1], dict) else str(line[1]))
+            conf = float(line[1][1]) if isinstance(line[1], (list,tuple)) and len(line[1])>1 else 0.0
         except Exception:
-            continue
-        draw.line(pts + [pts[0]], width=2, fill=(0,255,0))
-        draw.text((pts[0][0], max(0, pts[0][1]-18)), txt[:30], fill=(0,255,0))
-    img.save(out_path)
-    return out_path
+            # fallback: if line is dict already
+            box = line.get("box", [])
+            text = line.get("text", "")
+            conf = line.get("conf", 0.0)
+        out.append({"box": box, "text": text, "conf": conf})
+    return OcrResult.from_dicts(out)
+
+def ocr_image(image_path, lang="en", use_textline_orientation=True, cache=None):
+    """
+    OcrResult from the OCR cache, else from PaddleOCR on a pooled engine; OcrResult.empty() if
+    PaddleOCR is not available. The cache is checked first, so a hit never imports paddle.
+    image_path may also be encoded bytes, a PIL image or a decoded RGB (or grayscale) array.
+    cache: None = shared default cache, False = no caching, or an OcrCache instance.
+    """
+    cache = get_default_cache() if cache is None else cache
+    key = None
+    if cache:
+        try:
+            key = cache_key(key_bytes(image_path), lang, use_textline_orientation)
+        except Exception as e:
+            print("PaddleOCR cache lookup skipped:", repr(e))
+        hit = cache.get(key) if key else None
+        if hit is not None:
+            metrics.incr("ocr_cache_hits", engine="paddle")
+            return OcrResult.from_dicts(hit)
+    if _safe_imports() is None:
+        metrics.incr("ocr_unavailable", engine="paddle")
+        return OcrResult.empty()
+    try:
+        with metrics.timer("ocr.paddle"):
+            out = _run_paddle(image_path, lang, use_textline_orientation)
+    except Exception as e:
+        print("PaddleOCR run failed:", repr(e))
+        metrics.incr("ocr_errors", engine="paddle", reason=type(e).__name__)
+        return OcrResult.empty()
+    if key:
+        cache.put(key, out)
+    return out
+
+def draw_boxes(image_path, ocr_list, out_path="ocr_boxes.png", result=None, max_side=None):
+    """Every box labelled with its text; see src/ocr/annotate.py (result colours suspicious words red)."""
+    from src.ocr.annotate import annotate
+    return annotate(image_path, ocr_list, result, max_side=max_side, out_path=out_path, labels="all")
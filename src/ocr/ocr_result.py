@@ -0,0 +1,179 @@
+"""
+Columnar OCR results: one set of NumPy arrays per page instead of a dict per word.
+
+Provides:
+- OcrResult(boxes, conf, buf, offsets, has_box=None)
+  .boxes (N,4,2) int32, .conf (N,) float32, .buf (all texts in one str), .offsets (N+1,) int64
+  .text(i), .texts, .centroids (N,2), .bounds (N,4: x0,y0,x1,y1)
+  .to_dicts() / OcrResult.from_dicts(items) -> the legacy list of {"box","text","conf"}
+  .transform(matrix) / .shift(dx, dy) -> boxes mapped by a 2x3 affine / a translation
+- OcrResult.from_rects(left, top, width, height, conf, texts) (Tesseract word rectangles)
+- OcrResult.from_columns(polys, conf, texts)
+- concat(results) -> one OcrResult
+- as_result(ocr) / as_dicts(ocr) -> either representation from either one
+
+Text i is buf[offsets[i]:offsets[i+1]]. Offsets index the shared buffer, so a contiguous
+slice (res[10:20]) is a view: array views plus the same str, nothing copied. Items without a
+box (has_box False) keep zeros in `boxes` and come back as "box": [] from to_dicts().
+
+For code written against the list-of-dicts format an OcrResult also behaves as a sequence of
+dicts: len(), truth value, iteration and res[i] produce {"box","text","conf"} items. Anything
+serialised to JSON should go through as_dicts().
+"""
+from src.common.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+class OcrResult:
+    __slots__ = ("boxes", "conf", "buf", "offsets", "has_box")
+
+    def __init__(self, boxes, conf, buf, offsets, has_box=None):
+        self.boxes, self.conf, self.buf, self.offsets = boxes, conf, buf, offsets
+        self.has_box = np.ones(len(conf), dtype=bool) if has_box is None else has_box
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros((0, 4, 2), np.int32), np.zeros(0, np.float32), "", np.zeros(1, np.int64))
+
+    @classmethod
+    def _build(cls, boxes, conf, texts, has_box=None):
+        texts = [str(t) for t in texts]
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        if texts:
+            np.cumsum(np.fromiter(map(len, texts), dtype=np.int64, count=len(texts)), out=offsets[1:])
+        return cls(boxes, np.asarray(conf, dtype=np.float32).reshape(-1), "".join(texts), offsets, has_box)
+
+    @classmethod
+    def from_columns(cls, polys, conf, texts):
+        """polys: (N,4,2) corner points (any numeric type), conf and texts of length N."""
+        boxes = np.rint(np.asarray(polys, dtype=np.float64).reshape(-1, 4, 2)).astype(np.int32)
+        return cls._build(boxes, conf, texts)
+
+    @classmethod
+    def from_rects(cls, left, top, width, height, conf, texts):
+        left, top = np.asarray(left, dtype=np.int32), np.asarray(top, dtype=np.int32)
+        right, bottom = left + np.asarray(width, dtype=np.int32), top + np.asarray(height, dtype=np.int32)
+        boxes = np.stack([np.stack([left, top], 1), np.stack([right, top], 1),
+                          np.stack([right, bottom], 1), np.stack([left, bottom], 1)], axis=1)
+        return cls._build(boxes.reshape(-1, 4, 2), conf, texts)
+
+    @classmethod
+    def from_dicts(cls, items):
+        if isinstance(items, OcrResult):
+            return items
+        items = list(items or [])
+        n = len(items)
+        texts, conf, polys = [], np.zeros(n, np.float32), [None] * n
+        for i, it in enumerate(items):
+            texts.append(it.get("text") or "")
+            try:
+                conf[i] = float(it.get("conf") or 0.0)
+            except (TypeError, ValueError):
+                pass
+            polys[i] = it.get("box")
+        boxes = np.zeros((n, 4, 2), np.int32)
+        has_box = np.zeros(n, dtype=bool)
+        try:
+            arr = np.asarray(polys, dtype=np.float64)
+            if arr.shape != (n, 4, 2):
+                raise ValueError
+            boxes[:] = np.rint(arr)
+            has_box[:] = True
+        except (ValueError, TypeError):
+            for i, box in enumerate(polys):
+                try:
+                    pts = np.asarray(box, dtype=np.float64).reshape(-1, 2)
+                except (ValueError, TypeError):
+                    continue
+                if not len(pts):
+                    continue
+                if len(pts) != 4:
+                    # other polygons keep their bounding rectangle
+                    (x0, y0), (x1, y1) = pts.min(0), pts.max(0)
+                    pts = np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]])
+                boxes[i] = np.rint(pts)
+                has_box[i] = True
+        return cls._build(boxes, conf, texts, has_box)
+
+    def __len__(self):
+        return len(self.conf)
+
+    def __bool__(self):
+        return len(self.conf) > 0
+
+    def text(self, i):
+        return self.buf[self.offsets[i]:self.offsets[i + 1]]
+
+    @property
+    def texts(self):
+        o = self.offsets.tolist()
+        b = self.buf
+        return [b[o[i]:o[i + 1]] for i in range(len(o) - 1)]
+
+    @property
+    def centroids(self):
+        return self.boxes.mean(axis=1, dtype=np.float32)
+
+    @property
+    def bounds(self):
+        return np.concatenate([self.boxes.min(axis=1), self.boxes.max(axis=1)], axis=1)
+
+    @property
+    def nbytes(self):
+        return (self.boxes.nbytes + self.conf.nbytes + self.offsets.nbytes + self.has_box.nbytes
+                + len(self.buf.encode("utf-8")))
+
+    def _item(self, i, box, text, conf):
+        return {"box": box if self.has_box[i] else [], "text": text, "conf": round(conf, 4)}
+
+    def to_dicts(self):
+        return [self._item(i, b, t, c) for i, (b, t, c) in
+                enumerate(zip(self.boxes.tolist(), self.texts, self.conf.tolist()))]
+
+    def __iter__(self):
+        return iter(self.to_dicts())
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1:
+                stop = max(stop, start)
+                return OcrResult(self.boxes[start:stop], self.conf[start:stop], self.buf,
+                                 self.offsets[start:stop + 1], self.has_box[start:stop])
+            key = np.arange(start, stop, step)
+        if isinstance(key, (int, np.integer)):
+            i = int(key) + (len(self) if key < 0 else 0)
+            if not 0 <= i < len(self):
+                raise IndexError("OcrResult index out of range")
+            return self._item(i, self.boxes[i].tolist(), self.text(i), float(self.conf[i]))
+        idx = np.arange(len(self))[np.asarray(key)]
+        texts = self.texts
+        return OcrResult._build(self.boxes[idx], self.conf[idx], [texts[i] for i in idx], self.has_box[idx])
+
+    def transform(self, matrix):
+        """Copy with boxes mapped through a 2x3 affine matrix (rounded to whole pixels)."""
+        m = np.asarray(matrix, dtype=np.float64)
+        pts = self.boxes.reshape(-1, 2) @ m[:, :2].T + m[:, 2]
+        boxes = np.where(self.has_box[:, None, None], np.rint(pts).reshape(-1, 4, 2), 0).astype(np.int32)
+        return OcrResult(boxes, self.conf, self.buf, self.offsets, self.has_box)
+
+    def shift(self, dx, dy):
+        boxes = self.boxes + np.where(self.has_box[:, None, None], np.array([dx, dy], np.int32), 0).astype(np.int32)
+        return OcrResult(boxes, self.conf, self.buf, self.offsets, self.has_box)
+
+    def __repr__(self):
+        return f"OcrResult({len(self)} items, {self.nbytes} bytes)"
+
+def concat(results):
+    parts = [as_result(r) for r in results]
+    if not parts:
+        return OcrResult.empty()
+    texts = [t for p in parts for t in p.texts]
+    return OcrResult._build(np.concatenate([p.boxes for p in parts]), np.concatenate([p.conf for p in parts]),
+                            texts, np.concatenate([p.has_box for p in parts]))
+
+def as_result(ocr):
+    return ocr if isinstance(ocr, OcrResult) else OcrResult.from_dicts(ocr)
+
+def as_dicts(ocr):
+    return ocr.to_dicts() if isinstance(ocr, OcrResult) else ocr
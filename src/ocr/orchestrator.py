@@ -0,0 +1,189 @@
+"""
+Runs the OCR engines concurrently and picks (or merges) a result.
+
+Provides:
+- run_ocr(image_path, engines=("paddle","tesseract"), policy="first", timeouts=None) -> (ocr_list, engine)
+
+Policies:
+- "first":     first engine to return non-empty text wins; the others are cancelled/discarded
+- "best_conf": wait for every engine (within its timeout), keep the highest mean confidence
+- "merge":     best-confidence result plus boxes from the other engines that don't overlap it
+- "fallback":  old sequential behaviour - Paddle, then Tesseract only if Paddle found nothing
+
+Engines: "paddle", "tesseract" (full page) and "tesseract_roi" (label bands only, see roi_ocr.py).
+
+`engine` is the name of the engine whose output was returned ("merged" for merge, None if
+no engine produced text). Engines still running when a result is chosen (or past their
+timeout) are not waited for; their results are dropped.
+
+A running engine call cannot be cancelled, so each engine gets its own small thread pool: a
+hung or slow engine only holds its own threads, never the others'. Tesseract engines are
+also given what is left of their timeout, and the subprocess is killed when it runs out.
+PaddleOCR cannot be interrupted; calls queued behind a stuck one time out and are cancelled.
+
+The whole call is timed as the "ocr.run" stage; timeouts, failures, fallbacks and the chosen
+engine are counted (src/common/metrics.py).
+"""
+import os, time, threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from src.ocr.ocr_infer import ocr_image
+from src.ocr.tesseract_ocr import tesseract_ocr
+from src.ocr.roi_ocr import roi_ocr
+from src.ocr.ocr_result import OcrResult
+from src.common import metrics
+
+ENGINES = {
+    "paddle": ocr_image,
+    "tesseract": tesseract_ocr,
+    "tesseract_roi": roi_ocr,
+}
+# engines report confidence on different scales; compare them as 0..1
+CONF_SCALE = {"paddle": 1.0, "tesseract": 100.0, "tesseract_roi": 100.0}
+POLICIES = ("first", "best_conf", "merge", "fallback")
+# engines that accept a per-call timeout (seconds) and stop when it runs out
+BOUNDED = ("tesseract", "tesseract_roi")
+DEFAULT_TIMEOUT = 60.0
+ENGINE_THREADS = 4
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+def _executor(name):
+    ex = _executors.get(name)
+    if ex is None:
+        with _executors_lock:
+            ex = _executors.get(name)
+            if ex is None:
+                ex = _executors[name] = ThreadPoolExecutor(max_workers=ENGINE_THREADS, thread_name_prefix="ocr-" + name)
+    return ex
+
+def _reset_executor():
+    # a forked child inherits the executors but not their threads; queued engines would never run
+    global _executors_lock
+    _executors.clear()
+    _executors_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_executor)
+
+def _texts(ocr):
+    return ocr.texts if isinstance(ocr, OcrResult) else [r.get("text") or "" for r in ocr]
+
+def _has_text(ocr):
+    return bool(ocr) and any(t.strip() for t in _texts(ocr))
+
+def mean_conf(ocr, engine):
+    if isinstance(ocr, OcrResult):
+        confs = [c for c, t in zip(ocr.conf.tolist(), ocr.texts) if t.strip()]
+    else:
+        confs = [float(r.get("conf") or 0.0) for r in ocr if (r.get("text") or "").strip()]
+    if not confs:
+        return 0.0
+    return sum(confs) / len(confs) / CONF_SCALE.get(engine, 1.0)
+
+def _bbox(box):
+    xs = [p[0] for p in box]; ys = [p[1] for p in box]
+    return min(xs), min(ys), max(xs), max(ys)
+
+def _iou(a, b):
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    if inter <= 0:
+        return 0.0
+    union = (a[2]-a[0])*(a[3]-a[1]) + (b[2]-b[0])*(b[3]-b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+def merge_results(results, iou_threshold=0.3):
+    """
+    results: {engine: ocr_list}. Starts from the highest-confidence engine and adds boxes from
+    the others that overlap none of the kept boxes. Confidences are rescaled to the base engine.
+    """
+    ranked = sorted(results, key=lambda e: mean_conf(results[e], e), reverse=True)
+    if not ranked:
+        return []
+    base = ranked[0]
+    merged = [r for r in results[base] if (r.get("text") or "").strip()]
+    kept = [_bbox(r["box"]) for r in merged if r.get("box") is not None and len(r["box"])]
+    for eng in ranked[1:]:
+        rescale = CONF_SCALE.get(base, 1.0) / CONF_SCALE.get(eng, 1.0)
+        for r in results[eng]:
+            if not (r.get("text") or "").strip() or r.get("box") is None or not len(r["box"]):
+                continue
+            bb = _bbox(r["box"])
+            if any(_iou(bb, k) >= iou_threshold for k in kept):
+                continue
+            kept.append(bb)
+            merged.append({"box": r["box"], "text": r["text"], "conf": float(r.get("conf") or 0.0) * rescale})
+    return merged
+
+def _call(name, image_path, timeout=None):
+    if timeout is not None and name in BOUNDED:
+        return ENGINES[name](image_path, timeout=timeout)
+    return ENGINES[name](image_path)
+
+def _until(name, image_path, deadline):
+    # a call that waited in its engine's queue only gets what is left before the deadline
+    return _call(name, image_path, max(0.0, deadline - time.monotonic()))
+
+def _fallback(image_path, engines, timeouts):
+    ocr = []
+    for i, name in enumerate(engines):
+        if i:
+            metrics.incr("ocr_fallback", engine=name)
+        ocr = _call(name, image_path, timeouts.get(name))
+        if _has_text(ocr):
+            return ocr, name
+    return ocr, None
+
+def run_ocr(image_path, engines=("paddle", "tesseract"), policy="first", timeouts=None):
+    if policy not in POLICIES:
+        raise ValueError(f"unknown OCR policy {policy!r}; expected one of {POLICIES}")
+    with metrics.timer("ocr.run"):
+        ocr, engine = _run_ocr(image_path, [e for e in engines if e in ENGINES], policy, timeouts)
+    metrics.incr("ocr_selected", engine=engine or "none", policy=policy)
+    return ocr, engine
+
+def _run_ocr(image_path, engines, policy, timeouts):
+    timeouts = timeouts or {}
+    if policy == "fallback":
+        return _fallback(image_path, engines, timeouts)
+    start = time.monotonic()
+    deadlines = {}
+    pending = {}
+    for name in engines:
+        deadlines[name] = start + float(timeouts.get(name, DEFAULT_TIMEOUT))
+        pending[_executor(name).submit(metrics.propagate(_until), name, image_path, deadlines[name])] = name
+    results = {}
+    while pending:
+        now = time.monotonic()
+        for fut in [f for f, n in pending.items() if deadlines[n] <= now]:
+            print(f"run_ocr: {pending[fut]} timed out, discarding its result")
+            metrics.incr("ocr_timeouts", engine=pending[fut])
+            fut.cancel()
+            del pending[fut]
+        if not pending:
+            break
+        wait_for = min(deadlines[n] for n in pending.values()) - now
+        done, _ = wait(list(pending), timeout=max(wait_for, 0), return_when=FIRST_COMPLETED)
+        for fut in done:
+            name = pending.pop(fut)
+            try:
+                ocr = fut.result()
+            except Exception as e:
+                print(f"run_ocr: {name} failed:", repr(e))
+                metrics.incr("ocr_errors", engine=name, reason=type(e).__name__)
+                continue
+            if _has_text(ocr):
+                results[name] = ocr
+                if policy == "first":
+                    for other in pending:
+                        other.cancel()
+                    return ocr, name
+    if not results:
+        return [], None
+    if policy == "merge" and len(results) > 1:
+        return merge_results(results), "merged"
+    best = max(results, key=lambda e: mean_conf(results[e], e))
+    return results[best], best
@@ -0,0 +1,149 @@
+"""
+Image decoding and OCR preprocessing.
+
+Provides:
+- decode_image(src) -> RGB uint8 array (src: path, encoded bytes, PIL image or array)
+- prepare(img, target_dpi=300, ...) -> PreparedImage
+- PreparedImage.original / .ocr / .to_original(ocr_list)
+- save_image(pil_img, out_path) -> out_path, or an in-memory PNG (BytesIO) when out_path is None
+
+The file is decoded once and the same array is handed to OCR and to draw_boxes. prepare()
+only allocates a new buffer when it actually changes the image: oversized photos are
+downscaled to roughly `target_dpi` for a slip-sized page, and the optional enhancement
+steps (deskew, denoise, contrast, adaptive threshold) run as single OpenCV calls over the
+whole array. OCR boxes found on the prepared image are mapped back to original pixels with
+PreparedImage.to_original().
+"""
+import os
+
+from src.ocr.tesseract_ocr import _safe_imports
+from src.common.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+# long side of the paper we expect (A5 slip / half-letter), used to turn a DPI into pixels
+PAGE_LONG_SIDE_IN = 8.3
+
+def decode_image(src):
+    if isinstance(src, np.ndarray):
+        return src
+    _, cv2, Image = _safe_imports()
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        if cv2 is not None:
+            arr = cv2.imdecode(np.frombuffer(src, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if arr is None:
+                raise ValueError("could not decode image bytes")
+            return cv2.cvtColor(arr, cv2.COLOR_BGR2RGB)
+        import io
+        src = Image.open(io.BytesIO(bytes(src)))
+    elif isinstance(src, (str, os.PathLike)):
+        if cv2 is not None:
+            arr = cv2.imread(os.fspath(src), cv2.IMREAD_COLOR)
+            if arr is None:
+                raise ValueError(f"could not read image {src}")
+            return cv2.cvtColor(arr, cv2.COLOR_BGR2RGB)
+        src = Image.open(src)
+    if Image is None:
+        raise RuntimeError("Pillow not available; cannot decode image")
+    return np.asarray(src.convert("RGB"))
+
+def save_image(img, out_path=None):
+    if out_path is not None:
+        img.save(out_path)
+        return out_path
+    import io
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    buf.seek(0)
+    return buf
+
+class PreparedImage:
+    """`ocr` is the buffer to recognise; `matrix` maps original pixel coords onto it (2x3 affine)."""
+    __slots__ = ("original", "ocr", "matrix")
+
+    def __init__(self, original, ocr, matrix):
+        self.original, self.ocr, self.matrix = original, ocr, matrix
+
+    @property
+    def scale(self):
+        return float(np.hypot(self.matrix[0, 0], self.matrix[1, 0]))
+
+    def to_original(self, ocr_list):
+        """Copy of ocr_list with boxes mapped from the prepared image back to original pixels."""
+        if np.allclose(self.matrix, np.eye(2, 3)):
+            return ocr_list
+        inv = _invert(self.matrix)
+        if hasattr(ocr_list, "transform"):
+            return ocr_list.transform(inv)  # OcrResult: one matrix product for every box
+        out = []
+        for it in ocr_list:
+            box = it.get("box")
+            if box is not None and len(box):
+                pts = np.asarray(box, dtype=np.float64).reshape(-1, 2)
+                pts = pts @ inv[:, :2].T + inv[:, 2]
+                it = dict(it, box=np.rint(pts).astype(int).tolist())
+            out.append(it)
+        return out
+
+def _invert(m):
+    a = np.vstack([m, [0.0, 0.0, 1.0]])
+    return np.linalg.inv(a)[:2]
+
+def _skew_angle(gray, cv2):
+    """Dominant text angle (degrees) from the min-area rectangle around dark pixels."""
+    small = gray if max(gray.shape) <= 1000 else cv2.resize(gray, None, fx=1000 / max(gray.shape), fy=1000 / max(gray.shape), interpolation=cv2.INTER_AREA)
+    _, bw = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    pts = cv2.findNonZero(bw)
+    if pts is None or len(pts) < 50:
+        return 0.0
+    angle = cv2.minAreaRect(pts)[-1]
+    # OpenCV reports [-90, 0) or (0, 90] depending on version; fold to the nearest axis
+    if angle > 45:
+        angle -= 90
+    elif angle < -45:
+        angle += 90
+    return float(angle)
+
+def prepare(img, target_dpi=300, source_dpi=None, max_side=None, deskew=False, denoise=False,
+            contrast=False, threshold=False):
+    """
+    img: anything decode_image() accepts. Without source_dpi the page is assumed to be a slip
+    whose long side is PAGE_LONG_SIDE_IN inches; max_side overrides the pixel limit directly.
+    Enhancement flags need OpenCV; they turn the OCR buffer into a single-channel image.
+    """
+    original = decode_image(img)
+    _, cv2, Image = _safe_imports()
+    h, w = original.shape[:2]
+    if source_dpi:
+        scale = min(1.0, float(target_dpi) / float(source_dpi))
+    else:
+        limit = max_side or int(target_dpi * PAGE_LONG_SIDE_IN)
+        scale = min(1.0, limit / float(max(h, w)))
+    matrix = np.array([[scale, 0.0, 0.0], [0.0, scale, 0.0]])
+    out = original
+    if scale < 1.0:
+        size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+        if cv2 is not None:
+            out = cv2.resize(original, size, interpolation=cv2.INTER_AREA)
+        else:
+            out = np.asarray(Image.fromarray(original).resize(size, Image.LANCZOS))
+    if not (deskew or denoise or contrast or threshold):
+        return PreparedImage(original, out, matrix)
+    if cv2 is None:
+        print("prepare: OpenCV not available, skipping image enhancement")
+        return PreparedImage(original, out, matrix)
+    gray = cv2.cvtColor(out, cv2.COLOR_RGB2GRAY) if out.ndim == 3 else out
+    if deskew:
+        angle = _skew_angle(gray, cv2)
+        if abs(angle) > 0.1:
+            gh, gw = gray.shape
+            rot = cv2.getRotationMatrix2D((gw / 2.0, gh / 2.0), angle, 1.0)
+            gray = cv2.warpAffine(gray, rot, (gw, gh), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+            matrix = rot @ np.vstack([matrix, [0.0, 0.0, 1.0]])
+    if denoise:
+        gray = cv2.medianBlur(gray, 3)
+    if contrast:
+        gray = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(gray)
+    if threshold:
+        gray = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 15)
+    return PreparedImage(original, gray, matrix)
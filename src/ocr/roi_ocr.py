@@ -0,0 +1,145 @@
+"""
+Region-of-interest OCR: recognise only the bands of the page where slip fields live.
+
+Provides:
+- roi_ocr(image, template=None, detect_scale=0.5, timeout=None) -> OcrResult (src/ocr/ocr_result.py)
+- register_template(name, bands) / TEMPLATES -> fixed band layouts per slip type
+- find_label_bands(arr, detect_scale=0.5) -> [(x0, y0, x1, y1), ...] from a cheap detection pass
+
+Two passes:
+1. Locate the label lines (Name / Account / Amount / Date / currency markers), either from a
+   registered template or by running Tesseract in sparse-text mode on a downscaled copy.
+2. Run full-resolution recognition only on horizontal bands starting at each label and
+   running to the right edge of the page. Boxes are shifted back to page coordinates.
+
+The output is an OcrResult like the other engines', in reading order (top, then left).
+If no label is found the whole page is recognised as before. With a timeout (seconds) for the
+whole call, each Tesseract run gets what is left of it and bands past the deadline are skipped.
+"""
+import time
+
+from src.ocr.tesseract_ocr import TesseractEngine, SLIP_WHITELIST, _safe_imports
+from src.ocr.preprocess import decode_image
+from src.ocr.ocr_result import OcrResult, concat
+from src.common import metrics
+from src.common.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+LABEL_PREFIXES = ("name", "account", "amount", "date", "₹")
+# short currency markers only count as whole tokens ("Rs", "Rs.", "INR:"), not as prefixes of "rsvp"
+CURRENCY_LABELS = ("rs", "inr")
+
+# bands as fractions of page width/height: (x0, y0, x1, y1)
+TEMPLATES = {
+    # 1200x1600 layout produced by src/forgery/generate_demo_assets.py
+    "demo_slip": [
+        (0.08, 0.13, 1.0, 0.20),   # Name
+        (0.08, 0.21, 1.0, 0.27),   # Account
+        (0.08, 0.30, 1.0, 0.37),   # Amount
+        (0.08, 0.39, 1.0, 0.46),   # Date
+        (0.08, 0.61, 1.0, 0.70),   # second Amount line (forgery shows up here)
+    ],
+}
+
+_detector = None
+_recognizer = None
+
+def _engines():
+    global _detector, _recognizer
+    if _detector is None:
+        # sparse text, letters only: enough to find the labels on a shrunken page
+        _detector = TesseractEngine(psm=11, whitelist="ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz:.")
+        _recognizer = TesseractEngine(psm=6, whitelist=SLIP_WHITELIST)
+    return _detector, _recognizer
+
+def register_template(name, bands):
+    """bands: iterable of (x0, y0, x1, y1) page fractions covering each label + value line."""
+    TEMPLATES[name] = [tuple(float(v) for v in b) for b in bands]
+
+def _downscale(arr, scale):
+    _, cv2, Image = _safe_imports()
+    h, w = arr.shape[:2]
+    size = (max(1, int(w * scale)), max(1, int(h * scale)))
+    if cv2 is not None:
+        return cv2.resize(arr, size, interpolation=cv2.INTER_AREA)
+    return np.asarray(Image.fromarray(arr).resize(size))
+
+def _merge_bands(bands):
+    """Union vertically overlapping bands so no token is recognised twice."""
+    merged = []
+    for b in sorted(bands, key=lambda b: b[1]):
+        if merged and b[1] <= merged[-1][3]:
+            m = merged[-1]
+            merged[-1] = (min(m[0], b[0]), m[1], max(m[2], b[2]), max(m[3], b[3]))
+        else:
+            merged.append(b)
+    return merged
+
+def _is_label(txt):
+    t = txt.lower()
+    return t.startswith(LABEL_PREFIXES) or t.rstrip(".:") in CURRENCY_LABELS
+
+def find_label_bands(arr, detect_scale=0.5, pad=1.0, timeout=None):
+    """Bands (pixels) to the right of every label the detection pass finds; [] if none."""
+    detector, _ = _engines()
+    h, w = arr.shape[:2]
+    small = _downscale(arr, detect_scale) if detect_scale != 1 else arr
+    det = detector.run(small, timeout)
+    bands = []
+    for txt, l, t, bh in zip(det.text, det.left.tolist(), det.top.tolist(), det.height.tolist()):
+        if not _is_label(txt):
+            continue
+        x0, y0, lh = l / detect_scale, t / detect_scale, bh / detect_scale
+        py = max(20.0, pad * lh)
+        bands.append((int(max(0, x0 - 10)), int(max(0, y0 - py)), w, int(min(h, y0 + lh + py))))
+    return _merge_bands(bands)
+
+def template_bands(arr, template):
+    h, w = arr.shape[:2]
+    return _merge_bands([(int(x0 * w), int(y0 * h), int(x1 * w), int(y1 * h)) for x0, y0, x1, y1 in TEMPLATES[template]])
+
+def _left(deadline):
+    return None if deadline is None else deadline - time.monotonic()
+
+def roi_ocr(image, template=None, detect_scale=0.5, timeout=None):
+    """
+    image: path, encoded bytes, PIL image or RGB array. template: name in TEMPLATES to skip the detection pass.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    arr = decode_image(image)
+    _, recognizer = _engines()
+    if not recognizer.available:
+        print("roi_ocr: tesseract binary not available in environment.")
+        metrics.incr("ocr_unavailable", engine="tesseract_roi")
+        return OcrResult.empty()
+    try:
+        with metrics.timer("ocr.tesseract_roi.detect"):
+            bands = template_bands(arr, template) if template else find_label_bands(arr, detect_scale, timeout=_left(deadline))
+    except Exception as e:
+        print("roi_ocr: label detection failed, recognising full page:", e)
+        metrics.incr("ocr_errors", engine="tesseract_roi", reason=type(e).__name__)
+        bands = []
+    if not bands:
+        h, w = arr.shape[:2]
+        bands = [(0, 0, w, h)]
+    parts = []
+    for x0, y0, x1, y1 in bands:
+        crop = arr[y0:y1, x0:x1]
+        if crop.size == 0:
+            continue
+        left = _left(deadline)
+        if left is not None and left <= 0:
+            print("roi_ocr: timed out, skipping the remaining bands")
+            metrics.incr("ocr_timeouts", engine="tesseract_roi")
+            break
+        try:
+            with metrics.timer("ocr.tesseract_roi.band"):
+                res = recognizer.run(crop, left)
+        except Exception as e:
+            print("roi_ocr: band recognition failed:", e)
+            metrics.incr("ocr_errors", engine="tesseract_roi", reason=type(e).__name__)
+            continue
+        parts.append(res.to_result().shift(x0, y0))
+    out = concat(parts)
+    return out[np.lexsort((out.boxes[:, 0, 0], out.boxes[:, 0, 1]))] if len(out) else out
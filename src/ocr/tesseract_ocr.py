@@ -3,26 +3,61 @@
 Tesseract OCR wrapper.
 
 Provides:
-- tesseract_ocr(image_path) -> list of {"box": [[x,y],...], "text": str, "conf": float}
-- draw_boxes(image_path, ocr_list, out_path="tess_boxes.png")
+- TesseractEngine(psm=3, oem=None, lang="eng", whitelist=None, timeout=None).run(image, timeout=None) -> TesseractResult
+- get_engine(**options) -> shared TesseractEngine for those options
+- tesseract_ocr(image, cache=None, timeout=None) -> OcrResult (src/ocr/ocr_result.py; iterates as {"box","text","conf"} dicts)
+  (image: file path, encoded bytes, PIL image or decoded RGB array)
+- cache_key(image_bytes, **options) -> OCR cache key for this engine/options
+- draw_boxes(image, ocr_list, out_path="tess_boxes.png", result=None, max_side=None)  (image: path, bytes,
+  PIL image or RGB array; out_path=None returns the annotated PNG as an in-memory BytesIO; drawn
+  by src/ocr/annotate.py, words flagged by the predict() `result` in red)
 This module is defensive: if pytesseract / cv2 are not available, functions return empty lists
 (or raise only at call-time with friendly messages).
+Results are looked up in the shared OCR cache by image hash first (cache=False bypasses it).
+
+TesseractEngine talks to the tesseract binary directly: file paths are passed through,
+encoded bytes and NumPy/PIL images are piped over stdin (arrays as uncompressed PNM), and
+the TSV output is parsed into columns - no temp files and no PIL round-trip per call.
+tesseract_ocr() calls are timed under the "ocr.tesseract" stage; timeouts, failures and
+cache hits are counted (src/common/metrics.py).
 """
 
 import os
+import sys
 import json
+import time
+import shutil
+import subprocess
+import threading
+if __name__ == "__main__":
+    sys.path.append(os.path.abspath("."))  # python src/ocr/tesseract_ocr.py from the repo root
+from src.ocr.ocr_cache import make_key, key_bytes, get_default_cache
+from src.ocr.ocr_result import OcrResult
+from src.common import metrics
+from src.common.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+DEFAULT_WINDOWS_CMD = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+# characters that appear in slip fields (labels, names, account numbers, amounts, dates)
+SLIP_WHITELIST = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789:.,-/₹ "
+
+_DEPS = None
 
 def _safe_imports():
+    """(pytesseract, cv2, PIL.Image), each None if missing. Resolved once per process."""
+    global _DEPS
+    if _DEPS is not None:
+        return _DEPS
     pytesseract = None
     cv2 = None
     Image = None
     try:
         import pytesseract as _p
         # set default windows path automatically if exists
-        default_windows = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
-        if os.path.exists(default_windows):
+        if os.path.exists(DEFAULT_WINDOWS_CMD):
             try:
-                _p.pytesseract.tesseract_cmd = default_windows
+                _p.pytesseract.tesseract_cmd = DEFAULT_WINDOWS_CMD
             except Exception:
                 pass
         pytesseract = _p
@@ -38,96 +73,194 @@ def _safe_imports():
         Image = _Image
     except Exception:
         Image = None
-    return pytesseract, cv2, Image
+    _DEPS = (pytesseract, cv2, Image)
+    return _DEPS
 
-def tesseract_ocr(image_path):
-    pytesseract, cv2, Image = _safe_imports()
-    if pytesseract is None or Image is None:
-        print("tesseract_ocr: pytesseract or Pillow not available in environment.")
-        return []
+def _find_cmd():
+    pytesseract, _, _ = _safe_imports()
+    if pytesseract is not None:
+        cmd = getattr(pytesseract.pytesseract, "tesseract_cmd", None)
+        if cmd and (os.path.exists(cmd) or shutil.which(cmd)):
+            return cmd
+    if os.path.exists(DEFAULT_WINDOWS_CMD):
+        return DEFAULT_WINDOWS_CMD
+    return shutil.which("tesseract")
 
-    try:
-        pil_img = Image.open(image_path).convert("RGB")
-    except Exception as e:
-        print("tesseract_ocr: Failed to open image:", e)
-        return []
+def _to_pnm(arr):
+    """uint8 gray / RGB(A) array -> PGM/PPM bytes (no compression, cheap to write and parse)."""
+    arr = np.asarray(arr)
+    if arr.dtype != np.uint8:
+        arr = np.clip(arr, 0, 255).astype(np.uint8)
+    if arr.ndim == 3 and arr.shape[2] == 1:
+        arr = arr[:, :, 0]
+    if arr.ndim == 3:
+        arr, magic = arr[:, :, :3], b"P6"
+    else:
+        magic = b"P5"
+    h, w = arr.shape[:2]
+    return magic + b"\n%d %d\n255\n" % (w, h) + np.ascontiguousarray(arr).tobytes()
 
-    try:
-        data = pytesseract.image_to_data(pil_img, output_type=pytesseract.Output.DICT)
-    except Exception as e:
-        print("tesseract_ocr: pytesseract.image_to_data failed:", e)
-        return []
-
-    results = []
-    n = len(data.get("text", []))
-    for i in range(n):
-        txt = (data["text"][i] or "").strip()
-        if txt == "":
-            continue
-        try:
-            left = int(data["left"][i]); top = int(data["top"][i])
-            width = int(data["width"][i]); height = int(data["height"][i])
-        except Exception:
-            try:
-                left = int(float(data["left"][i])); top = int(float(data["top"][i]))
-                width = int(float(data["width"][i])); height = int(float(data["height"][i]))
-            except Exception:
-                continue
-        conf_raw = data.get("conf", [])[i] if "conf" in data else -1
-        try:
-            conf = float(conf_raw) if conf_raw is not None and conf_raw != '' else 0.0
-        except Exception:
-            conf = 0.0
+class TesseractResult:
+    """Word boxes as parallel columns (axis-aligned left/top/width/height)."""
+    __slots__ = ("left", "top", "width", "height", "conf", "text", "elapsed_ms")
 
-        x1, y1 = left, top
-        x2, y2 = left + width, top
-        x3, y3 = left + width, top + height
-        x4, y4 = left, top + height
-        box = [[x1, y1], [x2, y2], [x3, y3], [x4, y4]]
+    def __init__(self, left, top, width, height, conf, text, elapsed_ms=0.0):
+        self.left, self.top, self.width, self.height = left, top, width, height
+        self.conf, self.text, self.elapsed_ms = conf, text, elapsed_ms
 
-        results.append({"box": box, "text": txt, "conf": conf})
-    return results
+    def __len__(self):
+        return len(self.text)
 
-def draw_boxes(image_path, ocr_list, out_path="tess_boxes.png"):
-    _, _, Image = _safe_imports()
-    if Image is None:
-        raise RuntimeError("Pillow not available; cannot draw boxes.")
-    try:
-        from PIL import ImageDraw, ImageFont
-    except Exception:
-        ImageDraw = None
-        ImageFont = None
+    def to_result(self):
+        return OcrResult.from_rects(self.left, self.top, self.width, self.height, self.conf, self.text)
 
-    img = Image.open(image_path).convert("RGB")
-    draw = ImageDraw.Draw(img)
-    try:
-        font = ImageFont.truetype("arial.ttf", 16)
-    except Exception:
-        font = None
+    def to_list(self):
+        """Legacy format: list of {"box": [[x,y] x4], "text", "conf"}."""
+        out = []
+        for l, t, w, h, c, txt in zip(self.left.tolist(), self.top.tolist(), self.width.tolist(),
+                                      self.height.tolist(), self.conf.tolist(), self.text):
+            out.append({"box": [[l, t], [l + w, t], [l + w, t + h], [l, t + h]], "text": txt, "conf": round(c, 3)})
+        return out
 
-    for it in ocr_list:
-        box = it.get("box") or []
-        txt = it.get("text", "")
-        if not box:
+def parse_tsv(tsv):
+    left, top, width, height, conf, text = [], [], [], [], [], []
+    for line in tsv.splitlines()[1:]:
+        cols = line.split("\t", 11)
+        if len(cols) < 12 or cols[0] != "5":
+            continue
+        txt = cols[11].strip()
+        if not txt:
             continue
         try:
-            pts = [tuple(map(int, p)) for p in box]
-        except Exception:
+            l, t, w, h = (int(float(v)) for v in cols[6:10])
+        except ValueError:
             continue
-        draw.line(pts + [pts[0]], width=2, fill=(0, 255, 0))
-        if font:
+        try:
+            c = float(cols[10])
+        except ValueError:
+            c = 0.0
+        left.append(l); top.append(t); width.append(w); height.append(h); conf.append(c); text.append(txt)
+    i32 = lambda v: np.asarray(v, dtype=np.int32)
+    return TesseractResult(i32(left), i32(top), i32(width), i32(height), np.asarray(conf, dtype=np.float32), text)
+
+class TesseractEngine:
+    """
+    Reusable Tesseract runner. psm/oem are Tesseract's --psm / --oem (e.g. psm=6 for a single
+    uniform block, psm=11 for sparse text, oem=1 for LSTM only); whitelist restricts the
+    recognised characters (see SLIP_WHITELIST). last_elapsed_ms holds the latest call's time.
+    """
+    def __init__(self, psm=3, oem=None, lang="eng", whitelist=None, timeout=None, cmd=None):
+        self.psm, self.oem, self.lang, self.whitelist, self.timeout = psm, oem, lang, whitelist, timeout
+        self.cmd = cmd or _find_cmd()
+        self.last_elapsed_ms = 0.0
+        self._version = None
+
+    @property
+    def available(self):
+        return bool(self.cmd)
+
+    @property
+    def options(self):
+        return {"psm": self.psm, "oem": self.oem, "lang": self.lang, "whitelist": self.whitelist}
+
+    @property
+    def version(self):
+        if self._version is None:
             try:
-                draw.text((pts[0][0], max(0, pts[0][1]-18)), txt[:30], fill=(0,255,0), font=font)
+                out = subprocess.run([self.cmd, "--version"], capture_output=True, timeout=10)
+                self._version = (out.stdout or out.stderr).decode("utf-8", "replace").splitlines()[0].strip()
             except Exception:
-                draw.text((pts[0][0], max(0, pts[0][1]-18)), txt[:30], fill=(0,255,0))
-    img.save(out_path)
-    return out_path
+                return ""
+        return self._version
+
+    def _args(self, src):
+        args = [self.cmd, src, "stdout", "-l", self.lang, "--psm", str(self.psm)]
+        if self.oem is not None:
+            args += ["--oem", str(self.oem)]
+        if self.whitelist:
+            args += ["-c", f"tessedit_char_whitelist={self.whitelist}"]
+        return args + ["tsv"]
+
+    def run(self, image, timeout=None):
+        """
+        image: file path, encoded image bytes, NumPy array (RGB or gray) or PIL image.
+        timeout: seconds for this call (default: the engine's); the process is killed past it.
+        Raises RuntimeError if tesseract is missing or fails, subprocess.TimeoutExpired on timeout.
+        """
+        if not self.cmd:
+            raise RuntimeError("tesseract binary not found")
+        t0 = time.perf_counter()
+        if isinstance(image, (str, os.PathLike)):
+            src, data = os.fspath(image), None
+        elif isinstance(image, (bytes, bytearray, memoryview)):
+            src, data = "stdin", bytes(image)
+        else:
+            if hasattr(image, "mode") and image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")  # PIL palette/alpha/CMYK modes
+            src, data = "stdin", _to_pnm(image)
+        proc = subprocess.run(self._args(src), input=data, capture_output=True,
+                              timeout=self.timeout if timeout is None else timeout)
+        if proc.returncode != 0:
+            raise RuntimeError("tesseract failed: " + proc.stderr.decode("utf-8", "replace").strip())
+        res = parse_tsv(proc.stdout.decode("utf-8", "replace"))
+        res.elapsed_ms = self.last_elapsed_ms = (time.perf_counter() - t0) * 1000
+        return res
+
+_ENGINES = {}
+_ENGINES_LOCK = threading.Lock()
+
+def get_engine(**options):
+    key = tuple(sorted(options.items()))
+    with _ENGINES_LOCK:
+        eng = _ENGINES.get(key)
+        if eng is None:
+            eng = _ENGINES[key] = TesseractEngine(**options)
+    return eng
+
+def cache_key(image_bytes, **options):
+    eng = get_engine(**options)
+    return make_key(image_bytes, "tesseract", eng.version if eng.available else "", eng.options)
+
+def tesseract_ocr(image_path, cache=None, timeout=None, **options):
+    """OcrResult from a shared TesseractEngine (options: psm, oem, lang, whitelist); timeout in seconds."""
+    eng = get_engine(**options)
+    if not eng.available:
+        print("tesseract_ocr: tesseract binary not available in environment.")
+        metrics.incr("ocr_unavailable", engine="tesseract")
+        return OcrResult.empty()
+
+    cache = get_default_cache() if cache is None else cache
+    key = None
+    if cache:
+        try:
+            key = cache_key(key_bytes(image_path), **options)
+        except Exception as e:
+            print("tesseract_ocr: cache lookup skipped:", e)
+        hit = cache.get(key) if key else None
+        if hit is not None:
+            metrics.incr("ocr_cache_hits", engine="tesseract")
+            return OcrResult.from_dicts(hit)
+
+    try:
+        with metrics.timer("ocr.tesseract"):
+            results = eng.run(image_path, timeout).to_result()
+    except Exception as e:
+        print("tesseract_ocr: tesseract run failed:", e)
+        metrics.incr("ocr_errors", engine="tesseract", reason=type(e).__name__)
+        return OcrResult.empty()
+    if key:
+        cache.put(key, results)
+    return results
+
+def draw_boxes(image_path, ocr_list, out_path="tess_boxes.png", result=None, max_side=None):
+    """Every box labelled with its text; see src/ocr/annotate.py (result colours suspicious words red)."""
+    from src.ocr.annotate import annotate
+    return annotate(image_path, ocr_list, result, max_side=max_side, out_path=out_path, labels="all")
 
 if __name__ == "__main__":
-    import sys
     if len(sys.argv) < 2:
-        print("Usage: python tesseract_ocr.py <image_path>")
+        print("Usage: python src/ocr/tesseract_ocr.py <image_path>")
         sys.exit(0)
     imgp = sys.argv[1]
     res = tesseract_ocr(imgp)
-    print(json.dumps(res[:30], indent=2, ensure_ascii=False))
+    print(json.dumps(res[:30].to_dicts(), indent=2, ensure_ascii=False))
@@ -0,0 +1,256 @@
+"""
+Asyncio HTTP scoring service (stdlib only), for upstream systems and the Streamlit app.
+
+Usage:
+    python -m src.service.server --host 0.0.0.0 --port 8080 [--workers N] [--max-queue M] [--record-ocr]
+
+Endpoints:
+- POST /v1/score/image   body: raw image bytes (PNG/JPG). Returns the predict() result;
+                         with ?include_ocr=1 returns {"result", "ocr", "engine"} instead.
+- POST /v1/score/ocr     body: JSON OCR list (or {"ocr": [...]}). Returns the predict() result.
+- GET  /healthz          process is up
+- GET  /readyz           503 until every OCR worker has loaded its engines, then 200
+- GET  /metrics          stage latency histograms and counters in Prometheus text format
+                         (?format=json for the JSON snapshot)
+
+?timings=1 on either score endpoint adds per-stage timings in ms (prepare, ocr.*, extract.*,
+predict.*) to the result under "timings". Stage timings measured in the OCR workers are sent
+back with each result and folded into this process's /metrics.
+
+Both score endpoints check each slip against earlier ones (same account under another name,
+same image with other amounts) in the fraud index (src/forgery/fraud_index.py). Only image
+requests, whose OCR this service ran itself, are recorded in it: OCR posted to /v1/score/ocr
+is unverified and is only looked up, unless the service runs with --record-ocr.
+Image requests that nearly duplicate an earlier submission only re-OCR the changed tiles and
+report them as evidence (src/forgery/resubmission.py).
+
+Image requests run OCR in a process pool of `workers` processes (each with warm engines);
+OCR requests are scored in a thread pool of the same size. At most `workers + max_queue`
+requests of each kind are admitted at a time; beyond that the service answers 429 with
+Retry-After so callers back off instead of piling up.
+"""
+import os, sys, json, asyncio, argparse, multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+from src.common import metrics
+
+MAX_BODY = 25 << 20
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           411: "Length Required", 413: "Payload Too Large", 429: "Too Many Requests",
+           500: "Internal Server Error", 503: "Service Unavailable"}
+
+# seconds a warmed worker waits at the start-up barrier for the slowest one
+READY_TIMEOUT = 600
+
+_policy = "first"
+_barrier = None
+
+def _init_worker(policy, barrier=None):
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+    global _policy, _barrier
+    _policy, _barrier = policy, barrier
+    from src.ocr.ocr_infer import warm_up
+    warm_up()
+
+def _ping():
+    # blocks until every worker has warmed up, so each of the `workers` pings lands on its own process
+    if _barrier is not None:
+        _barrier.wait(READY_TIMEOUT)
+    return os.getpid()
+
+def _score_image(data, include_ocr, timings=False):
+    """Runs in a worker process. Returns (payload, metrics.Collector) so the parent can record stages."""
+    from src.ocr.preprocess import prepare
+    from src.ocr.orchestrator import run_ocr
+    from src.forgery.forgery_detector import predict
+    from src.forgery.resubmission import ocr_prepared, apply_evidence
+    from src.forgery.fraud_index import get_default_index, image_hash
+    from src.ocr.ocr_result import as_dicts
+    with metrics.collect() as c:
+        with metrics.timer("prepare"):
+            prepared = prepare(data)
+        ocr, engine, match = ocr_prepared(prepared, lambda img: run_ocr(img, policy=_policy))
+        res = apply_evidence(predict(ocr, history=get_default_index(), image_hash=image_hash(data, _policy)), match)
+    if timings:
+        res["timings"] = c.timings()
+    if include_ocr:
+        return {"result": res, "ocr": as_dicts(ocr), "engine": engine}, c
+    return res, c
+
+def _score_ocr(body, timings=False, record=False):
+    from src.forgery.forgery_detector import predict
+    from src.forgery.fraud_index import get_default_index
+    ocr = json.loads(body or b"[]")
+    if isinstance(ocr, dict):
+        ocr = ocr.get("ocr") or []
+    if not isinstance(ocr, list):
+        raise ValueError("expected a JSON list of OCR items or {\"ocr\": [...]}")
+    return predict(ocr, timings=timings, history=get_default_index(), record=record)
+
+def _flag(query, name):
+    return query.get(name, ["0"])[0] not in ("0", "false", "")
+
+class ScoringService:
+    def __init__(self, workers=None, max_queue=16, policy="first", record_ocr=False):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.policy = policy
+        self.record_ocr = record_ocr
+        self.inflight = 0
+        self.ocr_inflight = 0
+        self.ready = False
+        self.pool = None
+        self.ocr_pool = ThreadPoolExecutor(self.workers, thread_name_prefix="score-ocr")
+
+    @property
+    def capacity(self):
+        return self.workers + self.max_queue
+
+    async def start(self):
+        barrier = multiprocessing.Barrier(self.workers)
+        self.pool = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(self.policy, barrier))
+        loop = asyncio.get_running_loop()
+        # a blocked worker can't take a second ping, so the pool starts all `workers` processes
+        # and we only report ready once every one of them has loaded its engines
+        pids = await asyncio.gather(*[loop.run_in_executor(self.pool, _ping) for _ in range(self.workers)])
+        if len(set(pids)) != self.workers:
+            raise RuntimeError(f"only {len(set(pids))} of {self.workers} OCR workers started")
+        self.ready = True
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+        self.ocr_pool.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _busy():
+        metrics.incr("service_rejected", reason="busy")
+        return 429, {"error": "busy, retry later"}, {"Retry-After": "1"}
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        path, query = url.path.rstrip("/") or "/", parse_qs(url.query)
+        if path == "/healthz":
+            return 200, {"status": "ok"}, {}
+        if path == "/readyz":
+            return (200, {"status": "ready"}, {}) if self.ready else (503, {"status": "starting"}, {})
+        if path == "/metrics":
+            if query.get("format", [""])[0] == "json":
+                return 200, metrics.snapshot(), {}
+            return 200, metrics.prometheus_text(), {}
+        if path not in ("/v1/score/image", "/v1/score/ocr"):
+            return 404, {"error": "not found"}, {}
+        if method != "POST":
+            return 405, {"error": "use POST"}, {"Allow": "POST"}
+        loop = asyncio.get_running_loop()
+        timings = _flag(query, "timings")
+        if path == "/v1/score/ocr":
+            if self.ocr_inflight >= self.capacity:
+                return self._busy()
+            self.ocr_inflight += 1
+            try:
+                return 200, await loop.run_in_executor(self.ocr_pool, _score_ocr, body, timings, self.record_ocr), {}
+            finally:
+                self.ocr_inflight -= 1
+        if not body:
+            return 400, {"error": "empty image body"}, {}
+        if not self.ready:
+            return 503, {"error": "OCR workers still starting"}, {"Retry-After": "1"}
+        if self.inflight >= self.capacity:
+            return self._busy()
+        self.inflight += 1
+        try:
+            res, collected = await loop.run_in_executor(self.pool, _score_image, body, _flag(query, "include_ocr"), timings)
+        finally:
+            self.inflight -= 1
+        metrics.record(collected)
+        return 200, res, {}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    method, target, version = line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "bad request line"}, {}, False)
+                    break
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    k, _, v = h.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                keep = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                if "transfer-encoding" in headers:
+                    await self._respond(writer, 411, {"error": "send Content-Length"}, {}, False)
+                    break
+                try:
+                    n = int(headers.get("content-length") or 0)
+                except ValueError:
+                    n = -1
+                if n < 0:
+                    await self._respond(writer, 400, {"error": "bad Content-Length"}, {}, False)
+                    break
+                if n > MAX_BODY:
+                    await self._respond(writer, 413, {"error": f"body over {MAX_BODY} bytes"}, {}, False)
+                    break
+                body = await reader.readexactly(n) if n else b""
+                try:
+                    status, payload, extra = await self.dispatch(method.upper(), target, body)
+                except ValueError as e:
+                    status, payload, extra = 400, {"error": str(e)}, {}
+                except Exception as e:
+                    print("service: request failed:", repr(e))
+                    status, payload, extra = 500, {"error": repr(e)}, {}
+                await self._respond(writer, status, payload, extra, keep)
+                if not keep:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, payload, extra, keep):
+        if isinstance(payload, str):
+            body, ctype = payload.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body, ctype = json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json"
+        head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}", "Content-Type: " + ctype,
+                f"Content-Length: {len(body)}", "Connection: " + ("keep-alive" if keep else "close")]
+        head += [f"{k}: {v}" for k, v in extra.items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+async def serve(host="127.0.0.1", port=8080, workers=None, max_queue=16, policy="first", record_ocr=False):
+    svc = ScoringService(workers, max_queue, policy, record_ocr)
+    server = await asyncio.start_server(svc.handle, host, port)
+    print(f"scoring service on http://{host}:{port} ({svc.workers} OCR workers, queue {max_queue})", file=sys.stderr)
+    try:
+        async with server:
+            await svc.start()
+            await server.serve_forever()
+    finally:
+        svc.close()
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="HTTP scoring service for LegalDoc Guardian.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8080)
+    ap.add_argument("--workers", type=int, default=None, help="OCR worker processes (default: CPU count)")
+    ap.add_argument("--max-queue", type=int, default=16, help="image requests allowed to wait for a worker")
+    ap.add_argument("--policy", default="first", choices=("first", "best_conf", "merge", "fallback"))
+    ap.add_argument("--record-ocr", action="store_true",
+                    help="also record slips posted to /v1/score/ocr in the fraud index (trusted callers only)")
+    args = ap.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.max_queue, args.policy, args.record_ocr))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,61 @@
 # src/webapp/app.py
-import sys, os, json
+import sys, os, json, hashlib
 sys.path.append(os.path.abspath("."))
 
 import streamlit as st
-from PIL import Image
+from src.common.lazy import available
 
-# Try to import OCR/detector lazily; if import fails, run in DEMO_MODE.
+# The pipeline modules import cheaply: numpy, joblib/sklearn, OpenCV and paddleocr load on first
+# use (src/common/lazy.py). Without the core ones installed, run in DEMO_MODE.
 DEMO_MODE = False
-ocr_image = None
-tesseract_ocr = None
+OCR_POLICY = os.environ.get("LEGALDOC_OCR_POLICY", "first")
+# when set, uploads are scored by the HTTP service (src/service/server.py) instead of in this process
+SERVICE_URL = os.environ.get("LEGALDOC_SERVICE_URL", "").rstrip("/")
+# optional enhancement steps for prepare(), e.g. LEGALDOC_PREPROCESS=deskew,contrast
+PREPROCESS = {k: True for k in os.environ.get("LEGALDOC_PREPROCESS", "").split(",")
+              if k in ("deskew", "denoise", "contrast", "threshold")}
+run_ocr = None
 predict = None
-draw_boxes_fn = None
-extract_fields_from_ocr = None
+annotate = None
+# annotated images are drawn at twice the displayed width (sharp on HiDPI screens)
+ANNOTATE_SIDE = 1400
 
 try:
-    # Import local wrappers if available
-    from src.ocr.ocr_infer import ocr_image, draw_boxes as draw_boxes_paddle
-    from src.ocr.tesseract_ocr import tesseract_ocr
-    from src.forgery.forgery_detector import predict, extract_fields_from_ocr
-    draw_boxes_fn = draw_boxes_paddle
+    missing = [m for m in ("numpy", "joblib") if not available(m)]
+    if missing:
+        raise ImportError(f"missing {missing}")
+    from src.ocr.ocr_infer import warm_up as warm_up_paddle
+    from src.ocr.annotate import annotate
+    from src.ocr.preprocess import decode_image, prepare
+    from src.ocr.orchestrator import run_ocr
+    from src.ocr.tesseract_ocr import get_engine as get_tesseract_engine
+    from src.forgery.forgery_detector import predict, MODEL_PATH
+    from src.forgery.model_registry import get_registry
+    from src.forgery.resubmission import ocr_prepared, apply_evidence
+    from src.forgery.fraud_index import get_default_index, image_hash
+    from src.ingest.documents import analyze_document, iter_pages, sniff
 except Exception as e:
     DEMO_MODE = True
     print("DEMO_MODE ON - heavy OCR modules not available:", repr(e))
 
+@st.cache_resource(show_spinner="Loading OCR engines...")
+def load_engines():
+    # PaddleOCR models + the Tesseract runner, once per server process
+    return {"paddle": warm_up_paddle(), "tesseract": get_tesseract_engine().available}
+
+@st.cache_resource(show_spinner=False)
+def load_classifier():
+    # the registry keeps the model in memory and hot-reloads it when the file changes
+    registry = get_registry(MODEL_PATH)
+    registry.get()
+    return registry
+
+def model_digest():
+    """Digest of the classifier in use, after picking up a hot reload; part of the result cache keys."""
+    registry = load_classifier()
+    registry.get()
+    return registry.digest
+
 st.set_page_config(page_title="LegalDoc Guardian", layout="wide")
 st.title("LegalDoc Guardian — Demo (Cloud-friendly)")
 
@@ -31,19 +64,30 @@ st.markdown(
     "For full OCR run locally with PaddleOCR/Tesseract installed."
 )
 
-uploaded = st.file_uploader("Upload an image (png/jpg) of a document page", type=["png","jpg","jpeg"])
+uploaded = st.file_uploader("Upload an image (png/jpg) or a multi-page PDF/TIFF", type=["png","jpg","jpeg","pdf","tif","tiff"])
 
-# helper to load demo assets from repo
+if not DEMO_MODE:
+    # load models once per process so the first upload doesn't pay the cold start; done after
+    # the page is drawn, so the header and uploader show while the engines load
+    load_engines()
+    load_classifier()
+
+def _read(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
+# helper to load demo assets from repo (JSON and image bytes, cached per process)
+@st.cache_data(show_spinner=False)
 def load_demo(name):
     base = os.path.join("data", "demo")
     jpath = os.path.join(base, f"{name}.json")
-    box_img = os.path.join(base, f"{name}_boxes.png")
-    orig = os.path.join(base, f"{name}.png")
     det = {}
     if os.path.exists(jpath):
         with open(jpath, "r", encoding="utf-8") as f:
             det = json.load(f)
-    return det, box_img if os.path.exists(box_img) else None, orig if os.path.exists(orig) else None
+    return det, _read(os.path.join(base, f"{name}_boxes.png")), _read(os.path.join(base, f"{name}.png"))
 
 if not uploaded:
     st.info("You can upload an image, or preview demo examples below.")
@@ -70,37 +114,116 @@ if not uploaded:
     else:
         st.stop()
 
+def score_remote(image_bytes):
+    """POST the upload to the scoring service; returns {"result", "ocr", "engine"}."""
+    import urllib.request
+    req = urllib.request.Request(SERVICE_URL + "/v1/score/image?include_ocr=1", data=image_bytes,
+                                 headers={"Content-Type": "application/octet-stream"})
+    with urllib.request.urlopen(req, timeout=120) as r:
+        return json.loads(r.read().decode("utf-8"))
+
+# Per-upload results are memoized by file hash (leading-underscore args are not hashed by
+# Streamlit), so widget reruns on the same upload don't redo OCR, detection or drawing.
+# Local results are also keyed by the model digest, so a hot-reloaded model rescores them.
+@st.cache_data(max_entries=64, show_spinner="Scoring via service...")
+def analyze_remote(file_hash, _image_bytes):
+    remote = score_remote(_image_bytes)
+    remote["annotated"] = None
+    if annotate:
+        try:
+            remote["annotated"] = annotate(_image_bytes, remote.get("ocr") or [], remote.get("result"),
+                                           max_side=ANNOTATE_SIDE).getvalue()
+        except Exception as e:
+            remote["annotated_error"] = str(e)
+    return remote
+
+@st.cache_data(max_entries=64, show_spinner="Running OCR pipeline...")
+def analyze_upload(file_hash, _image_bytes, policy, preprocess, model):
+    out = {"engine": None, "ocr_error": None, "annotated": None}
+    # OCR runs on the (possibly downscaled) prepared buffer, boxes map back to the original
+    prepared = prepare(decode_image(_image_bytes), **dict(preprocess))
+    match = None
+    try:
+        # each engine checks the on-disk OCR cache itself; near-duplicates of an earlier
+        # upload only re-OCR the tiles that changed
+        chosen_ocr, out["engine"], match = ocr_prepared(prepared, lambda img: run_ocr(img, policy=policy))
+    except Exception as e:
+        out["ocr_error"] = str(e)
+        chosen_ocr = []
+    out["ocr"] = chosen_ocr
+    out["result"] = apply_evidence(predict(chosen_ocr, history=get_default_index(),
+                                           image_hash=image_hash(_image_bytes, policy, preprocess=dict(preprocess))), match)
+    if annotate:
+        try:
+            # drawn on the buffer decoded above, red where the evidence points
+            out["annotated"] = annotate(prepared.original, chosen_ocr, out["result"], max_side=ANNOTATE_SIDE).getvalue()
+        except Exception as e:
+            out["annotated_error"] = str(e)
+    return out
+
+@st.cache_data(max_entries=16, show_spinner="Scoring pages...")
+def analyze_pages(file_hash, _doc_bytes, policy, model):
+    # pages are rendered and scored one at a time in this process; only per-page results are kept
+    doc = analyze_document(_doc_bytes, workers=0, policy=policy)
+    index = get_default_index()
+    if index is not None:
+        index.correlate([doc], [image_hash(_doc_bytes, policy)])
+    return doc
+
+def show_annotated(out):
+    if out.get("annotated"):
+        st.image(out["annotated"], width=700, caption="Annotated boxes (red = suspicious)")
+    elif out.get("annotated_error"):
+        st.write("Could not draw boxes:", out["annotated_error"])
+
 # If user uploads file:
 if uploaded:
-    tmp_path = "tmp_upload.png"
-    img = Image.open(uploaded).convert("RGB")
-    img.save(tmp_path)
+    # everything stays in memory for this request: no shared temp files between sessions
+    upload_bytes = uploaded.getvalue()
+    file_hash = hashlib.sha256(upload_bytes).hexdigest()
+    kind = "image" if DEMO_MODE else sniff(upload_bytes)
     st.subheader("Preview")
-    st.image(tmp_path, width=600)
+    if kind == "image":
+        st.image(upload_bytes, width=600)
+    else:
+        try:
+            st.image(next(iter(iter_pages(upload_bytes, dpi=72, text_layer=False))).image, width=600, caption="Page 1")
+        except Exception as e:
+            st.write("Could not render a preview:", str(e))
 
-    if not DEMO_MODE:
-        st.info("Running OCR pipeline...")
+    if kind != "image":
+        # multi-page documents are scored page by page locally (the service takes single images)
         try:
-            paddle_output = ocr_image(tmp_path)
+            doc = analyze_pages(file_hash, upload_bytes, OCR_POLICY, model_digest())
         except Exception as e:
-            st.warning("PaddleOCR error: " + str(e))
-            paddle_output = []
-        chosen_ocr = paddle_output
-        if (not chosen_ocr or all((r.get("text","").strip()=="") for r in chosen_ocr)) and tesseract_ocr:
-            st.info("PaddleOCR returned no text → running Tesseract fallback")
-            chosen_ocr = tesseract_ocr(tmp_path)
-        # run detector
-        res = predict(chosen_ocr)
-        st.subheader("Forgery Analysis")
-        st.json(res)
-        # annotated boxes
+            # e.g. a PDF without PyMuPDF installed
+            st.write("Could not analyze the document:", str(e))
+            st.stop()
+        st.subheader(f"Forgery Analysis ({doc['page_count']} pages)")
+        st.json({k: doc[k] for k in ("label", "score", "fields", "evidence", "flagged_pages")})
+        for page in doc["pages"]:
+            with st.expander(f"Page {page['page']}: {page.get('label') or 'error'}"):
+                st.json(page)
+    elif SERVICE_URL:
+        st.info("Scoring via service " + SERVICE_URL)
         try:
-            if draw_boxes_fn:
-                outimg = "tmp_boxes_highlight.png"
-                draw_boxes_fn(tmp_path, chosen_ocr, out_path=outimg)
-                st.image(outimg, width=700)
+            remote = analyze_remote(file_hash, upload_bytes)
         except Exception as e:
-            st.write("Could not draw boxes:", e)
+            st.error("Scoring service error: " + str(e))
+            st.stop()
+        st.caption(f"OCR engine: {remote.get('engine') or 'none'}")
+        st.subheader("Forgery Analysis")
+        st.json(remote["result"])
+        show_annotated(remote)
+    elif not DEMO_MODE:
+        out = analyze_upload(file_hash, upload_bytes, OCR_POLICY, tuple(sorted(PREPROCESS.items())), model_digest())
+        if out["ocr_error"]:
+            st.warning("OCR error: " + out["ocr_error"])
+        else:
+            st.caption(f"OCR engine: {out['engine'] or 'none'} (policy: {OCR_POLICY})")
+        st.subheader("Forgery Analysis")
+        st.json(out["result"])
+        show_annotated(out)
     else:
         st.info("DEMO mode: showing precomputed demo result")
         det, box_img, orig = load_demo("forged_amount_shift")